@@ -0,0 +1,130 @@
+# batch_plan.py - Command-line entry point for planning many trips without the UI
+import os
+import csv
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dotenv import load_dotenv
+
+from concurrency import RateLimiter
+from planner import build_plan_inputs, build_travel_chain, plan_trip
+
+FIELDS = ["source", "destination", "travel_date", "travelers", "preferences", "budget"]
+
+# Read planning rows from a CSV or JSONL file, one request at a time
+def read_rows(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            rows = (json.loads(line) for line in f if line.strip())
+        else:
+            rows = csv.DictReader(f)
+        for index, row in enumerate(rows):
+            yield normalize_row(row, index)
+
+# Fill defaults and give each row a stable id for checkpointing
+def normalize_row(row, index):
+    return {
+        "row_id": str(row.get("id") or row.get("row_id") or index),
+        "source": (row.get("source") or "").strip(),
+        "destination": (row.get("destination") or "").strip(),
+        "travel_date": str(row.get("travel_date") or row.get("date") or "").strip(),
+        "travelers": str(row.get("travelers") or "1"),
+        "preferences": row.get("preferences") or "",
+        "budget": row.get("budget") or "Moderate"
+    }
+
+# Ids of rows that already finished successfully in a previous run
+def load_checkpoint(path):
+    completed = set()
+    if not os.path.exists(path):
+        return completed
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A crash can leave a partial last line behind
+                continue
+            if record.get("status") == "ok":
+                completed.add(record["row_id"])
+    return completed
+
+# Plan a single row and build its output record
+def plan_row(row, chain, limiter, mode):
+    limiter.acquire()
+    started_at = time.time()
+    record = dict(row)
+    try:
+        if not row["source"] or not row["destination"]:
+            raise ValueError("Missing source or destination")
+        # Tagged as batch requests, so they do not count towards the popular routes to prefetch
+        plan, errors = plan_trip(build_plan_inputs(*(row[field] for field in FIELDS)), chain, mode, channel="batch")
+        # Plans with placeholder sections are kept but retried on the next run
+        if errors:
+            record.update(status="partial", plan=plan, section_errors=errors)
+        else:
+            record.update(status="ok", plan=plan)
+    except Exception as e:
+        record.update(status="error", error=str(e))
+    record["elapsed"] = round(time.time() - started_at, 3)
+    return record
+
+def run_batch(input_path, output_path, concurrency=4, rpm=30, mode=None, restart=False):
+    chain = build_travel_chain()
+
+    if restart and os.path.exists(output_path):
+        os.remove(output_path)
+    completed = load_checkpoint(output_path)
+    limiter = RateLimiter(rpm, per=60.0, burst=concurrency)
+    write_lock = threading.Lock()
+    counts = {"ok": 0, "partial": 0, "error": 0, "skipped": 0}
+
+    with open(output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # Stream each record to disk as soon as it completes so a crash loses at most the in-flight rows
+        def write(record):
+            with write_lock:
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+                os.fsync(out.fileno())
+            counts[record["status"]] += 1
+            print(f"[{record['status']}] {record['row_id']}: {record['source']} -> {record['destination']} "
+                  f"({record['elapsed']}s)", file=sys.stderr)
+
+        pending = set()
+        for row in read_rows(input_path):
+            if row["row_id"] in completed:
+                counts["skipped"] += 1
+                continue
+            # Keep only a bounded number of rows in flight so large inputs are never fully loaded
+            if len(pending) >= concurrency * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    write(future.result())
+            pending.add(executor.submit(plan_row, row, chain, limiter, mode))
+
+        for future in wait(pending).done:
+            write(future.result())
+
+    return counts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate travel plans for every row of a CSV or JSONL file.")
+    parser.add_argument("input", help="CSV or JSONL file with source, destination, travel_date, travelers, preferences, budget")
+    parser.add_argument("-o", "--output", default="plans.jsonl", help="JSONL file to write results to (also the resume checkpoint)")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="Maximum number of plans generated at once")
+    parser.add_argument("--rpm", type=float, default=30, help="Maximum number of plan requests per minute")
+    parser.add_argument("--mode", choices=["single", "parallel"], help="Planning mode (defaults to TRAVEL_PLANNING_MODE)")
+    parser.add_argument("--restart", action="store_true", help="Ignore previous results and start from the first row")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    counts = run_batch(args.input, args.output, args.concurrency, args.rpm, args.mode, args.restart)
+    print(f"Done: {counts['ok']} planned, {counts['partial']} partial, {counts['error']} failed, "
+          f"{counts['skipped']} already completed", file=sys.stderr)
+    return 0 if counts["error"] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
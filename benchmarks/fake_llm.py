@@ -0,0 +1,203 @@
+# benchmarks/fake_llm.py - Deterministic local stand-in for ChatGoogleGenerativeAI
+#
+# Supports the calls the planner makes (invoke, ainvoke, stream, copy) and answers
+# each kind of prompt (full plan, transport/destination/recommendation sections,
+# currency) with canned JSON. Latency, streaming speed, malformed output and error
+# rates are configurable, and all randomness comes from a seeded generator.
+import re
+import json
+import math
+import time
+import random
+import asyncio
+import threading
+
+# Named like the google.api_core error so the resilience layer treats it as retryable
+class ServiceUnavailable(Exception):
+    pass
+
+class FakeMessage:
+    def __init__(self, content, usage_metadata=None):
+        self.content = content
+        self.usage_metadata = usage_metadata
+        self.response_metadata = {}
+
+# Settings shared by every client the fake factory creates
+class FakeLLMConfig:
+    def __init__(self, latency=0.5, latency_sigma=0.4, tokens_per_second=200.0, chunk_tokens=20,
+                 malformed_rate=0.0, error_rate=0.0, time_scale=1.0, seed=42):
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.chunk_tokens = chunk_tokens
+        self.malformed_rate = malformed_rate
+        self.error_rate = error_rate
+        self.time_scale = time_scale
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.malformed = 0
+
+    # Draw (latency before the first token, whether to fail, how to corrupt the output)
+    def draw(self):
+        with self.lock:
+            self.calls += 1
+            latency = self.latency * math.exp(self.latency_sigma * self.random.gauss(0, 1))
+            fail = self.random.random() < self.error_rate
+            corruption = None
+            if not fail and self.random.random() < self.malformed_rate:
+                corruption = self.random.choice(MALFORMATIONS)
+            self.errors += fail
+            self.malformed += corruption is not None
+            return latency * self.time_scale, fail, corruption
+
+    def stats(self):
+        with self.lock:
+            return {"calls": self.calls, "errors": self.errors, "malformed": self.malformed}
+
+def _field(prompt, name, default):
+    match = re.search(rf"{name}:\s*(.+)", prompt)
+    return match.group(1).strip() if match else default
+
+def _options(kind, count, base, rng):
+    return [
+        {"name": f"{kind.title()} operator {i + 1}", "departure": f"{6 + 3 * i:02d}:00", "arrival": f"{12 + 3 * i:02d}:30",
+         "duration": f"{4 + i} hours", "cost": f"${base + 40 * i}-${base + 40 * i + rng.randint(20, 200)}",
+         "notes": "Refundable fare" if i % 2 else "Includes one checked bag"}
+        for i in range(count)
+    ]
+
+def _destination_info(destination):
+    return {
+        "weather": f"Mild and sunny in {destination}, highs around 22°C.",
+        "attractions": [f"{destination} old town", f"{destination} museum", f"{destination} harbour"],
+        "accommodations": [
+            {"name": "Central Hotel", "type": "hotel", "cost_per_night": "$140", "location": "Downtown"},
+            {"name": "Backpackers Inn", "type": "hostel", "cost_per_night": "$35", "location": "Old town"}
+        ],
+        "local_transport": ["Metro", "City buses", "Ride-hailing apps"]
+    }
+
+TRANSPORT_BASES = {"flights": 250, "trains": 90, "buses": 40, "cabs": 600}
+
+# Canned JSON answer for a prompt, shaped like the real model output
+def canned_response(prompt, rng):
+    destination = _field(prompt, "Destination", "the destination")
+    if "exchange rate" in prompt:
+        return json.dumps({"local_currency": "Euro (EUR)", "exchange_rate": "1 USD = 0.92 EUR"})
+    if "on each of these dates" in prompt:
+        dates = re.findall(r"^\d{4}-\d{2}-\d{2}$", prompt, re.MULTILINE)
+        modes = [mode for mode in TRANSPORT_BASES if f'"{mode}"' in prompt]
+        return json.dumps({
+            day: {mode: f"${TRANSPORT_BASES[mode] + rng.randint(-20, 60)}-${TRANSPORT_BASES[mode] + rng.randint(80, 200)}"
+                  for mode in modes}
+            for day in dates
+        }, indent=2)
+    if "JSON array" in prompt and "accommodation options" in prompt:
+        return json.dumps(_destination_info(destination)["accommodations"], indent=2)
+    if "JSON array" in prompt:
+        mode = next((m for m, label in (("flights", "flight"), ("trains", "train"), ("buses", "bus"), ("cabs", "cab"))
+                     if f"available {label}" in prompt), "flights")
+        return json.dumps(_options(mode, 3, TRANSPORT_BASES[mode], rng), indent=2)
+    if "available travel options" in prompt:
+        return json.dumps({"recommendation": "Take the morning train for the best balance of price and time.",
+                           "estimated_total_cost": "$600-$900"})
+    if '"travel_options"' in prompt:
+        modes = [mode for mode in TRANSPORT_BASES if f'"{mode}"' in prompt]
+        plan = {
+            "travel_options": {mode: _options(mode, 3, TRANSPORT_BASES[mode], rng) for mode in modes},
+            "destination_info": _destination_info(destination),
+            "recommendation": "Fly in the morning; it is the fastest option and fares are lowest.",
+            "estimated_total_cost": "$800-$1,400"
+        }
+        return json.dumps(plan, indent=2)
+    return json.dumps(_destination_info(destination), indent=2)
+
+# Ways real model output goes wrong, as handled by json_extract
+MALFORMATIONS = ["truncated", "fenced", "trailing_comma", "smart_quotes", "prose"]
+
+def corrupt(text, kind, rng):
+    if kind == "truncated":
+        return text[:int(len(text) * rng.uniform(0.4, 0.9))]
+    if kind == "fenced":
+        return f"Here is your plan:\n```json\n{text}\n```"
+    if kind == "trailing_comma":
+        return re.sub(r"(\]|\})(\s*)(\]|\})", r"\1,\2\3", text, count=1)
+    if kind == "smart_quotes":
+        return text.replace('"name"', "“name”")
+    return "I'm sorry, I can't help with that request right now."
+
+def _estimate(text):
+    return (len(text) + 3) // 4
+
+# Duck-typed chat model with the methods the planner uses
+class FakeChatModel:
+    def __init__(self, config, max_output_tokens=2048, **settings):
+        self.config = config
+        self.max_output_tokens = max_output_tokens
+        self.settings = settings
+
+    # Only the pydantic v1 .copy(update=...) of the pinned langchain-google-genai client,
+    # so the harness fails the same way production does if model_copy is assumed
+    def copy(self, update=None):
+        settings = dict(self.settings, max_output_tokens=self.max_output_tokens)
+        settings.update(update or {})
+        return FakeChatModel(self.config, **settings)
+
+    def _answer(self, prompt):
+        latency, fail, corruption = self.config.draw()
+        with self.config.lock:
+            text = canned_response(str(prompt), self.config.random)
+            if corruption:
+                text = corrupt(text, corruption, self.config.random)
+        # Respect the output budget the way the real model does: by cutting the text off
+        text = text[:self.max_output_tokens * 4]
+        generation = _estimate(text) / self.config.tokens_per_second * self.config.time_scale
+        usage = {"input_tokens": _estimate(str(prompt)), "output_tokens": _estimate(text)}
+        return latency, generation, fail, text, usage
+
+    def invoke(self, prompt, **kwargs):
+        latency, generation, fail, text, usage = self._answer(prompt)
+        time.sleep(latency + generation)
+        if fail:
+            raise ServiceUnavailable("503 The model is overloaded. Please try again later.")
+        return FakeMessage(text, usage)
+
+    async def ainvoke(self, prompt, **kwargs):
+        latency, generation, fail, text, usage = self._answer(prompt)
+        await asyncio.sleep(latency + generation)
+        if fail:
+            raise ServiceUnavailable("503 The model is overloaded. Please try again later.")
+        return FakeMessage(text, usage)
+
+    def stream(self, prompt, **kwargs):
+        latency, generation, fail, text, usage = self._answer(prompt)
+        time.sleep(latency)
+        if fail:
+            raise ServiceUnavailable("503 The model is overloaded. Please try again later.")
+        size = self.config.chunk_tokens * 4
+        chunks = [text[i:i + size] for i in range(0, len(text), size)] or [""]
+        for index, chunk in enumerate(chunks):
+            time.sleep(generation / len(chunks))
+            # Usage arrives with the last chunk, as deltas that add up to the total
+            yield FakeMessage(chunk, usage if index == len(chunks) - 1 else None)
+
+# Client factory for llm_clients.LLMClientRegistry.set_factory
+def fake_client_factory(config):
+    def factory(settings, api_key):
+        return FakeChatModel(config, **settings)
+    return factory
+
+# Minimal stand-in for the LangChain chain: the planner only uses .llm and .prompt.format
+class FakePrompt:
+    def __init__(self, template):
+        self.template = template
+
+    def format(self, **inputs):
+        return self.template.format(**inputs)
+
+class FakeChain:
+    def __init__(self, llm, template):
+        self.llm = llm
+        self.prompt = FakePrompt(template)
@@ -0,0 +1,71 @@
+# benchmarks/import_time.py - Guard the import cost of the planning core
+#
+# Usage: python benchmarks/import_time.py [--budget-ms 50] [--runs 5]
+#
+# Imports each module in a fresh interpreter, reports the median wall time and
+# fails if the planning core pulls in UI or model dependencies or exceeds the budget.
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must stay out of the import graph of each entry point
+FORBIDDEN = {
+    "planner": ["streamlit", "langchain", "langchain_google_genai", "pandas", "plotly"],
+    "batch_plan": ["streamlit", "langchain", "langchain_google_genai", "pandas", "plotly"]
+}
+
+PROBE = """
+import sys, time, json
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"elapsed": elapsed, "modules": sorted(sys.modules)}}))
+"""
+
+# Import a module in a fresh interpreter and return (seconds, loaded module names)
+def measure(module):
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module)],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    data = json.loads(result.stdout.strip().splitlines()[-1])
+    return data["elapsed"], set(data["modules"])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure and guard the import time of the planning core.")
+    parser.add_argument("--budget-ms", type=float, default=50.0, help="Maximum median import time for the core")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    failures = []
+    for module, forbidden in FORBIDDEN.items():
+        timings = []
+        try:
+            for _ in range(args.runs):
+                elapsed, loaded = measure(module)
+                timings.append(elapsed * 1000)
+        except RuntimeError as e:
+            failures.append(f"{module} failed to import: {e}")
+            continue
+        median = statistics.median(timings)
+        leaked = sorted(name for name in forbidden if name in loaded)
+        print(f"{module:<12} median {median:7.1f} ms  (min {min(timings):.1f}, max {max(timings):.1f})")
+
+        if leaked:
+            failures.append(f"{module} imports {', '.join(leaked)}")
+        if median > args.budget_ms:
+            failures.append(f"{module} took {median:.1f} ms (budget {args.budget_ms:.0f} ms)")
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
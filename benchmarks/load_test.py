@@ -0,0 +1,263 @@
+# benchmarks/load_test.py - Load test planning and trip history against a fake LLM
+#
+# Usage: python benchmarks/load_test.py [--sessions 8] [--requests 25] [--trips 10000]
+#                                      [--latency 0.5] [--error-rate 0.02] [--malformed-rate 0.05]
+#                                      [--time-scale 0.1] [--stream] [--mode single|parallel]
+#                                      [--store sqlite|memory] [--json]
+#
+# Runs N concurrent simulated sessions through the planning engine (the path behind
+# llm_service) with ChatGoogleGenerativeAI replaced by benchmarks/fake_llm.py, then
+# seeds a trip store (the backend behind storage) with a large history and times the
+# history queries. Reports throughput, latency percentiles, cache hit rates and memory.
+# Nothing is sent to Google and results are reproducible for a given --seed.
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from fake_llm import FakeChain, FakeLLMConfig, fake_client_factory
+from memory_report import synthetic_trips
+
+CITIES = [
+    "New York", "Los Angeles", "Chicago", "London", "Paris", "Tokyo", "Delhi", "Mumbai",
+    "Sydney", "Berlin", "Rome", "Madrid", "Dubai", "Singapore", "Toronto", "San Francisco"
+]
+PREFERENCES = ["Fastest", "Cheapest", "Fastest, Direct routes", "Eco-friendly", "Luxury"]
+
+def percentiles(values):
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    ordered = sorted(values)
+    pick = lambda pct: ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+    return {"p50": pick(50), "p95": pick(95), "p99": pick(99), "max": ordered[-1]}
+
+# Popular routes are requested far more often than others (Zipf-like), like real traffic
+def make_routes(count, rng):
+    routes = [(a, b) for a in CITIES for b in CITIES if a != b]
+    rng.shuffle(routes)
+    routes = routes[:count]
+    weights = [1 / (rank + 1) for rank in range(len(routes))]
+    return routes, weights
+
+def run_planning(args, work_dir):
+    import planner
+    from cache import get_response_cache
+    from llm_clients import get_client_registry
+    from resilience import get_resilience_stats
+    from scheduler import get_scheduler, session_scope
+
+    config = FakeLLMConfig(
+        latency=args.latency, latency_sigma=args.latency_sigma, tokens_per_second=args.tokens_per_second,
+        malformed_rate=args.malformed_rate, error_rate=args.error_rate, time_scale=args.time_scale, seed=args.seed
+    )
+    get_client_registry().set_factory(fake_client_factory(config))
+    chain = FakeChain(planner.get_llm("planning"), planner.TRAVEL_PROMPT)
+
+    rng = random.Random(args.seed)
+    routes, weights = make_routes(args.routes, rng)
+    results = []
+    results_lock = threading.Lock()
+
+    def session(index):
+        with session_scope(f"load-{index}"):
+            run_session(index)
+
+    def run_session(index):
+        session_rng = random.Random(args.seed * 1000 + index)
+        for _ in range(args.requests):
+            source, destination = session_rng.choices(routes, weights)[0]
+            inputs = planner.build_plan_inputs(
+                source, destination, f"2026-12-{session_rng.randint(1, 3):02d}", "2",
+                session_rng.choice(PREFERENCES), "Moderate"
+            )
+            started = time.perf_counter()
+            first_section = None
+            status = "ok"
+            try:
+                if args.stream:
+                    errors = {}
+                    for path, value in planner.stream_plan(inputs, chain, args.mode):
+                        if first_section is None:
+                            first_section = time.perf_counter() - started
+                        if path == ("section_errors",):
+                            errors = value
+                else:
+                    _, errors = planner.plan_trip(inputs, chain, args.mode)
+                if errors:
+                    status = "partial"
+                planner.get_currency_info(destination)
+            except Exception as e:
+                status = type(e).__name__
+            with results_lock:
+                results.append({"latency": time.perf_counter() - started, "first_section": first_section, "status": status})
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as executor:
+        list(executor.map(session, range(args.sessions)))
+    elapsed = time.perf_counter() - started
+
+    statuses = {}
+    for result in results:
+        statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+    first_sections = [r["first_section"] for r in results if r["first_section"] is not None]
+    return {
+        "requests": len(results),
+        "elapsed": elapsed,
+        "throughput": len(results) / elapsed if elapsed else 0.0,
+        "latency": percentiles([r["latency"] for r in results]),
+        "first_section": percentiles(first_sections) if first_sections else None,
+        "statuses": statuses,
+        "plan_cache": get_response_cache().stats(),
+        "coalescing": planner._plan_flights.stats(),
+        "fake_llm": config.stats(),
+        "resilience": get_resilience_stats(),
+        "scheduler": get_scheduler().stats() if get_scheduler() is not None else None
+    }
+
+def run_history(args, work_dir):
+    from trip_store import MemoryTripStore, SQLiteTripStore
+
+    store = SQLiteTripStore(os.path.join(work_dir, "trips.db")) if args.store == "sqlite" else MemoryTripStore()
+    user_id = "benchmark-user"
+    timings = {}
+
+    def timed(name, fn):
+        start = time.perf_counter()
+        result = fn()
+        timings.setdefault(name, []).append(time.perf_counter() - start)
+        return result
+
+    started = time.perf_counter()
+    for trip in synthetic_trips(args.trips):
+        timed("add_trip", lambda: store.add_trip(user_id, trip))
+    seed_elapsed = time.perf_counter() - started
+
+    rng = random.Random(args.seed)
+    destinations = timed("list_destinations", lambda: store.list_destinations(user_id))
+
+    def reader(index):
+        reader_rng = random.Random(args.seed + index)
+        for _ in range(args.history_ops):
+            page = reader_rng.randrange(max(1, args.trips // 20))
+            timed("page", lambda: store.list_trips(user_id, page * 20, 20, include_full_data=False))
+            destination = reader_rng.choice(destinations)
+            timed("filtered_page", lambda: store.list_trips(user_id, 0, 20, destination=destination, include_full_data=False))
+            timed("count", lambda: store.count_trips(user_id, destination=destination))
+            trip_id = reader_rng.randint(1, args.trips)
+            trip = timed("get_trip", lambda: store.get_trip(user_id, trip_id))
+            timed("load_plan", lambda: trip.full_data if trip else None)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as executor:
+        list(executor.map(reader, range(args.sessions)))
+    read_elapsed = time.perf_counter() - started
+    operations = sum(len(values) for name, values in timings.items() if name != "add_trip")
+
+    return {
+        "store": args.store,
+        "trips": args.trips,
+        "seed_elapsed": seed_elapsed,
+        "read_ops": operations,
+        "read_throughput": operations / read_elapsed if read_elapsed else 0.0,
+        "operations": {name: dict(percentiles(values), count=len(values)) for name, values in timings.items()}
+    }
+
+def print_report(report):
+    ms = lambda seconds: f"{seconds * 1000:8.1f}"
+    planning = report.get("planning")
+    if planning:
+        print(f"== planning ({planning['requests']} requests in {planning['elapsed']:.1f}s, "
+              f"{planning['throughput']:.1f} req/s)")
+        print(f"   latency ms        p50 {ms(planning['latency']['p50'])}  p95 {ms(planning['latency']['p95'])}  "
+              f"p99 {ms(planning['latency']['p99'])}  max {ms(planning['latency']['max'])}")
+        if planning["first_section"]:
+            first = planning["first_section"]
+            print(f"   first section ms  p50 {ms(first['p50'])}  p95 {ms(first['p95'])}  p99 {ms(first['p99'])}")
+        print(f"   statuses          {planning['statuses']}")
+        print(f"   plan cache        {planning['plan_cache']['hits']} hits / {planning['plan_cache']['misses']} misses "
+              f"({planning['plan_cache']['hit_rate']:.0%})")
+        print(f"   coalescing        {planning['coalescing']}")
+        print(f"   fake LLM          {planning['fake_llm']}")
+        for purpose, stats in planning["resilience"].items():
+            print(f"   resilience {purpose:<8} retries {stats['retries']}  timeouts {stats['timeouts']}  "
+                  f"failures {stats['failures']}  circuit {stats['circuit']}")
+        if planning["scheduler"]:
+            scheduler = planning["scheduler"]
+            print(f"   scheduler         {scheduler['admitted']} admitted, {scheduler['queued']} queued, "
+                  f"{scheduler['rejected']} rejected, max depth {scheduler['max_depth']}")
+    history = report.get("history")
+    if history:
+        print(f"== history ({history['store']}, {history['trips']} trips seeded in {history['seed_elapsed']:.1f}s, "
+              f"{history['read_throughput']:.0f} reads/s)")
+        for name, stats in history["operations"].items():
+            print(f"   {name:<18} p50 {ms(stats['p50'])}  p95 {ms(stats['p95'])}  p99 {ms(stats['p99'])}  (n={stats['count']})")
+    memory = report["memory"]
+    print(f"== memory          peak traced {memory['traced_peak_mib']:.1f} MiB, max RSS {memory['max_rss_mib']:.1f} MiB")
+
+def max_rss_mib():
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and kilobytes on Linux
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the planner and trip history with a fake LLM.")
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent simulated sessions")
+    parser.add_argument("--requests", type=int, default=25, help="plan requests per session")
+    parser.add_argument("--routes", type=int, default=40, help="distinct routes in the request mix")
+    parser.add_argument("--mode", choices=["single", "parallel"], default="single")
+    parser.add_argument("--stream", action="store_true", help="use the streaming plan path")
+    parser.add_argument("--latency", type=float, default=0.5, help="median seconds before the first token")
+    parser.add_argument("--latency-sigma", type=float, default=0.4, help="log-normal spread of the latency")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--malformed-rate", type=float, default=0.05)
+    parser.add_argument("--time-scale", type=float, default=0.1, help="multiply every simulated delay")
+    parser.add_argument("--trips", type=int, default=10000, help="trips seeded into the history store")
+    parser.add_argument("--history-ops", type=int, default=200, help="history query rounds per session")
+    parser.add_argument("--store", choices=["sqlite", "memory"], default="sqlite")
+    parser.add_argument("--skip-planning", action="store_true")
+    parser.add_argument("--skip-history", action="store_true")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # Keep every cache, ledger and store of this run out of the working tree
+        os.environ["TRAVEL_CACHE_PATH"] = os.path.join(work_dir, "cache.db")
+        os.environ["TOKEN_LEDGER_PATH"] = ""
+        os.environ["TRAVEL_REQUEST_LOG_PATH"] = ""
+        os.environ["TRACE_EXPORT_PATH"] = ""
+        os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+
+        tracemalloc.start()
+        report = {}
+        if not args.skip_planning:
+            report["planning"] = run_planning(args, work_dir)
+        if not args.skip_history:
+            report["history"] = run_history(args, work_dir)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        report["memory"] = {"traced_peak_mib": peak / (1024 * 1024), "max_rss_mib": max_rss_mib()}
+
+    if args.json:
+        print(json.dumps(report, indent=2, default=str))
+    else:
+        print_report(report)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+# benchmarks/memory_report.py - Report memory used by trip history records
+#
+# Usage: python benchmarks/memory_report.py [--trips 1000]
+#
+# Builds synthetic trips shaped like real plans and compares plain dicts
+# (the old session_state layout) with compact TripRecords.
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from trip_records import memory_report
+
+CITIES = ["New York", "Los Angeles", "Chicago", "London", "Paris", "Tokyo", "Delhi", "Sydney"]
+
+# A plan with the same structure and roughly the same size as a real LLM response
+def synthetic_plan(index):
+    source = CITIES[index % len(CITIES)]
+    destination = CITIES[(index * 3 + 1) % len(CITIES)]
+    option = lambda name, cost: {
+        "name": name, "departure": "08:00", "arrival": "14:30", "duration": "6.5 hours",
+        "cost": cost, "notes": f"Option from {source} to {destination}, trip {index}"
+    }
+    return {
+        "travel_options": {
+            "flights": [option(f"Airline {i}", f"${200 + index % 300}-${400 + index % 300}") for i in range(3)],
+            "trains": [option(f"Rail {i}", f"${80 + i * 10}") for i in range(2)],
+            "buses": [option(f"Coach {i}", f"${40 + i * 5}") for i in range(2)],
+            "cabs": [option("Taxi", "$900-$1,200")]
+        },
+        "destination_info": {
+            "weather": f"Mild and partly cloudy in {destination}, highs around {15 + index % 15}°C.",
+            "attractions": [f"{destination} landmark {i}" for i in range(3)],
+            "accommodations": [
+                {"name": f"Hotel {i}", "type": "hotel", "cost_per_night": f"${100 + i * 50}", "location": "Downtown"}
+                for i in range(3)
+            ],
+            "local_transport": ["Metro", "Bus", "Ride-hailing apps"]
+        },
+        "recommendation": f"Flying is the fastest way from {source} to {destination}. Book early for the best fares.",
+        "estimated_total_cost": f"${600 + index % 500}-${1200 + index % 500}"
+    }
+
+def synthetic_trips(count):
+    for index in range(count):
+        plan = synthetic_plan(index)
+        yield {
+            "id": index + 1,
+            "source": CITIES[index % len(CITIES)],
+            "destination": CITIES[(index * 3 + 1) % len(CITIES)],
+            "date": f"2026-{index % 12 + 1:02d}-{index % 28 + 1:02d}",
+            "recommendation": plan["recommendation"],
+            "estimated_cost": plan["estimated_total_cost"],
+            "full_data": plan
+        }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare trip dicts with compact trip records.")
+    parser.add_argument("--trips", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    report = memory_report(list(synthetic_trips(args.trips)))
+    print(f"trips:          {report['trips']}")
+    print(f"plain dicts:    {report['dict_bytes'] / 1024:10.1f} KiB")
+    print(f"trip records:   {report['record_bytes'] / 1024:10.1f} KiB")
+    print(f"saved:          {report['saved_bytes'] / 1024:10.1f} KiB ({report['ratio']:.1f}x smaller)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
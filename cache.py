@@ -0,0 +1,186 @@
+# cache.py - Module for caching LLM responses
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "travel_cache.db")
+DEFAULT_CACHE_TTL = 6 * 60 * 60  # seconds
+DEFAULT_CACHE_MAX_ENTRIES = 5000
+
+# Normalize a single input value so trivially different requests share a key
+def normalize_value(value):
+    return " ".join(str(value).split()).lower()
+
+# Build a stable cache key from the request inputs and the prompt template version
+def make_cache_key(inputs, version):
+    normalized = {name: normalize_value(value) for name, value in inputs.items()}
+    payload = json.dumps({"version": version, "inputs": normalized}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# SQLite-backed response cache with TTL and LRU eviction, shared across sessions and restarts
+class ResponseCache:
+    def __init__(self, path=None, ttl=None, max_entries=None):
+        self.path = path or os.getenv("TRAVEL_CACHE_PATH", DEFAULT_CACHE_PATH)
+        self.ttl = ttl if ttl is not None else int(os.getenv("TRAVEL_CACHE_TTL", DEFAULT_CACHE_TTL))
+        self.max_entries = max_entries if max_entries is not None else int(
+            os.getenv("TRAVEL_CACHE_MAX_ENTRIES", DEFAULT_CACHE_MAX_ENTRIES)
+        )
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def _bump(self, name):
+        self._conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,)
+        )
+
+    # Return the cached value for a key, or None on a miss or expired entry; count=False
+    # re-checks a key that was already counted without skewing the hit/miss stats
+    def get(self, key, count=True):
+        now = time.time()
+        try:
+            with self._lock, self._conn:
+                row = self._conn.execute(
+                    "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None or now - row[1] > self.ttl:
+                    if row is not None:
+                        self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    if count:
+                        self._bump("misses")
+                    return None
+                self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                if count:
+                    self._bump("hits")
+                return json.loads(row[0])
+        except sqlite3.Error:
+            return None
+
+    # Seconds since a live entry was stored, or None if there is none (does not count as a hit or miss)
+    def age(self, key):
+        try:
+            with self._lock:
+                row = self._conn.execute("SELECT created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None or time.time() - row[0] > self.ttl:
+            return None
+        return time.time() - row[0]
+
+    # Store a value and evict the least recently used entries beyond the size limit
+    def set(self, key, value):
+        now = time.time()
+        try:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value), now, now)
+                )
+                self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    " SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+        except sqlite3.Error:
+            pass
+
+    # Remove every cached response (counters are kept)
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses")
+
+    # Hit/miss counters and current size
+    def stats(self):
+        with self._lock:
+            counters = dict(self._conn.execute("SELECT name, value FROM counters").fetchall())
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        hits = counters.get("hits", 0)
+        misses = counters.get("misses", 0)
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+            "entries": entries
+        }
+
+# In-memory TTL cache shared by every session in the process. Expired entries are
+# still served while a background thread refreshes them (stale-while-revalidate).
+class TTLCache:
+    def __init__(self, ttl, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    # Return the cached value, loading it on a cold miss and refreshing it in the background once
+    # stale. `refresh_loader` (default: `loader`) is used for the background refreshes.
+    def get_or_load(self, key, loader, refresh_loader=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                if time.time() - stored_at > self.ttl and key not in self._refreshing:
+                    self._refreshing.add(key)
+                    threading.Thread(target=self._refresh, args=(key, refresh_loader or loader), daemon=True).start()
+                return value
+        value = loader()
+        if value is not None:
+            self.set(key, value)
+        return value
+
+    def _refresh(self, key, loader):
+        try:
+            value = loader()
+            if value is not None:
+                self.set(key, value)
+        except Exception:
+            # Keep serving the stale value; the next read will try again
+            pass
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    # Seconds since the entry was stored, or None if there is none
+    def age(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+        return None if entry is None else time.time() - entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, time.time())
+            # Dicts keep insertion order, so the first key is the oldest write
+            while len(self._entries) > self.max_entries:
+                del self._entries[next(iter(self._entries))]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+# Get the process-wide response cache, creating it on first use
+def get_response_cache():
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+        return _response_cache
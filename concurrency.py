@@ -0,0 +1,108 @@
+# concurrency.py - Module for rate limiting and other concurrency helpers
+import time
+import threading
+
+# Thread-safe token bucket that allows `rate` acquisitions per `per` seconds
+class RateLimiter:
+    def __init__(self, rate, per=60.0, burst=None):
+        self.rate = float(rate)
+        self.per = float(per)
+        self.capacity = float(burst if burst is not None else max(1.0, self.rate))
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self.updated_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate / self.per)
+        self.updated_at = now
+
+    # Take `amount` tokens without waiting; returns False if not enough are available
+    def try_acquire(self, amount=1.0):
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return True
+            return False
+
+    # Give back tokens taken for work that did not go ahead
+    def refund(self, amount=1.0):
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+    # Block until `amount` tokens are available
+    def acquire(self, amount=1.0):
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) * self.per / self.rate
+            time.sleep(wait)
+
+# One in-flight call shared by every caller with the same key
+class Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+    # Block until the leader finishes, then return its result or raise its error
+    def wait(self, timeout=None):
+        if not self.event.wait(timeout):
+            raise TimeoutError("Timed out waiting for an in-flight request")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+# Coalesces concurrent calls with the same key into a single execution (single-flight).
+# The first caller runs the work; everyone arriving while it is in flight waits for
+# and shares its result, and every waiter sees the same exception if it fails.
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+
+    # Join the call for a key; returns (call, is_leader). The leader must call finish().
+    def begin(self, key):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                return call, False
+            call = Call()
+            self._calls[key] = call
+            self.executed += 1
+            return call, True
+
+    # Publish the leader's outcome to all waiters
+    def finish(self, key, call, result=None, error=None):
+        call.result = result
+        call.error = error
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.event.set()
+
+    # Run fn() once for all concurrent callers with the same key
+    def do(self, key, fn):
+        call, is_leader = self.begin(key)
+        if not is_leader:
+            return call.wait()
+        try:
+            result = fn()
+        except BaseException as e:
+            self.finish(key, call, error=e)
+            raise
+        self.finish(key, call, result=result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {"executed": self.executed, "coalesced": self.coalesced, "in_flight": len(self._calls)}
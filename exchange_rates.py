@@ -0,0 +1,276 @@
+# exchange_rates.py - Module for the offline exchange-rate table and plan price conversion
+#
+# Usage: python exchange_rates.py [--refresh]
+#
+# Rates come from a local JSON file (data/exchange_rates.json) instead of the model. With
+# EXCHANGE_RATES_URL set, the file is refreshed from that URL every EXCHANGE_RATES_REFRESH
+# seconds; the URL must return JSON with "rates" (per unit of "base", default USD).
+import os
+import sys
+import json
+import time
+import threading
+from collections import Counter, OrderedDict
+
+from pricing import has_prices, option_price, parse_price
+
+DEFAULT_RATES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "exchange_rates.json")
+DEFAULT_REFRESH_INTERVAL = 24 * 60 * 60
+
+# Number of converted plans kept for reuse across reruns
+CONVERTED_PLAN_CACHE_SIZE = 64
+
+# Rates per US dollar, the currency of each country and the currency names
+class ExchangeRates:
+    def __init__(self, path=None, url=None):
+        self.path = path or os.getenv("EXCHANGE_RATES_PATH", DEFAULT_RATES_PATH)
+        self.url = url if url is not None else os.getenv("EXCHANGE_RATES_URL", "")
+        self.rates = {}
+        self.names = {}
+        self.countries = {}
+        self.updated = None
+        # Bumped on every reload, so views can tell conversions from two rate tables apart
+        self.version = 0
+        self._converted = OrderedDict()
+        self._lock = threading.Lock()
+        self._refresher = None
+        self.load()
+
+    def load(self):
+        with open(self.path, encoding="utf-8") as f:
+            table = json.load(f)
+        self._set_table(table)
+
+    def _set_table(self, table):
+        base_rate = table["rates"].get("USD", 1.0)
+        with self._lock:
+            self.rates = {code.upper(): rate / base_rate for code, rate in table["rates"].items() if rate}
+            self.names = table.get("names", self.names)
+            self.countries = table.get("countries", self.countries)
+            self.updated = table.get("updated")
+            self.version += 1
+            self._converted.clear()
+
+    # Download fresh rates from EXCHANGE_RATES_URL and save them to the local file
+    def refresh(self):
+        from urllib.request import urlopen
+        from datetime import datetime, timezone
+
+        with urlopen(self.url, timeout=30) as response:
+            fetched = json.load(response)
+        base_rate = fetched["rates"].get(fetched.get("base", "USD"), 1.0)
+        table = {
+            "base": "USD",
+            "updated": datetime.now(timezone.utc).strftime("%Y-%m-%d"),
+            "rates": {code.upper(): rate / base_rate for code, rate in fetched["rates"].items()},
+            "names": self.names,
+            "countries": self.countries
+        }
+        self._set_table(table)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(table, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    # Refresh the rates every `interval` seconds in a daemon thread (only with a URL set)
+    def start_refresh(self, interval=None):
+        if not self.url or self._refresher is not None:
+            return
+        interval = interval or int(os.getenv("EXCHANGE_RATES_REFRESH", DEFAULT_REFRESH_INTERVAL))
+
+        def loop():
+            while True:
+                try:
+                    self.refresh()
+                except Exception:
+                    # Keep the current table; the next interval tries again
+                    pass
+                time.sleep(interval)
+
+        self._refresher = threading.Thread(target=loop, name="exchange-rates", daemon=True)
+        self._refresher.start()
+
+    # Units of `target` per unit of `source`, or None if either currency is unknown
+    def rate(self, source, target):
+        source_rate = self.rates.get((source or "").upper())
+        target_rate = self.rates.get((target or "").upper())
+        if not source_rate or not target_rate:
+            return None
+        return target_rate / source_rate
+
+    def currencies(self):
+        return sorted(self.rates)
+
+    def currency_of_country(self, country_code):
+        return self.countries.get(country_code)
+
+    # Currency info for a destination in the shape of planner.get_currency_info, or None for
+    # places outside the gazetteer or countries without a known currency
+    def currency_info(self, destination):
+        from places import resolve_place
+
+        place = resolve_place(destination)
+        code = self.currency_of_country(place.country_code) if place else None
+        if code is None or code not in self.rates:
+            return None
+        return {
+            "local_currency": f"{self.names.get(code, code)} ({code})",
+            "exchange_rate": f"1 USD = {format_amount(self.rates[code])} {code}",
+            "currency": code,
+            "rate": self.rates[code],
+            "updated": self.updated
+        }
+
+    # A copy of the plan with every price and cost text in `currency`, memoized per
+    # (plan_hash, currency). Prices without a currency are taken to be in `assumed`, by
+    # default the currency the rest of the plan is quoted in (see convert_plan).
+    def convert_plan(self, plan, currency, plan_hash=None, assumed=None):
+        key = (plan_hash, currency.upper(), assumed) if plan_hash else None
+        if key is not None:
+            with self._lock:
+                converted = self._converted.get(key)
+                if converted is not None:
+                    self._converted.move_to_end(key)
+                    return converted
+        converted = convert_plan(plan, currency, self.rate, assumed)
+        if key is not None:
+            with self._lock:
+                self._converted[key] = converted
+                while len(self._converted) > CONVERTED_PLAN_CACHE_SIZE:
+                    self._converted.popitem(last=False)
+        return converted
+
+    # Convert one streamed section, e.g. (("travel_options", "flights"), options), the
+    # same way convert_plan converts it as part of a whole plan. Returns the converted
+    # section and the number of its prices left as quoted.
+    def convert_section(self, path, value, currency, assumed=None):
+        plan = value
+        for key in reversed(path):
+            plan = {key: plan}
+        converted = convert_plan(plan, currency, self.rate, assumed)
+        unconverted = converted.get("unconverted_prices", 0)
+        for key in path:
+            converted = converted[key]
+        return converted, unconverted
+
+# Format an amount with thousands separators and no decimals above 100
+def format_amount(amount):
+    if amount >= 100:
+        return f"{amount:,.0f}"
+    return f"{amount:,.2f}".rstrip("0").rstrip(".")
+
+# Cost text for a converted price, in a form parse_price reads back ("1,200-1,500 EUR")
+def format_price(price):
+    if price["max"] == 0:
+        return "Free"
+    if price["min"] == price["max"]:
+        return f"{format_amount(price['min'])} {price['currency']}"
+    return f"{format_amount(price['min'])}-{format_amount(price['max'])} {price['currency']}"
+
+# The currency most of the plan's priced costs are quoted in, or None if none names one
+def plan_currency(plan):
+    prices = []
+    travel_options = plan.get("travel_options")
+    if isinstance(travel_options, dict):
+        for options in travel_options.values():
+            if isinstance(options, list):
+                prices.extend(option_price(option) for option in options if isinstance(option, dict))
+    destination_info = plan.get("destination_info")
+    if isinstance(destination_info, dict) and isinstance(destination_info.get("accommodations"), list):
+        prices.extend(
+            option_price(item, "cost_per_night") for item in destination_info["accommodations"] if isinstance(item, dict)
+        )
+    prices.append(plan.get("estimated_total_price") if has_prices(plan) else parse_price(plan.get("estimated_total_cost")))
+    counts = Counter(price["currency"] for price in prices if price and price["currency"])
+    return counts.most_common(1)[0][0] if counts else None
+
+# Convert every price of a plan into `currency` in one pass: the rate of each source
+# currency is looked up once and applied to all the prices quoted in it. Costs that have
+# no parsed price, or whose currency has no rate, are left as quoted.
+# Prices with no currency marker ("150") are taken to be in `assumed`, or in the plan's own
+# currency (plan_currency) when that is None. If neither is known they are left as quoted,
+# and "unconverted_prices" on the returned plan counts them so the view can say so.
+def convert_plan(plan, currency, rate, assumed=None):
+    currency = currency.upper()
+    assumed = assumed or plan_currency(plan)
+    factors = {}
+    unconverted = [0]
+
+    def factor(price):
+        # Free is free in every currency
+        if price["max"] == 0:
+            return 1.0
+        source = price["currency"] or assumed
+        if source is None:
+            unconverted[0] += 1
+            return None
+        if source not in factors:
+            factors[source] = rate(source, currency)
+        return factors[source]
+
+    def convert(item, field):
+        if not isinstance(item, dict):
+            return item
+        price = option_price(item, field)
+        multiplier = factor(price) if price else None
+        if multiplier is None:
+            return item
+        converted = {"min": price["min"] * multiplier, "max": price["max"] * multiplier, "currency": currency}
+        return dict(item, **{field: format_price(converted), "price": converted, f"quoted_{field}": item.get(field)})
+
+    plan = dict(plan)
+    travel_options = plan.get("travel_options")
+    if isinstance(travel_options, dict):
+        plan["travel_options"] = {
+            mode: [convert(option, "cost") for option in options] if isinstance(options, list) else options
+            for mode, options in travel_options.items()
+        }
+    destination_info = plan.get("destination_info")
+    if isinstance(destination_info, dict) and isinstance(destination_info.get("accommodations"), list):
+        plan["destination_info"] = dict(
+            destination_info,
+            accommodations=[convert(item, "cost_per_night") for item in destination_info["accommodations"]]
+        )
+    total = plan.get("estimated_total_price") if has_prices(plan) else parse_price(plan.get("estimated_total_cost"))
+    multiplier = factor(total) if total else None
+    if multiplier is not None:
+        converted = {"min": total["min"] * multiplier, "max": total["max"] * multiplier, "currency": currency}
+        plan["quoted_estimated_total_cost"] = plan.get("estimated_total_cost")
+        plan["estimated_total_cost"] = format_price(converted)
+        plan["estimated_total_price"] = converted
+    if unconverted[0]:
+        plan["unconverted_prices"] = unconverted[0]
+    return plan
+
+_exchange_rates = None
+_exchange_rates_lock = threading.Lock()
+
+# Get the process-wide exchange-rate table, refreshing it on a schedule if a URL is set
+def get_exchange_rates():
+    global _exchange_rates
+    with _exchange_rates_lock:
+        if _exchange_rates is None:
+            _exchange_rates = ExchangeRates()
+            _exchange_rates.start_refresh()
+        return _exchange_rates
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Show or refresh the offline exchange-rate table.")
+    parser.add_argument("--refresh", action="store_true", help="download fresh rates from EXCHANGE_RATES_URL")
+    args = parser.parse_args(argv)
+
+    rates = ExchangeRates()
+    if args.refresh:
+        if not rates.url:
+            print("EXCHANGE_RATES_URL is not set")
+            return 1
+        rates.refresh()
+    print(f"Rates per USD (updated {rates.updated}):")
+    for code in rates.currencies():
+        print(f"  {code}  {format_amount(rates.rates[code]):>10}  {rates.names.get(code, '')}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
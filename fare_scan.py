@@ -0,0 +1,155 @@
+# fare_scan.py - Module for comparing fares for a route across several travel dates
+import os
+import asyncio
+import threading
+import contextvars
+from datetime import date, datetime, timedelta
+
+import planner
+from cache import get_response_cache, make_cache_key
+from json_extract import extract_json
+from llm_clients import with_output_budget
+from pricing import option_price, parse_price
+from resilience import get_resilient_caller
+from tokens import UsageMeter, estimate_tokens, get_token_ledger, prepare_prompt
+from tracing import span
+
+# Bump whenever the fare prompt below changes
+FARE_SCAN_PROMPT_VERSION = "1"
+
+# Dates asked for in one prompt; longer ranges are split into concurrent batches
+FARE_SCAN_BATCH_SIZE = int(os.getenv("FARE_SCAN_BATCH_SIZE", 7))
+MAX_FLEXIBLE_DAYS = 7
+
+FARE_SCAN_PROMPT = """
+You are a knowledgeable travel assistant that provides accurate and helpful travel information.
+
+Estimate the typical one-way fare per person from {source} to {destination} by {mode_list} on each of these dates:
+{date_list}
+
+Travelers: {travelers}
+Budget Range: {budget}
+
+Format your response as a JSON object keyed by date, with the cheapest typical price range of each mode, or null if the mode is not available on this route:
+{{
+    "{first_date}": {{ {mode_schema} }}
+}}
+
+Only respond with a valid JSON. Do not include any other text, explanations, or invalid characters.
+"""
+
+# The travel date and up to `days` days either side of it, never before today
+def flexible_dates(travel_date, days, today=None):
+    center = datetime.strptime(travel_date, "%Y-%m-%d").date()
+    first = max(today or date.today(), center - timedelta(days=days))
+    return [(first + timedelta(days=offset)).isoformat() for offset in range((center + timedelta(days=days) - first).days + 1)]
+
+def get_fare_cache_key(inputs, travel_date, modes):
+    cache_inputs = planner.get_cache_inputs(dict(inputs, travel_date=travel_date))
+    # Fares do not depend on the travel preferences, only on which modes are compared
+    cache_inputs.pop("preferences", None)
+    cache_inputs["modes"] = ",".join(modes)
+    return make_cache_key(cache_inputs, f"fares-{FARE_SCAN_PROMPT_VERSION}")
+
+# Cheapest cost text per mode from a full plan for the date that is already cached
+def _fares_from_cached_plan(inputs, travel_date, modes):
+    cache = get_response_cache()
+    date_inputs = dict(inputs, travel_date=travel_date)
+    for mode in ("single", "parallel"):
+        if planner.get_plan_cache_age(date_inputs, mode) is None:
+            continue
+        plan = cache.get(planner.get_plan_cache_key(date_inputs, mode))
+        if not isinstance(plan, dict):
+            continue
+        fares = {}
+        for transport in modes:
+            priced = [
+                (option_price(option), option.get("cost"))
+                for option in plan["travel_options"].get(transport) or [] if isinstance(option, dict)
+            ]
+            priced = [(price, cost) for price, cost in priced if price]
+            fares[transport] = min(priced, key=lambda item: item[0]["min"])[1] if priced else None
+        return fares
+    return None
+
+# Ask for the fares of several dates in one prompt; returns {date: {mode: cost text or None}}
+async def _scan_batch(llm, meter, inputs, dates, modes):
+    prompt = FARE_SCAN_PROMPT.format(
+        source=inputs["source"], destination=inputs["destination"], travelers=inputs["travelers"],
+        budget=inputs["budget"], mode_list=", ".join(modes), date_list="\n".join(dates), first_date=dates[0],
+        mode_schema=", ".join(f'"{mode}": "price range"' for mode in modes)
+    )
+    # About 12 output tokens per price and 8 per date key
+    budget = 32 + len(dates) * (8 + 12 * len(modes))
+    # The budget goes on the raw client, which is then metered (as in planner.plan_trip)
+    llm = meter.wrap(with_output_budget(llm, budget))
+    prompt = prepare_prompt(prompt)
+    with span("llm.fare_scan", dates=len(dates)):
+        response = await get_resilient_caller("section").call_async(
+            lambda: llm.ainvoke(prompt), estimate_tokens(prompt) + budget
+        )
+    fares, _ = extract_json(response.content)
+    if not isinstance(fares, dict):
+        raise ValueError("The fare scan response is not a JSON object")
+    return {
+        day: {mode: (row.get(mode) or None) if isinstance(row, dict) else None for mode in modes}
+        for day, row in fares.items() if day in dates
+    }
+
+async def _scan_batches(llm, meter, inputs, batches, modes):
+    return await asyncio.gather(*(_scan_batch(llm, meter, inputs, batch, modes) for batch in batches), return_exceptions=True)
+
+# Compare the fares of a route across `dates`. Dates with a cached plan or fare row are not
+# asked for again; the rest are batched FARE_SCAN_BATCH_SIZE dates per prompt.
+# Returns {"dates", "modes", "fares": {date: {mode: {"cost", "price"}}}, "errors", "token_usage"}.
+def scan_fares(llm, inputs, dates, modes=None):
+    modes = modes or planner.select_transport_modes(inputs)
+    cache = get_response_cache()
+    rows = {}
+    for travel_date in dates:
+        cached = cache.get(get_fare_cache_key(inputs, travel_date, modes))
+        rows[travel_date] = cached if cached is not None else _fares_from_cached_plan(inputs, travel_date, modes)
+
+    missing = [travel_date for travel_date in dates if rows[travel_date] is None]
+    batches = [missing[i:i + FARE_SCAN_BATCH_SIZE] for i in range(0, len(missing), FARE_SCAN_BATCH_SIZE)]
+    errors = {}
+    meter = UsageMeter()
+    if batches:
+        results = asyncio.run(_scan_batches(llm, meter, inputs, batches, modes))
+        for batch, result in zip(batches, results):
+            if isinstance(result, Exception):
+                errors.update({travel_date: str(result) for travel_date in batch})
+                continue
+            for travel_date in batch:
+                if travel_date in result:
+                    rows[travel_date] = result[travel_date]
+                    cache.set(get_fare_cache_key(inputs, travel_date, modes), result[travel_date])
+                else:
+                    errors[travel_date] = "No fares returned for this date"
+        get_token_ledger().record(f"fares: {inputs['source']} -> {inputs['destination']}", meter.summary(), "fare_scan")
+
+    fares = {
+        travel_date: {mode: {"cost": row.get(mode), "price": parse_price(row.get(mode))} for mode in modes}
+        for travel_date, row in rows.items() if row is not None
+    }
+    return {"dates": dates, "modes": modes, "fares": fares, "errors": errors, "token_usage": meter.summary()}
+
+# Fare scan for the plan inputs' date and up to `days` days either side of it
+def scan_flexible_dates(inputs, days):
+    dates = flexible_dates(inputs["travel_date"], min(days, MAX_FLEXIBLE_DAYS))
+    with span("fare_scan", dates=len(dates)):
+        return scan_fares(planner.get_llm("section"), inputs, dates)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# Start a fare scan in the background so it runs while the plan streams; returns a Future.
+# The scan keeps the caller's scheduler session and priority (see scheduler.py).
+def submit_fare_scan(inputs, days):
+    global _executor
+    from concurrent.futures import ThreadPoolExecutor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=int(os.getenv("FARE_SCAN_THREADS", 4)), thread_name_prefix="fare-scan")
+    return _executor.submit(contextvars.copy_context().run, scan_flexible_dates, inputs, days)
@@ -0,0 +1,243 @@
+# history_io.py - Module for streaming export and import of trip history
+#
+# Usage: python history_io.py export USER_ID trips.jsonl|trips.parquet|trips.arrow [--chunk-size 1000]
+#        python history_io.py import USER_ID trips.jsonl|trips.parquet|trips.arrow [--chunk-size 1000]
+#
+# Trips are read and written `chunk_size` at a time, so memory stays flat for any history
+# size. JSONL holds one trip per line with the plan under "full_data". Parquet and Arrow
+# files need pyarrow; they keep the summary fields as their own columns and the plan as a
+# separate "full_data" column of compressed JSON, so analytics can read the summaries
+# alone and imports store the compressed plans without re-encoding them. Every import is
+# checked before anything is written to the store.
+import sys
+import json
+import zlib
+
+from trip_records import SUMMARY_FIELDS, compress_plan, plan_from_blob
+
+DEFAULT_CHUNK_SIZE = 1000
+
+# Summary fields every imported trip needs
+REQUIRED_FIELDS = ("source", "destination", "date")
+
+# Columns read from Parquet and Arrow imports, in the order of _arrow_rows
+IMPORT_COLUMNS = ("source", "destination", "date", "recommendation", "estimated_cost", "full_data")
+
+def get_format(path):
+    name = str(path).lower()
+    if name.endswith(".parquet"):
+        return "parquet"
+    if name.endswith((".arrow", ".feather")):
+        return "arrow"
+    return "jsonl"
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise RuntimeError("Parquet and Arrow files need pyarrow. Install it with: pip install pyarrow") from None
+    return pyarrow
+
+def _arrow_schema(pa):
+    return pa.schema(
+        [pa.field("id", pa.int64())]
+        + [pa.field(name, pa.string()) for name in SUMMARY_FIELDS if name != "id"]
+        + [pa.field("full_data", pa.binary())]
+    )
+
+# Yield the user's trips as JSON lines, one list of lines per chunk of trips
+def iter_jsonl_chunks(store, user_id, chunk_size=DEFAULT_CHUNK_SIZE):
+    for chunk in store.iter_trip_chunks(user_id, chunk_size):
+        yield [
+            json.dumps(dict(summary, full_data=json.loads(zlib.decompress(payload.blob))), ensure_ascii=False) + "\n"
+            for summary, payload in chunk
+        ]
+
+# Write the user's trips as JSON lines to a text stream; returns the number of trips
+def export_jsonl(store, user_id, out, chunk_size=DEFAULT_CHUNK_SIZE):
+    count = 0
+    for lines in iter_jsonl_chunks(store, user_id, chunk_size):
+        out.write("".join(lines))
+        count += len(lines)
+    return count
+
+# Read trips from JSON lines (str or bytes) and add them to the user's history chunk by chunk;
+# returns the number of trips imported. Trips get new ids after the user's existing ones.
+# Raises ValueError for a malformed line; the chunks before it are already imported.
+def import_jsonl(store, user_id, lines, chunk_size=DEFAULT_CHUNK_SIZE):
+    count = 0
+    chunk = []
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            trip = json.loads(line)
+        except ValueError:
+            raise ValueError(f"line {number} is not valid JSON") from None
+        chunk.append(_trip_from_dict(trip, f"line {number}"))
+        if len(chunk) >= chunk_size:
+            count += store.add_trips(user_id, chunk)
+            chunk = []
+    if chunk:
+        count += store.add_trips(user_id, chunk)
+    return count
+
+def _trip_from_dict(trip, where):
+    if not isinstance(trip, dict):
+        raise ValueError(f"{where} is not a trip")
+    plan = trip.get("full_data") or {}
+    _check_trip(trip.get("source"), trip.get("destination"), trip.get("date"), plan, where)
+    return {
+        "source": trip["source"],
+        "destination": trip["destination"],
+        "date": trip["date"],
+        "recommendation": str(trip.get("recommendation", "N/A")),
+        "estimated_cost": str(trip.get("estimated_cost", "N/A")),
+        "full_data": compress_plan(plan)
+    }
+
+def _check_trip(source, destination, travel_date, plan, where):
+    for name, value in zip(REQUIRED_FIELDS, (source, destination, travel_date)):
+        if not isinstance(value, str) or not value:
+            raise ValueError(f"{where} has no {name}")
+    if not isinstance(plan, dict):
+        raise ValueError(f"{where} has a plan that is not a JSON object")
+
+# Write the user's trips to a Parquet or Arrow IPC file, one record batch per chunk;
+# returns the number of trips
+def export_arrow(store, user_id, path, chunk_size=DEFAULT_CHUNK_SIZE, file_format="parquet"):
+    pa = _require_pyarrow()
+    schema = _arrow_schema(pa)
+    if file_format == "parquet":
+        import pyarrow.parquet as pq
+        # The plans are already compressed; zstd packs the repetitive summary columns
+        writer = pq.ParquetWriter(path, schema, compression="zstd")
+        write = writer.write_batch
+    else:
+        import pyarrow.ipc as ipc
+        writer = ipc.new_file(path, schema)
+        write = writer.write_batch
+
+    count = 0
+    try:
+        for chunk in store.iter_trip_chunks(user_id, chunk_size):
+            columns = {name: [summary[name] for summary, _ in chunk] for name in SUMMARY_FIELDS}
+            columns["full_data"] = [payload.blob for _, payload in chunk]
+            write(pa.record_batch([columns[field.name] for field in schema], schema=schema))
+            count += len(chunk)
+    finally:
+        writer.close()
+    return count
+
+def _iter_arrow_batches(source, chunk_size, file_format, columns=None):
+    _require_pyarrow()
+    if file_format == "parquet":
+        import pyarrow.parquet as pq
+        yield from pq.ParquetFile(source).iter_batches(batch_size=chunk_size, columns=columns)
+    else:
+        import pyarrow.ipc as ipc
+        reader = ipc.open_file(source)
+        for index in range(reader.num_record_batches):
+            batch = reader.get_batch(index)
+            yield batch.select(columns) if columns else batch
+
+# Add the trips of a Parquet or Arrow file to the user's history batch by batch; the
+# compressed plans are stored as they are. Returns the number of trips imported.
+# The whole file is checked first (see check_arrow_import), so a bad file imports nothing.
+def import_arrow(store, user_id, source, chunk_size=DEFAULT_CHUNK_SIZE, file_format="parquet"):
+    check_arrow_import(source, chunk_size, file_format)
+    if hasattr(source, "seek"):
+        source.seek(0)
+    count = 0
+    for batch in _iter_arrow_batches(source, chunk_size, file_format, list(IMPORT_COLUMNS)):
+        count += store.add_trips(user_id, [
+            {
+                "source": source_name, "destination": destination, "date": travel_date,
+                "recommendation": recommendation or "N/A", "estimated_cost": estimated_cost or "N/A",
+                "full_data": plan_from_blob(blob)
+            }
+            for source_name, destination, travel_date, recommendation, estimated_cost, blob in _arrow_rows(batch)
+        ])
+    return count
+
+def _arrow_rows(batch):
+    columns = batch.to_pydict()
+    return zip(*(columns[name] for name in IMPORT_COLUMNS))
+
+# Raise ValueError unless a Parquet or Arrow file has the columns export_arrow writes, with
+# string summaries and binary plans, and every trip has a route, a date and a plan that
+# decompresses to a JSON object
+def check_arrow_import(source, chunk_size=DEFAULT_CHUNK_SIZE, file_format="parquet"):
+    pa = _require_pyarrow()
+    if file_format == "parquet":
+        import pyarrow.parquet as pq
+        schema = pq.ParquetFile(source).schema_arrow
+    else:
+        import pyarrow.ipc as ipc
+        schema = ipc.open_file(source).schema
+    for name in IMPORT_COLUMNS:
+        if name not in schema.names:
+            raise ValueError(f"the file has no {name} column")
+        column_type = schema.field(name).type
+        if name == "full_data":
+            valid = pa.types.is_binary(column_type) or pa.types.is_large_binary(column_type)
+        else:
+            valid = pa.types.is_string(column_type) or pa.types.is_large_string(column_type)
+        if not valid:
+            raise ValueError(f"column {name} holds {column_type}, not {'binary' if name == 'full_data' else 'text'}")
+    if hasattr(source, "seek"):
+        source.seek(0)
+    row = 0
+    for batch in _iter_arrow_batches(source, chunk_size, file_format, list(IMPORT_COLUMNS)):
+        for source_name, destination, travel_date, _, _, blob in _arrow_rows(batch):
+            row += 1
+            try:
+                plan = json.loads(zlib.decompress(blob)) if blob is not None else None
+            except (zlib.error, ValueError):
+                plan = None
+            _check_trip(source_name, destination, travel_date, plan, f"row {row}")
+
+# Read only the summary columns of a Parquet or Arrow export, as a pyarrow Table
+def read_trip_summaries(path, columns=SUMMARY_FIELDS):
+    pa = _require_pyarrow()
+    return pa.Table.from_batches(list(_iter_arrow_batches(path, DEFAULT_CHUNK_SIZE, get_format(path), list(columns))))
+
+# Export the user's history to a file, picking the format from its extension
+def export_history(store, user_id, path, chunk_size=DEFAULT_CHUNK_SIZE):
+    file_format = get_format(path)
+    if file_format == "jsonl":
+        with open(path, "w", encoding="utf-8") as out:
+            return export_jsonl(store, user_id, out, chunk_size)
+    return export_arrow(store, user_id, path, chunk_size, file_format)
+
+# Import a history file into the user's history, picking the format from its extension
+def import_history(store, user_id, path, chunk_size=DEFAULT_CHUNK_SIZE):
+    file_format = get_format(path)
+    if file_format == "jsonl":
+        with open(path, encoding="utf-8") as lines:
+            return import_jsonl(store, user_id, lines, chunk_size)
+    return import_arrow(store, user_id, path, chunk_size, file_format)
+
+def main(argv=None):
+    import time
+    import argparse
+    from trip_store import get_trip_store
+
+    parser = argparse.ArgumentParser(description="Export or import trip history.")
+    parser.add_argument("action", choices=["export", "import"])
+    parser.add_argument("user_id", help="the history key from the Trip History page")
+    parser.add_argument("path", help="a .jsonl, .parquet or .arrow file")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    store = get_trip_store()
+    if args.action == "export":
+        count = export_history(store, args.user_id, args.path, args.chunk_size)
+    else:
+        count = import_history(store, args.user_id, args.path, args.chunk_size)
+    print(f"{args.action}ed {count} trips in {time.perf_counter() - started:.1f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+# json_extract.py - Module for extracting and repairing JSON from LLM output
+import json
+
+SMART_OPEN = "“"
+SMART_CLOSE = "”"
+CLOSERS = {"{": "}", "[": "]"}
+
+# Sections every travel plan must have, with the type each one should be
+PLAN_SCHEMA = {
+    ("travel_options", "flights"): list,
+    ("travel_options", "trains"): list,
+    ("travel_options", "buses"): list,
+    ("travel_options", "cabs"): list,
+    ("destination_info", "weather"): str,
+    ("destination_info", "attractions"): list,
+    ("destination_info", "accommodations"): list,
+    ("destination_info", "local_transport"): list,
+    ("recommendation",): str,
+    ("estimated_total_cost",): str
+}
+
+# Find the JSON body in model output and repair common defects in a single pass:
+# surrounding prose or markdown fences, smart quotes used as string delimiters,
+# trailing commas, and output truncated before the closing brackets.
+# Returns (value, repaired) and raises ValueError if nothing usable is found.
+def extract_json(text):
+    start = -1
+    for position, char in enumerate(text):
+        if char in "{[":
+            start = position
+            break
+    if start == -1:
+        raise ValueError("No JSON object found in the response")
+
+    out = []
+    stack = []
+    # Points where the output can be cut and closed to give valid JSON: (length of out, open brackets)
+    safe_points = []
+    in_string = False
+    string_quote = None
+    escape = False
+    repaired = False
+    finished = False
+
+    for char in text[start:]:
+        if in_string:
+            if escape:
+                escape = False
+                out.append(char)
+            elif char == "\\":
+                escape = True
+                out.append(char)
+            elif char == '"' or (string_quote == SMART_OPEN and char == SMART_CLOSE):
+                in_string = False
+                out.append('"')
+            elif char == "\n":
+                # Raw newlines are not allowed inside JSON strings
+                out.append("\\n")
+                repaired = True
+            else:
+                out.append(char)
+            continue
+
+        if char == '"' or char == SMART_OPEN or char == SMART_CLOSE:
+            in_string = True
+            string_quote = char
+            repaired = repaired or char != '"'
+            out.append('"')
+        elif char in "{[":
+            stack.append(char)
+            out.append(char)
+            safe_points.append((len(out), tuple(stack)))
+        elif char in "}]":
+            # Drop a trailing comma before the closing bracket
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+                repaired = True
+            if not stack:
+                break
+            # Close whatever is open, even if the model used the wrong bracket
+            opener = stack.pop()
+            out.append(CLOSERS[opener])
+            repaired = repaired or CLOSERS[opener] != char
+            if not stack:
+                finished = True
+                break
+        elif char == ",":
+            safe_points.append((len(out), tuple(stack)))
+            out.append(char)
+        else:
+            out.append(char)
+
+    body = "".join(out)
+    if finished and not in_string:
+        return json.loads(body), repaired
+
+    # Truncated output: close the open string and brackets, and if the last member is
+    # incomplete (e.g. a key with no value), cut back to the last safe point and try again
+    candidates = []
+    if in_string:
+        candidates.append((body + '"', stack))
+    candidates.append((body, stack))
+    for length, open_brackets in reversed(safe_points):
+        candidates.append(("".join(out[:length]), list(open_brackets)))
+
+    for candidate, open_brackets in candidates:
+        candidate = candidate.rstrip()
+        if candidate.endswith(","):
+            candidate = candidate[:-1]
+        closed = candidate + "".join(CLOSERS[bracket] for bracket in reversed(open_brackets))
+        try:
+            return json.loads(closed), True
+        except ValueError:
+            continue
+    raise ValueError("Could not repair the JSON in the response")
+
+# Look up a (section, name) path in a plan, or None if it is missing
+def get_path(data, path):
+    for key in path:
+        if not isinstance(data, dict) or key not in data:
+            return None
+        data = data[key]
+    return data
+
+# Return the schema paths that are missing or have the wrong type
+def find_missing_sections(plan, schema=PLAN_SCHEMA):
+    if not isinstance(plan, dict):
+        return list(schema)
+    return [path for path, expected in schema.items() if not isinstance(get_path(plan, path), expected)]
@@ -0,0 +1,103 @@
+# json_stream.py - Module for parsing JSON incrementally as LLM tokens arrive
+import json
+
+# Incremental JSON parser that reports object members as soon as their value is complete.
+# Members are reported for the root object and for objects nested directly in it
+# (e.g. ("recommendation",) and ("travel_options", "flights")); anything inside
+# arrays is only reported as part of its enclosing member.
+class IncrementalJSONParser:
+    def __init__(self, max_depth=2):
+        self.max_depth = max_depth
+        self.buffer = ""
+        self.pos = 0
+        self.started = False
+        self.done = False
+        self.in_string = False
+        self.escape = False
+        self.string_start = None
+        self.stack = []
+
+    # Feed the next chunk of text and return a list of (path, value) pairs that just completed
+    def feed(self, text):
+        self.buffer += text
+        completed = []
+
+        while self.pos < len(self.buffer) and not self.done:
+            char = self.buffer[self.pos]
+
+            if not self.started:
+                # Skip markdown fences or any prose before the JSON body
+                if char == "{":
+                    self.started = True
+                    self._push("{")
+                self.pos += 1
+                continue
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                    frame = self.stack[-1]
+                    if frame["type"] == "{" and frame["expect_key"]:
+                        frame["key"] = json.loads(self.buffer[self.string_start:self.pos + 1])
+                        frame["expect_key"] = False
+                self.pos += 1
+                continue
+
+            frame = self.stack[-1]
+            if char == '"':
+                self.in_string = True
+                self.string_start = self.pos
+            elif char in "{[":
+                self._push(char)
+            elif char in "}]":
+                self._finish_scalar(frame, completed)
+                self.stack.pop()
+                if not self.stack:
+                    self.done = True
+                else:
+                    parent = self.stack[-1]
+                    if parent.get("value_start") is not None:
+                        self._emit(parent, self.pos + 1, completed)
+            elif char == ":" and frame["type"] == "{":
+                frame["value_start"] = self.pos + 1
+            elif char == ",":
+                self._finish_scalar(frame, completed)
+                if frame["type"] == "{":
+                    frame["expect_key"] = True
+            self.pos += 1
+
+        return completed
+
+    def _push(self, char):
+        path = None
+        if not self.stack:
+            path = ()
+        else:
+            parent = self.stack[-1]
+            if parent["type"] == "{" and parent["path"] is not None:
+                path = parent["path"] + (parent["key"],)
+        if path is not None and len(path) >= self.max_depth:
+            path = None
+        self.stack.append({
+            "type": char,
+            "path": path,
+            "key": None,
+            "expect_key": char == "{",
+            "value_start": None
+        })
+
+    # Scalars (strings, numbers, literals) end at the next "," or closing bracket
+    def _finish_scalar(self, frame, completed):
+        if frame["type"] == "{" and frame["value_start"] is not None:
+            self._emit(frame, self.pos, completed)
+
+    def _emit(self, frame, end, completed):
+        start = frame["value_start"]
+        frame["value_start"] = None
+        if frame["path"] is None:
+            return
+        completed.append((frame["path"] + (frame["key"],), json.loads(self.buffer[start:end])))
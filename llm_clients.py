@@ -0,0 +1,96 @@
+# llm_clients.py - Module for the shared, process-wide LLM client registry
+import os
+import threading
+
+# Model settings for each kind of call
+LLM_CONFIGS = {
+    "planning": {
+        "model": "gemini-1.5-pro",
+        "temperature": 0.2,
+        "top_p": 0.85,
+        "max_output_tokens": 2048
+    },
+    "section": {
+        "model": "gemini-1.5-pro",
+        "temperature": 0.2,
+        "top_p": 0.85,
+        "max_output_tokens": 1024
+    },
+    "currency": {
+        "model": "gemini-1.5-pro",
+        "temperature": 0.2,
+        "top_p": 0.85,
+        "max_output_tokens": 256
+    }
+}
+
+DEFAULT_POOL_SIZE = 2
+
+# Create a Google GenAI chat client
+def create_google_client(config, api_key):
+    # Imported lazily so scripts that never call the model do not pay for it
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    return ChatGoogleGenerativeAI(google_api_key=api_key, **config)
+
+# Keeps a small, bounded pool of clients per purpose so every Streamlit session
+# reuses the same underlying connections instead of opening new ones.
+# `factory(config, api_key)` builds the clients; benchmarks swap in a local fake.
+class LLMClientRegistry:
+    def __init__(self, pool_size=None, factory=None):
+        self.pool_size = max(1, pool_size or int(os.getenv("LLM_POOL_SIZE", DEFAULT_POOL_SIZE)))
+        self.factory = factory or create_google_client
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    # Hand out clients round-robin, creating them lazily up to the pool size
+    def get(self, purpose, api_key):
+        config = LLM_CONFIGS[purpose]
+        with self._lock:
+            pool = self._pools.get(purpose)
+            # A changed API key invalidates the existing clients for this purpose
+            if pool is None or pool["api_key"] != api_key:
+                pool = {"api_key": api_key, "clients": [], "next": 0}
+                self._pools[purpose] = pool
+            
+            if len(pool["clients"]) < self.pool_size:
+                client = self.factory(config, api_key)
+                pool["clients"].append(client)
+                return client
+            
+            client = pool["clients"][pool["next"] % self.pool_size]
+            pool["next"] += 1
+            return client
+
+    # Number of live clients per purpose
+    def stats(self):
+        with self._lock:
+            return {purpose: len(pool["clients"]) for purpose, pool in self._pools.items()}
+
+    # Use a different client factory; existing clients are dropped
+    def set_factory(self, factory):
+        with self._lock:
+            self.factory = factory or create_google_client
+            self._pools.clear()
+
+    def clear(self):
+        with self._lock:
+            self._pools.clear()
+
+_registry = LLMClientRegistry()
+
+# Get a shared client for the given purpose
+def get_llm_client(purpose, api_key):
+    return _registry.get(purpose, api_key)
+
+def get_client_registry():
+    return _registry
+
+# A copy of a client with a different output token limit. The copy is shallow, so it
+# shares the underlying connection with the pooled client.
+def with_output_budget(llm, max_output_tokens):
+    if getattr(llm, "max_output_tokens", None) == max_output_tokens:
+        return llm
+    if hasattr(llm, "model_copy"):
+        return llm.model_copy(update={"max_output_tokens": max_output_tokens})
+    return llm.copy(update={"max_output_tokens": max_output_tokens})
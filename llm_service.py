@@ -1,168 +1,222 @@
 # llm_service.py - Module for AI model and prompt management
-import os
-import json
+import uuid
+import threading
+from contextlib import contextmanager
+
 import streamlit as st
-from datetime import datetime
-from langchain.chains import LLMChain
-from langchain.prompts import PromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI
 
-# Initialize the Google GenAI LLM
-def initialize_llm():
+import planner
+from planner import PlanningError, get_planning_mode
+from resilience import CircuitOpenError, LLMTimeoutError
+from scheduler import SchedulerBusyError, get_scheduler, queue_reporter, session_scope
+from tracing import span
+
+# The planning engine lives in planner.py; this module adapts it to the Streamlit UI
+# by reporting errors on the page instead of raising them.
+
+# Get the shared Google GenAI LLM client for a purpose (see llm_clients.LLM_CONFIGS)
+def initialize_llm(purpose="planning"):
     try:
-        google_api_key = os.getenv("GOOGLE_API_KEY")
-        if not google_api_key:
-            st.error("Google API key not found. Please check your .env file.")
-            return None
-            
-        llm = ChatGoogleGenerativeAI(
-            model="gemini-1.5-pro",
-            google_api_key=google_api_key,
-            temperature=0.2,
-            top_p=0.85,
-            max_output_tokens=2048
-        )
-        return llm
+        return planner.get_llm(purpose)
+    except PlanningError as e:
+        st.error(str(e))
+        return None
     except Exception as e:
         st.error(f"Error initializing LLM: {e}")
         return None
 
-# Define the prompt template for travel planning
-def get_travel_prompt_template():
-    current_date = datetime.now().strftime("%Y-%m-%d")
-    
-    template = """
-    You are a knowledgeable travel assistant that provides accurate and helpful travel information.
-    
-    Based on the following details, provide detailed travel options with estimated costs:
-    
-    Source: {source}
-    Destination: {destination}
-    Travel Date: {travel_date}
-    Travelers: {travelers}
-    Preferences: {preferences}
-    Budget Range: {budget}
-    
-    For each of the following transportation modes, provide available options, travel time, and estimated cost ranges:
-    1. Flights
-    2. Trains
-    3. Buses
-    4. Cabs/Taxis
-    
-    Additionally, provide:
-    - Brief weather information for the destination on the travel date
-    - Top 3 attractions at the destination
-    - 2-3 accommodation options within the specified budget
-    - Local transportation options at the destination
-    
-    Format your response as a properly formatted JSON object with the following structure:
-    {{
-        "travel_options": {{
-            "flights": [
-                {{ "name": "Airline name", "departure": "time", "arrival": "time", "duration": "hours", "cost": "price range", "notes": "any additional info" }}
-            ],
-            "trains": [...],
-            "buses": [...],
-            "cabs": [...]
-        }},
-        "destination_info": {{
-            "weather": "weather description",
-            "attractions": ["attraction1", "attraction2", "attraction3"],
-            "accommodations": [
-                {{ "name": "hotel name", "type": "hotel/hostel/etc", "cost_per_night": "price", "location": "area" }}
-            ],
-            "local_transport": ["option1", "option2"]
-        }},
-        "recommendation": "your brief recommendation on best travel option",
-        "estimated_total_cost": "estimated range for travel + 3 days accommodation"
-    }}
-    
-    Only respond with a valid JSON. Do not include any other text, explanations, or invalid characters.
-    """
-    
-    return PromptTemplate(
-        input_variables=["source", "destination", "travel_date", "travelers", "preferences", "budget"],
-        template=template
-    )
-
 # Setup the LangChain with Google GenAI
 def setup_langchain():
-    llm = initialize_llm()
-    
-    if llm:
-        prompt_template = get_travel_prompt_template()
-        chain = LLMChain(
-            llm=llm,
-            prompt=prompt_template,
-            verbose=False
-        )
-        return chain
+    with span("service.setup_chain"):
+        llm = initialize_llm()
+        
+        if llm:
+            return planner.build_travel_chain(llm)
     return None
 
+# Report sections that fell back to placeholders in parallel mode
+def warn_section_errors(errors):
+    st.warning("Some sections could not be generated: " + "; ".join(
+        f"{section} ({error})" for section, error in errors.items()
+    ))
+
+# Note the retries, timeouts and hedges it took to generate a plan (its "resilience" entry)
+RESILIENCE_LABELS = (
+    ("retries", "retried"), ("timeouts", "timed out"), ("hedges", "hedged"),
+    ("circuit_open", "rejected while the planner was paused")
+)
+
+def show_resilience_report(plan):
+    summary = plan.get("resilience") or {}
+    parts = [f"{summary[name]} {label}" for name, label in RESILIENCE_LABELS if summary.get(name)]
+    if parts:
+        st.caption(f"Model calls for this plan: {summary['calls']} made, " + ", ".join(parts))
+
+# Note the tokens a plan cost; plans this request did not generate cost nothing now
+PLAN_SOURCE_LABELS = {
+    "cached": "Served from cache",
+    "shared": "Shared with an identical request",
+    "previous": "Unchanged from your previous plan"
+}
+
+def show_token_usage(plan, source):
+    usage = plan.get("token_usage")
+    if not usage:
+        return
+    approx = "~" if usage["estimated"] else ""
+    cost = (f"{approx}{usage['prompt_tokens']} prompt and {approx}{usage['completion_tokens']} output tokens "
+            f"(about ${usage['cost_usd']:.4f})")
+    if source == "generated":
+        st.caption(f"Generated with {cost}")
+    else:
+        st.caption(f"{PLAN_SOURCE_LABELS[source]} (originally generated with {cost})")
+
+def report_planning_error(e):
+    if isinstance(e, SchedulerBusyError):
+        st.warning(str(e))
+        return
+    if isinstance(e, (CircuitOpenError, LLMTimeoutError)):
+        st.error(f"The travel planner is not responding right now: {e}")
+        return
+    st.error(f"An error occurred while generating recommendations: {e}")
+    st.error(f"Response received: {getattr(e, 'response', None) or 'No response'}")
+
+# Scheduler session of this browser session; queued LLM calls are served round-robin across sessions
+def get_llm_session_id():
+    if "llm_session_id" not in st.session_state:
+        st.session_state.llm_session_id = uuid.uuid4().hex
+    return st.session_state.llm_session_id
+
+def format_wait(seconds):
+    if seconds < 60:
+        return f"{max(1, round(seconds))} s"
+    return f"{round(seconds / 60)} min"
+
+def show_queue_status(placeholder, position, wait):
+    placeholder.info(f"The planner is busy. Your request is number {position} in the queue "
+                     f"(about {format_wait(wait)} until it starts).")
+
+# Queue reporter (see scheduler.queue_reporter) that keeps `placeholder` showing the best
+# position and the longest wait among this session's queued calls, and clears it once none
+# are waiting. Calls may queue on worker threads (parallel sections, fare scans), which
+# write to the page through this script run's context.
+class QueueStatus:
+    def __init__(self, placeholder):
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        
+        self.placeholder = placeholder
+        self._ctx = get_script_run_ctx()
+        self._waiting = {}
+        self._lock = threading.Lock()
+    
+    def __call__(self, ticket, position, wait):
+        from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+        
+        # Pooled worker threads only touch the page from here, so the context is simply replaced
+        if get_script_run_ctx(suppress_warning=True) is not self._ctx:
+            add_script_run_ctx(threading.current_thread(), self._ctx)
+        with self._lock:
+            if position:
+                self._waiting[id(ticket)] = (position, wait)
+            else:
+                self._waiting.pop(id(ticket), None)
+            if self._waiting:
+                show_queue_status(
+                    self.placeholder,
+                    min(position for position, _ in self._waiting.values()),
+                    max(wait for _, wait in self._waiting.values())
+                )
+            else:
+                self.placeholder.empty()
+
+# Attribute the LLM calls made in this block to the browser session for fair queuing, and
+# show their queue position and estimated wait in `placeholder` while they are queued
+@contextmanager
+def planning_session(placeholder):
+    # Show the expected wait up front; the reporter takes over once calls are queued
+    scheduler = get_scheduler()
+    position, wait = scheduler.preview() if scheduler is not None else (0, 0)
+    if position:
+        show_queue_status(placeholder, position, wait)
+    try:
+        with session_scope(get_llm_session_id()), queue_reporter(QueueStatus(placeholder)):
+            yield
+    finally:
+        placeholder.empty()
+
+# Plan inputs for the form fields; kept with the current plan so that a revised form only
+# regenerates the sections its changes affect (pass previous=(inputs, plan) below)
+def get_plan_inputs(source, destination, travel_date, travelers, preferences, budget):
+    return planner.build_plan_inputs(source, destination, travel_date, travelers, preferences, budget)
+
 # Generate travel recommendations
-def generate_travel_recommendations(source, destination, travel_date, travelers, preferences, budget, chain):
+def generate_travel_recommendations(source, destination, travel_date, travelers, preferences, budget, chain, mode=None,
+                                    previous=None):
     try:
         if not source or not destination:
             return None
         
-        response = chain.run({
-            "source": source,
-            "destination": destination,
-            "travel_date": travel_date,
-            "travelers": travelers,
-            "preferences": preferences,
-            "budget": budget
-        })
+        inputs = planner.build_plan_inputs(source, destination, travel_date, travelers, preferences, budget)
+        with span("service.plan", mode=planner.get_planning_mode(mode)):
+            recommendations, errors = planner.plan_trip(inputs, chain, mode, previous=previous)
+        if errors:
+            warn_section_errors(errors)
+        show_resilience_report(recommendations)
+        return recommendations
+    except Exception as e:
+        report_planning_error(e)
+        return None
+
+# Stream travel recommendations section by section (see planner.stream_plan)
+def stream_travel_recommendations(source, destination, travel_date, travelers, preferences, budget, chain, mode=None,
+                                  previous=None):
+    try:
+        if not source or not destination:
+            return
         
-        # Clean the response if it contains markdown code blocks
-        if response.startswith("```json"):
-            # Remove the ```json at the beginning and ``` at the end
-            cleaned_response = response.replace("```json", "", 1)
-            if cleaned_response.endswith("```"):
-                cleaned_response = cleaned_response[:-3]
-            # Trim whitespace
-            cleaned_response = cleaned_response.strip()
-        else:
-            cleaned_response = response
-            
-        # Parse JSON response
-        return json.loads(cleaned_response)
+        inputs = planner.build_plan_inputs(source, destination, travel_date, travelers, preferences, budget)
+        plan_source = "generated"
+        for path, value in planner.stream_plan(inputs, chain, mode, previous=previous):
+            if path == ("plan_source",):
+                plan_source = value
+                continue
+            if path == ("section_errors",):
+                if value:
+                    warn_section_errors(value)
+                continue
+            if path == ():
+                show_token_usage(value, plan_source)
+                show_resilience_report(value)
+            yield path, value
     except Exception as e:
-        st.error(f"An error occurred while generating recommendations: {e}")
-        st.error(f"Response received: {response if 'response' in locals() else 'No response'}")
+        report_planning_error(e)
+
+# Start comparing fares for the travel date and up to `flexible_days` days either side of it.
+# Returns a Future for ui.display_fare_scan, or None if there is nothing to compare.
+def start_fare_scan(source, destination, travel_date, travelers, preferences, budget, flexible_days):
+    if not source or not destination or not flexible_days:
         return None
+    from fare_scan import submit_fare_scan
+    
+    inputs = planner.build_plan_inputs(source, destination, travel_date, travelers, preferences, budget)
+    return submit_fare_scan(inputs, flexible_days)
 
-# Currency converter function
+# Wait for a fare scan started by start_fare_scan; returns the scan, or None if it failed
+def finish_fare_scan(future):
+    if future is None:
+        return None
+    try:
+        return future.result()
+    except Exception as e:
+        st.warning(f"Could not compare fares across dates: {e}")
+        return None
+
+# Currency converter function, served from the process-wide cache
 def get_currency_info(destination):
-    # Simple currency conversion prompt
-    currency_prompt = f"""
-    Provide the current currency used in {destination} and the approximate exchange rate from USD.
-    Format as JSON: {{"local_currency": "Currency Name (CODE)", "exchange_rate": "1 USD = X Local Currency"}}
-    """
-    
     try:
-        llm = initialize_llm()
-        if llm:
-            currency_info = llm.invoke(currency_prompt).content
-            
-            # Clean the response if it contains markdown code blocks
-            if currency_info.strip().startswith("```"):
-                # Find the position of the first and last backticks
-                start_pos = currency_info.find("{")
-                end_pos = currency_info.rfind("}")
-                
-                if start_pos != -1 and end_pos != -1:
-                    # Extract just the JSON part
-                    cleaned_info = currency_info[start_pos:end_pos+1]
-                else:
-                    # Try removing markdown formatting
-                    cleaned_info = currency_info.replace("```json", "").replace("```", "").strip()
-            else:
-                cleaned_info = currency_info
-                
-            # Parse JSON response
-            return json.loads(cleaned_info)
+        return planner.get_currency_info(destination)
     except Exception as e:
         st.warning(f"Could not load currency information: {e}")
-        st.warning(f"Response received: {currency_info if 'currency_info' in locals() else 'No response'}")
+        if getattr(e, "response", None):
+            st.warning(f"Response received: {e.response}")
         return None
@@ -3,10 +3,8 @@ import streamlit as st
 from dotenv import load_dotenv
 import os
 
-# Import modules
-from llm_service import initialize_llm, setup_langchain
-from ui import display_header, create_sidebar_navigation
-from pages import plan_trip_page, trip_history_page, about_page
+# Import modules (pages and the AI model are loaded on demand in main() to keep startup fast)
+from ui import display_header, create_sidebar_navigation, display_trace_panel
 from storage import init_trip_history
 
 # Load environment variables
@@ -30,22 +28,51 @@ def main():
     # Create sidebar for navigation
     page = create_sidebar_navigation()
     
+    # Optional performance panel for operators
+    if os.getenv("TRACE_ADMIN", "false").lower() == "true":
+        display_trace_panel()
+    
+    # The About page needs neither the AI model nor the planning pages
+    if page == "About":
+        from pages import about_page
+        about_page()
+        return
+    
     # Initialize session state for the travel chain
     if 'travel_chain' not in st.session_state:
+        from llm_service import setup_langchain
         st.session_state.travel_chain = setup_langchain()
     
     # Check if chain was initialized successfully
-    if not st.session_state.travel_chain and page != "About":
+    if not st.session_state.travel_chain:
         st.error("Failed to initialize the AI model. Please check your API key.")
         st.stop()
     
     # Page router
     if page == "Plan a Trip":
+        from pages import plan_trip_page
         plan_trip_page()
-    elif page == "Trip History":
+    else:  # Trip History page
+        from pages import trip_history_page
         trip_history_page()
-    else:  # About page
-        about_page()
+
+# Run the app, profiling the rerun when enabled in the performance panel
+def run():
+    metrics_port = os.getenv("TRACE_METRICS_PORT")
+    if metrics_port:
+        from tracing import start_metrics_server
+        start_metrics_server(int(metrics_port))
+    
+    # Warm the caches for popular routes during off-peak hours
+    if os.getenv("PREFETCH_ENABLED", "false").lower() == "true":
+        from prefetch import start_prefetcher
+        start_prefetcher()
+    
+    if st.session_state.get("profile_rerun"):
+        from tracing import profile_call
+        _, st.session_state.profile_report = profile_call(main, os.getenv("TRACE_PROFILER", "cprofile"))
+    else:
+        main()
 
 if __name__ == "__main__":
-    main()
+    run()
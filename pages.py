@@ -3,9 +3,19 @@ import streamlit as st
 from datetime import datetime, timedelta
 
 # Import from other modules
-from llm_service import generate_travel_recommendations, get_currency_info
-from ui import display_travel_results, display_currency_converter
-from storage import save_trip_to_history, get_trips_dataframe, get_trip_by_id, delete_trip
+from llm_service import (
+    stream_travel_recommendations, get_currency_info, get_planning_mode, start_fare_scan, finish_fare_scan,
+    planning_session, get_plan_inputs
+)
+from ui import display_travel_results, display_travel_results_streaming, display_currency_converter
+from trip_records import compress_plan
+from tracing import span
+from places import canonicalize_location, display_name, resolve_place, suggest_places
+from storage import (
+    save_trip_to_history, get_trips_dataframe, get_trip_by_id, delete_trip,
+    count_trips, get_trip_destinations, get_trip_labels, export_trip_history, import_trip_history,
+    init_trip_history, restore_trip_history
+)
 
 # Plan a Trip page
 def plan_trip_page():
@@ -36,6 +46,14 @@ def plan_trip_page():
                 options=["Budget", "Moderate", "Luxury"],
                 value="Moderate"
             )
+            flexible_days = st.number_input(
+                "Flexible dates (± days)", min_value=0, max_value=7, value=0,
+                help="Also compare fares for nearby dates"
+            )
+            parallel_mode = st.checkbox(
+                "Fast mode (plan sections in parallel)",
+                value=get_planning_mode() == "parallel"
+            )
         
         submit_button = st.form_submit_button("Find Travel Options")
     
@@ -49,25 +67,62 @@ def plan_trip_page():
     # Processing and displaying results
     if submit_button:
         if source and destination:
-            with st.spinner("Planning your travel options..."):
-                recommendations = generate_travel_recommendations(
-                    source, 
-                    destination, 
-                    travel_date.strftime("%Y-%m-%d"),
-                    str(travelers),
-                    ", ".join(preferences),
-                    budget,
-                    st.session_state.travel_chain
+            # Resolve aliases like "NYC" to one canonical name so repeat plans hit the cache
+            for label, location in (("Source", source), ("Destination", destination)):
+                if resolve_place(location) is None:
+                    suggestions = suggest_places(location.split(",")[0])
+                    if suggestions:
+                        st.caption(f"{label} not recognized. Did you mean: "
+                                   + ", ".join(display_name(place) for place in suggestions) + "?")
+            source = canonicalize_location(source)
+            destination = canonicalize_location(destination)
+            plan_inputs = get_plan_inputs(
+                source, destination, travel_date.strftime("%Y-%m-%d"), str(travelers), ", ".join(preferences), budget
+            )
+            
+            # Sections of the current plan that the changed fields do not affect are reused
+            previous = None
+            if 'current_plan_inputs' in st.session_state:
+                previous = (st.session_state.current_plan_inputs, st.session_state.current_recommendations)
+            
+            # Shows the queue position and estimated wait while the planner is busy
+            queue_status = st.empty()
+            with planning_session(queue_status), st.spinner("Planning your travel options..."), span("page.plan_results"):
+                # Fares for nearby dates are compared while the plan streams in
+                fare_future = start_fare_scan(
+                    source, destination, travel_date.strftime("%Y-%m-%d"), str(travelers),
+                    ", ".join(preferences), budget, flexible_days
+                )
+                
+                # Display travel results section by section as they are generated
+                recommendations = display_travel_results_streaming(
+                    stream_travel_recommendations(
+                        source, 
+                        destination, 
+                        travel_date.strftime("%Y-%m-%d"),
+                        str(travelers),
+                        ", ".join(preferences),
+                        budget,
+                        st.session_state.travel_chain,
+                        mode="parallel" if parallel_mode else "single",
+                        previous=previous
+                    ),
+                    source,
+                    destination,
+                    load_fare_scan=(lambda: finish_fare_scan(fare_future)) if fare_future else None
                 )
                 
                 if recommendations:
-                    # Store recommendations in session state to persist between page loads
+                    # Store recommendations in session state to persist between page loads.
+                    # The compressed plan is interned, so sessions with the same plan share it.
+                    recommendations = compress_plan(recommendations)
                     st.session_state.current_recommendations = recommendations
+                    st.session_state.current_plan_inputs = plan_inputs
                     st.session_state.current_source = source
                     st.session_state.current_destination = destination
-                    
-                    # Display travel results
-                    display_travel_results(recommendations, source, destination)
+                    st.session_state.current_fare_scan = (
+                        fare_future.result() if fare_future and not fare_future.exception() else None
+                    )
                     
                     # Add the currency converter
                     currency_data = get_currency_info(destination)
@@ -91,7 +146,8 @@ def plan_trip_page():
         display_travel_results(
             st.session_state.current_recommendations, 
             st.session_state.current_source, 
-            st.session_state.current_destination
+            st.session_state.current_destination,
+            fare_scan=st.session_state.get("current_fare_scan")
         )
         
         # Add the currency converter
@@ -108,53 +164,107 @@ def plan_trip_page():
                 st.session_state.travel_date
             )
 
+# Number of trips shown per page of the history table
+TRIP_PAGE_SIZES = [10, 20, 50, 100]
+
 # Trip History page
 def trip_history_page():
     st.subheader("Your Saved Trips")
     
-    # Get trip history as DataFrame
-    trip_df = get_trips_dataframe()
+    # The history key is the only way back to this history from another session
+    with st.expander("History key"):
+        st.code(init_trip_history(), language=None)
+        st.caption("Keep this key private. Enter it in a later session to get this history back; "
+                   "anyone with the key can see and change your saved trips.")
+        history_key = st.text_input("Restore a history from its key")
+        if history_key and st.button("Restore", key="restore_history"):
+            restore_trip_history(history_key)
     
-    if trip_df is None:
+    # Back up or move the history; Parquet and Arrow files need pyarrow
+    with st.expander("Export / Import"):
+        export_format = st.selectbox("Export format", options=["jsonl", "parquet", "arrow"])
+        if st.button("Prepare export", key="prepare_export"):
+            try:
+                data = export_trip_history(export_format)
+            except RuntimeError as e:
+                st.error(str(e))
+            else:
+                st.download_button("Download trip history", data=data, file_name=f"trip_history.{export_format}")
+        
+        uploaded_file = st.file_uploader("Import trips", type=["jsonl", "parquet", "arrow"])
+        if uploaded_file is not None and st.button("Import", key="import_trips"):
+            try:
+                import_trip_history(uploaded_file)
+            except (RuntimeError, ValueError, KeyError) as e:
+                st.error(f"Could not import the file: {e}")
+    
+    if count_trips() == 0:
         st.info("No trips saved yet. Plan a trip to see it here!")
         return
     
+    # Filters are applied by the trip store, so only the matching page is loaded
+    filter_col1, filter_col2, filter_col3 = st.columns(3)
+    with filter_col1:
+        destination = st.selectbox("Destination", options=["All destinations"] + get_trip_destinations())
+        if destination == "All destinations":
+            destination = None
+    with filter_col2:
+        date_range = st.date_input("Travel dates", value=())
+        date_from = date_range[0].strftime("%Y-%m-%d") if len(date_range) > 0 else None
+        date_to = date_range[1].strftime("%Y-%m-%d") if len(date_range) > 1 else date_from
+    with filter_col3:
+        page_size = st.selectbox("Trips per page", options=TRIP_PAGE_SIZES, index=1)
+    
+    total = count_trips(destination, date_from, date_to)
+    page_count = max(1, -(-total // page_size))
+    page_number = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1)
+    offset = (page_number - 1) * page_size
+    
+    # Get this page of the trip history as DataFrame
+    with span("page.history_frame"):
+        trip_df = get_trips_dataframe(offset, page_size, destination, date_from, date_to)
+    
+    if trip_df is None:
+        st.info("No saved trips match these filters.")
+        return
+    
     # Display trip history as a table
     st.dataframe(trip_df, use_container_width=True)
+    st.caption(f"Showing {offset + 1}-{offset + len(trip_df)} of {total} trips")
+    
+    # Selection works on the trips of the current page; labels come from the incremental index
+    trip_ids = trip_df["ID"].tolist()
+    trip_labels = get_trip_labels()
     
     # Create columns for selection and deletion
     col1, col2 = st.columns(2)
     
     with col1:
         # Allow user to select a trip to view details
-        trip_ids = [t["id"] for t in st.session_state.trip_history]
+        selected_trip_id = st.selectbox(
+            "Select a trip to view details:", 
+            options=trip_ids,
+            format_func=lambda x: trip_labels.get(x, f"Trip {x}")
+        )
         
-        if trip_ids:
-            selected_trip_id = st.selectbox(
-                "Select a trip to view details:", 
-                options=trip_ids,
-                format_func=lambda x: f"Trip {x}: {next((t['source'] for t in st.session_state.trip_history if t['id'] == x), '')} → {next((t['destination'] for t in st.session_state.trip_history if t['id'] == x), '')}"
-            )
-            
-            # View button
-            if st.button("View Selected Trip", key="view_trip_button"):
-                selected_trip = get_trip_by_id(selected_trip_id)
-                if selected_trip:
-                    st.session_state.viewing_trip = selected_trip
+        # View button
+        if st.button("View Selected Trip", key="view_trip_button"):
+            selected_trip = get_trip_by_id(selected_trip_id)
+            if selected_trip:
+                st.session_state.viewing_trip = selected_trip
     
     with col2:
         # Delete functionality
-        if trip_ids:
-            delete_trip_id = st.selectbox(
-                "Select a trip to delete:", 
-                options=trip_ids,
-                format_func=lambda x: f"Trip {x}: {next((t['source'] for t in st.session_state.trip_history if t['id'] == x), '')} → {next((t['destination'] for t in st.session_state.trip_history if t['id'] == x), '')}"
-            )
-            
-            # Delete button
-            if st.button("Delete Selected Trip", key="delete_trip_button"):
-                delete_trip(delete_trip_id)
-                st.experimental_rerun()
+        delete_trip_id = st.selectbox(
+            "Select a trip to delete:", 
+            options=trip_ids,
+            format_func=lambda x: trip_labels.get(x, f"Trip {x}")
+        )
+        
+        # Delete button
+        if st.button("Delete Selected Trip", key="delete_trip_button"):
+            delete_trip(delete_trip_id)
+            st.experimental_rerun()
     
     # Display the selected trip if it exists in session state
     if 'viewing_trip' in st.session_state and st.session_state.viewing_trip:
@@ -163,8 +273,8 @@ def trip_history_page():
         st.subheader(f"Trip Details: {trip['source']} → {trip['destination']}")
         st.markdown(f"**Date:** {trip['date']}")
         
-        # Display trip data
-        display_travel_results(trip["full_data"], trip["source"], trip["destination"])
+        # Display trip data (the compressed payload carries its content hash, so cached frames are reused)
+        display_travel_results(trip.payload, trip["source"], trip["destination"])
         
         # Add currency converter
         currency_data = get_currency_info(trip["destination"])
@@ -193,7 +303,10 @@ def about_page():
     - **Currency Conversion**: Quick currency reference for your destination
     
     ### Privacy
-    We do not store your travel plans on our servers. All saved trips are stored locally in your browser's session.
+    Saved trips are stored on the server that runs this app, not in your browser, under a random 
+    history key. The key is not part of the page link, so sharing a link does not share your trips. 
+    To come back to your history in a later session, copy the key from the Trip History page; 
+    anyone who has the key can see and change your saved trips.
     """)
     
     # Version information
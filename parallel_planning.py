@@ -0,0 +1,294 @@
+# parallel_planning.py - Module for planning a trip with concurrent sub-queries
+import json
+import queue
+import asyncio
+import threading
+import contextvars
+
+from json_extract import extract_json
+from resilience import get_resilient_caller
+from llm_clients import with_output_budget
+from tokens import OUTPUT_BUDGETS, estimate_tokens, prepare_prompt
+from tracing import span
+
+# Bump whenever any of the section prompts below change
+PARALLEL_PROMPT_VERSION = "4"
+
+TRANSPORT_MODES = {
+    "flights": {"label": "flight", "name": "Airline name"},
+    "trains": {"label": "train", "name": "Train operator and service"},
+    "buses": {"label": "bus", "name": "Bus operator"},
+    "cabs": {"label": "cab/taxi", "name": "Cab or taxi service"}
+}
+
+TRANSPORT_PROMPT = """
+You are a knowledgeable travel assistant that provides accurate and helpful travel information.
+
+List the available {label} options for this trip with travel time and estimated cost ranges per person across fare classes:
+
+Source: {source}
+Destination: {destination}
+Travel Date: {travel_date}
+Preferences: {preferences}
+Budget Range: {budget}
+
+Format your response as a JSON array with this structure:
+[
+    {{ "name": "{name}", "departure": "time", "arrival": "time", "duration": "hours", "cost": "price range", "notes": "any additional info" }}
+]
+Return an empty array if there is no {label} option on this route.
+
+Only respond with a valid JSON. Do not include any other text, explanations, or invalid characters.
+"""
+
+DESTINATION_PROMPT = """
+You are a knowledgeable travel assistant that provides accurate and helpful travel information.
+
+For a trip to {destination} on {travel_date} with a {budget} budget, provide:
+- Brief weather information for the destination on the travel date
+- Top 3 attractions at the destination
+- 2-3 accommodation options within the specified budget
+- Local transportation options at the destination
+
+Format your response as a JSON object with the following structure:
+{{
+    "weather": "weather description",
+    "attractions": ["attraction1", "attraction2", "attraction3"],
+    "accommodations": [
+        {{ "name": "hotel name", "type": "hotel/hostel/etc", "cost_per_night": "price", "location": "area" }}
+    ],
+    "local_transport": ["option1", "option2"]
+}}
+
+Only respond with a valid JSON. Do not include any other text, explanations, or invalid characters.
+"""
+
+ACCOMMODATION_PROMPT = """
+You are a knowledgeable travel assistant that provides accurate and helpful travel information.
+
+For a trip to {destination} on {travel_date} with a {budget} budget, suggest 2-3 accommodation options within the specified budget.
+
+Format your response as a JSON array with this structure:
+[
+    {{ "name": "hotel name", "type": "hotel/hostel/etc", "cost_per_night": "price", "location": "area" }}
+]
+
+Only respond with a valid JSON. Do not include any other text, explanations, or invalid characters.
+"""
+
+RECOMMENDATION_PROMPT = """
+You are a knowledgeable travel assistant that provides accurate and helpful travel information.
+
+A traveler is going from {source} to {destination} on {travel_date}.
+Travelers: {travelers}
+Preferences: {preferences}
+Budget Range: {budget}
+
+These are the available travel options and accommodations:
+{options}
+
+Format your response as a JSON object with the following structure:
+{{
+    "recommendation": "your brief recommendation on best travel option",
+    "estimated_total_cost": "estimated range for travel + 3 days accommodation"
+}}
+
+Only respond with a valid JSON. Do not include any other text, explanations, or invalid characters.
+"""
+
+# Placeholder values used when a section could not be generated
+DEFAULT_DESTINATION_INFO = {
+    "weather": "Weather information unavailable",
+    "attractions": [],
+    "accommodations": [],
+    "local_transport": []
+}
+DEFAULT_RECOMMENDATION = "Recommendation unavailable"
+DEFAULT_TOTAL_COST = "N/A"
+
+# Extract (and if needed repair) the JSON body of a section response
+def parse_section(text):
+    return extract_json(text)[0]
+
+# Ask one section prompt with an output limit sized for that section
+async def _ask(llm, prompt, budget):
+    llm = with_output_budget(llm, OUTPUT_BUDGETS[budget])
+    prompt = prepare_prompt(prompt)
+    with span("llm.section", section=budget):
+        response = await get_resilient_caller("section").call_async(
+            lambda: llm.ainvoke(prompt), estimate_tokens(prompt) + OUTPUT_BUDGETS[budget]
+        )
+    return parse_section(response.content)
+
+async def _transport_section(llm, inputs, mode):
+    options = await _ask(llm, TRANSPORT_PROMPT.format(**TRANSPORT_MODES[mode], **inputs), "transport")
+    if not isinstance(options, list):
+        raise ValueError(f"Expected a list of {mode}")
+    return ("travel_options", mode), options
+
+async def _destination_section(llm, inputs):
+    info = await _ask(llm, DESTINATION_PROMPT.format(**inputs), "destination_info")
+    return ("destination_info",), {**DEFAULT_DESTINATION_INFO, **info}
+
+# Accommodations alone, for when only the budget changed (see planner.find_reusable_sections)
+async def _accommodation_section(llm, inputs):
+    accommodations = await _ask(llm, ACCOMMODATION_PROMPT.format(**inputs), "accommodations")
+    if not isinstance(accommodations, list):
+        raise ValueError("Expected a list of accommodations")
+    return ("destination_info",), {"accommodations": accommodations}
+
+# Fields of each option the recommendation weighs; timetables and notes only add input tokens
+RECOMMENDATION_FIELDS = {"travel_options": ("name", "duration", "cost"), "accommodations": ("name", "type", "cost_per_night")}
+
+def _pick_fields(items, fields):
+    return [{field: item.get(field) for field in fields} if isinstance(item, dict) else item for item in items or []]
+
+async def _recommendation_section(llm, inputs, plan):
+    options = json.dumps({
+        "travel_options": {
+            mode: _pick_fields(options, RECOMMENDATION_FIELDS["travel_options"])
+            for mode, options in plan["travel_options"].items() if options
+        },
+        "accommodations": _pick_fields(plan["destination_info"]["accommodations"], RECOMMENDATION_FIELDS["accommodations"])
+    }, separators=(",", ":"))
+    summary = await _ask(llm, RECOMMENDATION_PROMPT.format(options=options, **inputs), "recommendation")
+    return summary["recommendation"], summary["estimated_total_cost"]
+
+# Run every section concurrently and report each one through on_section(path, value) as it completes.
+# A failed section falls back to an empty placeholder; its error is recorded instead of failing the plan.
+# Only the transport modes in `modes` (default: all) are requested; the others stay empty.
+# Returns (plan, errors) where plan has the same shape as the single-prompt response.
+async def plan_sections(llm, inputs, on_section, modes=None):
+    plan = {
+        "travel_options": {mode: [] for mode in TRANSPORT_MODES},
+        "destination_info": dict(DEFAULT_DESTINATION_INFO)
+    }
+    errors = {}
+
+    tasks = {
+        asyncio.create_task(_transport_section(llm, inputs, mode)): ("travel_options", mode)
+        for mode in (modes or TRANSPORT_MODES)
+    }
+    tasks[asyncio.create_task(_destination_section(llm, inputs))] = ("destination_info",)
+
+    pending = set(tasks)
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            path = tasks[task]
+            try:
+                path, value = task.result()
+            except Exception as e:
+                errors["/".join(path)] = str(e)
+                value = plan[path[0]][path[1]] if len(path) == 2 else plan[path[0]]
+
+            if path == ("destination_info",):
+                plan["destination_info"] = value
+                for name, item in value.items():
+                    on_section(("destination_info", name), item)
+                on_section(("destination_info",), value)
+            else:
+                plan["travel_options"][path[1]] = value
+                on_section(path, value)
+    on_section(("travel_options",), plan["travel_options"])
+
+    # The recommendation needs the other sections, so it runs last
+    try:
+        plan["recommendation"], plan["estimated_total_cost"] = await _recommendation_section(llm, inputs, plan)
+    except Exception as e:
+        errors["recommendation"] = str(e)
+        plan["recommendation"] = DEFAULT_RECOMMENDATION
+        plan["estimated_total_cost"] = DEFAULT_TOTAL_COST
+    on_section(("recommendation",), plan["recommendation"])
+    on_section(("estimated_total_cost",), plan["estimated_total_cost"])
+
+    return plan, errors
+
+# Re-request only the given missing sections of an otherwise usable plan.
+# `missing` holds schema paths such as ("travel_options", "trains") or ("destination_info", "weather").
+# Returns (plan, errors); sections that still fail get placeholders.
+async def fill_missing_sections(llm, inputs, plan, missing):
+    plan = dict(plan)
+    plan["travel_options"] = dict(plan.get("travel_options") or {})
+    destination_info = plan.get("destination_info")
+    plan["destination_info"] = dict(destination_info) if isinstance(destination_info, dict) else {}
+    errors = {}
+
+    requests = {
+        path: _transport_section(llm, inputs, path[1])
+        for path in missing if path[0] == "travel_options" and path[1] in TRANSPORT_MODES
+    }
+    destination_fields = {path for path in missing if path[0] == "destination_info"}
+    if destination_fields == {("destination_info", "accommodations")}:
+        requests[("destination_info",)] = _accommodation_section(llm, inputs)
+    elif destination_fields:
+        requests[("destination_info",)] = _destination_section(llm, inputs)
+
+    results = await asyncio.gather(*requests.values(), return_exceptions=True)
+    for requested, result in zip(requests, results):
+        if isinstance(result, Exception):
+            errors["/".join(requested)] = str(result)
+            continue
+        path, value = result
+        if path == ("destination_info",):
+            # Keep the fields that were already valid
+            for name, item in value.items():
+                if ("destination_info", name) in missing:
+                    plan["destination_info"][name] = item
+        else:
+            plan["travel_options"][path[1]] = value
+
+    for mode in TRANSPORT_MODES:
+        plan["travel_options"].setdefault(mode, [])
+    for name, default in DEFAULT_DESTINATION_INFO.items():
+        plan["destination_info"].setdefault(name, default)
+
+    if ("recommendation",) in missing or ("estimated_total_cost",) in missing:
+        try:
+            recommendation, total_cost = await _recommendation_section(llm, inputs, plan)
+            if ("recommendation",) in missing:
+                plan["recommendation"] = recommendation
+            if ("estimated_total_cost",) in missing:
+                plan["estimated_total_cost"] = total_cost
+        except Exception as e:
+            errors["recommendation"] = str(e)
+            plan.setdefault("recommendation", DEFAULT_RECOMMENDATION)
+            plan.setdefault("estimated_total_cost", DEFAULT_TOTAL_COST)
+
+    return plan, errors
+
+# Synchronous wrapper around fill_missing_sections
+def complete_plan(llm, inputs, plan, missing):
+    return asyncio.run(fill_missing_sections(llm, inputs, plan, missing))
+
+# Plan a trip with concurrent sub-queries and return (plan, errors)
+def plan_travel_parallel(llm, inputs, modes=None):
+    return asyncio.run(plan_sections(llm, inputs, lambda path, value: None, modes))
+
+# Same as plan_travel_parallel, but yields (path, value) pairs as sections complete,
+# then (("section_errors",), errors) and finally ((), plan).
+# The event loop runs on a worker thread so the caller can consume results synchronously.
+def stream_travel_parallel(llm, inputs, modes=None):
+    events = queue.Queue()
+    done = object()
+
+    def worker():
+        try:
+            plan, errors = asyncio.run(plan_sections(llm, inputs, lambda path, value: events.put((path, value)), modes))
+            events.put((("section_errors",), errors))
+            events.put(((), plan))
+        except Exception as e:
+            events.put(e)
+        finally:
+            events.put(done)
+
+    # The worker keeps the caller's scheduler session and priority (see scheduler.py)
+    context = contextvars.copy_context()
+    threading.Thread(target=context.run, args=(worker,), daemon=True).start()
+    while True:
+        event = events.get()
+        if event is done:
+            return
+        if isinstance(event, Exception):
+            raise event
+        yield event
@@ -0,0 +1,124 @@
+# places.py - Module for resolving free-text locations to canonical places
+import os
+import csv
+import bisect
+import threading
+import unicodedata
+from collections import namedtuple
+
+DEFAULT_GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "gazetteer.csv")
+
+Place = namedtuple("Place", ["id", "name", "country", "country_code"])
+
+# Punctuation that is dropped (abbreviations like "L.A.") or treated as a word break
+_DROPPED = str.maketrans("", "", ".'’")
+_SEPARATORS = str.maketrans({",": " ", "-": " ", "/": " ", "(": " ", ")": " "})
+
+# Fold a place name for matching: strip diacritics, case and punctuation, collapse whitespace
+def fold_place_name(text):
+    decomposed = unicodedata.normalize("NFKD", str(text))
+    without_marks = "".join(c for c in decomposed if not unicodedata.combining(c))
+    cleaned = without_marks.casefold().translate(_DROPPED).translate(_SEPARATORS)
+    return " ".join(cleaned.split())
+
+# Human-readable canonical name, e.g. "Paris, France"
+def display_name(place):
+    if place.name == place.country:
+        return place.name
+    return f"{place.name}, {place.country}"
+
+# Alias index over a gazetteer. Exact lookups are dict hits; prefix lookups bisect a
+# sorted list of folded names, so autocomplete is O(log n + k).
+class PlaceIndex:
+    def __init__(self):
+        self.places = {}
+        self._aliases = {}
+        self._sorted_keys = []
+        self._sorted_ids = []
+
+    def add(self, place, aliases=()):
+        self.places[place.id] = place
+        for alias in (place.name, display_name(place)) + tuple(aliases):
+            key = fold_place_name(alias)
+            # The first place to claim an alias keeps it
+            if key and key not in self._aliases:
+                self._aliases[key] = place.id
+                position = bisect.bisect_left(self._sorted_keys, key)
+                self._sorted_keys.insert(position, key)
+                self._sorted_ids.insert(position, place.id)
+
+    # Resolve free text to a Place, or None if it is not in the gazetteer
+    def resolve(self, text):
+        folded = fold_place_name(text)
+        if not folded:
+            return None
+        place_id = self._aliases.get(folded)
+        if place_id is not None:
+            return self.places[place_id]
+        
+        # Accept a trailing country qualifier ("Tokyo, JP", "Osaka Japan") only when it
+        # matches the place's own country, so "Paris, Texas" does not become Paris, France
+        words = folded.split()
+        for split in range(len(words) - 1, 0, -1):
+            place_id = self._aliases.get(" ".join(words[:split]))
+            if place_id is None:
+                continue
+            place = self.places[place_id]
+            qualifier = " ".join(words[split:])
+            if qualifier in (fold_place_name(place.country), fold_place_name(place.country_code)):
+                return place
+        return None
+
+    # Places whose name or alias starts with the given text, for autocomplete
+    def suggest(self, prefix, limit=5):
+        folded = fold_place_name(prefix)
+        if not folded:
+            return []
+        suggestions = []
+        position = bisect.bisect_left(self._sorted_keys, folded)
+        while position < len(self._sorted_keys) and self._sorted_keys[position].startswith(folded):
+            place = self.places[self._sorted_ids[position]]
+            if place not in suggestions:
+                suggestions.append(place)
+                if len(suggestions) >= limit:
+                    break
+            position += 1
+        return suggestions
+
+# Build an index from a gazetteer CSV with id, name, country, country_code and "|"-separated aliases
+def load_gazetteer(path=None):
+    index = PlaceIndex()
+    with open(path or DEFAULT_GAZETTEER_PATH, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            place = Place(row["id"], row["name"], row["country"], row["country_code"])
+            aliases = [alias for alias in (row.get("aliases") or "").split("|") if alias.strip()]
+            index.add(place, aliases)
+    return index
+
+_place_index = None
+_place_index_lock = threading.Lock()
+
+# Get the process-wide place index, loading the gazetteer on first use
+def get_place_index():
+    global _place_index
+    with _place_index_lock:
+        if _place_index is None:
+            path = os.getenv("GAZETTEER_PATH", DEFAULT_GAZETTEER_PATH)
+            _place_index = load_gazetteer(path) if os.path.exists(path) else PlaceIndex()
+        return _place_index
+
+def resolve_place(text):
+    return get_place_index().resolve(text)
+
+def suggest_places(prefix, limit=5):
+    return get_place_index().suggest(prefix, limit)
+
+# Canonical name for a location, or the trimmed input if it is not in the gazetteer
+def canonicalize_location(text):
+    place = resolve_place(text)
+    return display_name(place) if place else " ".join(str(text).split())
+
+# Key used for caching and dedup: the place id when known, otherwise the folded text
+def location_key(text):
+    place = resolve_place(text)
+    return place.id if place else fold_place_name(text)
@@ -0,0 +1,567 @@
+# planner.py - Module for the travel planning engine (no UI dependencies)
+import os
+
+from cache import TTLCache, get_response_cache, make_cache_key, normalize_value
+from json_stream import IncrementalJSONParser
+from json_extract import PLAN_SCHEMA, extract_json, find_missing_sections, get_path
+from concurrency import SingleFlight
+from places import canonicalize_location, location_key, resolve_place
+from resilience import collect_reports, get_resilient_caller, summarize_reports
+from tracing import span, timed_iter
+from pricing import annotate_prices, strip_prices
+from tokens import UsageMeter, estimate_tokens, get_token_ledger, plan_output_budget, prepare_prompt
+from request_log import get_request_log
+
+# Heavy modules (langchain, the Google GenAI client, and asyncio via parallel_planning)
+# are only imported when they are actually used, so importing this module stays cheap.
+
+# Bump whenever the travel prompt changes so cached plans from older prompts are not reused
+PROMPT_TEMPLATE_VERSION = "3"
+
+TRAVEL_PROMPT = """
+    You are a knowledgeable travel assistant that provides accurate and helpful travel information.
+    
+    Based on the following details, provide detailed travel options with estimated costs:
+    
+    Source: {source}
+    Destination: {destination}
+    Travel Date: {travel_date}
+    Travelers: {travelers}
+    Preferences: {preferences}
+    Budget Range: {budget}
+    
+    For each of the following transportation modes, provide available options, travel time, and estimated cost ranges per person:
+{transport_list}
+    
+    Additionally, provide:
+    - Brief weather information for the destination on the travel date
+    - Top 3 attractions at the destination
+    - 2-3 accommodation options within the specified budget
+    - Local transportation options at the destination
+    
+    Format your response as a properly formatted JSON object with the following structure:
+    {{
+        "travel_options": {{
+{transport_schema}
+        }},
+        "destination_info": {{
+            "weather": "weather description",
+            "attractions": ["attraction1", "attraction2", "attraction3"],
+            "accommodations": [
+                {{ "name": "hotel name", "type": "hotel/hostel/etc", "cost_per_night": "price", "location": "area" }}
+            ],
+            "local_transport": ["option1", "option2"]
+        }},
+        "recommendation": "your brief recommendation on best travel option",
+        "estimated_total_cost": "estimated range for travel + 3 days accommodation"
+    }}
+    
+    Only respond with a valid JSON. Do not include any other text, explanations, or invalid characters.
+    """
+
+# Transport modes covered by a plan, with their prompt label and example operator name
+TRANSPORT_LABELS = {
+    "flights": ("Flights", "Airline name"),
+    "trains": ("Trains", "Train operator"),
+    "buses": ("Buses", "Bus operator"),
+    "cabs": ("Cabs/Taxis", "Cab service")
+}
+
+# Transport modes worth asking for under each form preference
+PREFERENCE_MODES = {
+    "fastest": ("flights", "trains"),
+    "cheapest": ("trains", "buses"),
+    "most comfortable": ("flights", "trains", "cabs"),
+    "direct routes": ("flights", "trains", "cabs"),
+    "eco-friendly": ("trains", "buses"),
+    "luxury": ("flights", "cabs")
+}
+
+# Plan inputs each section depends on, following the section prompts in parallel_planning.py.
+# A section of one plan can be reused in the plan for other inputs when these are unchanged.
+# Transport costs are quoted per person, so the number of travelers only reaches the
+# recommendation, which weighs every other section. The budget picks the fare classes and
+# hotels, so it reaches the transport options and accommodations too.
+PLAN_INPUTS = ("source", "destination", "travel_date", "travelers", "preferences", "budget")
+SECTION_DEPENDENCIES = {
+    **{("travel_options", mode): ("source", "destination", "travel_date", "preferences", "budget") for mode in TRANSPORT_LABELS},
+    ("destination_info", "weather"): ("destination", "travel_date"),
+    ("destination_info", "attractions"): ("destination",),
+    ("destination_info", "accommodations"): ("destination", "travel_date", "budget"),
+    ("destination_info", "local_transport"): ("destination",),
+    ("recommendation",): PLAN_INPUTS,
+    ("estimated_total_cost",): PLAN_INPUTS
+}
+
+CURRENCY_SCHEMA = {
+    ("local_currency",): str,
+    ("exchange_rate",): str
+}
+
+# Currency info changes slowly, so one lookup per destination is shared by all sessions
+CURRENCY_CACHE_TTL = int(os.getenv("CURRENCY_CACHE_TTL", 12 * 60 * 60))
+_currency_cache = TTLCache(ttl=CURRENCY_CACHE_TTL)
+
+# Coalesce identical in-flight requests across sessions
+_plan_flights = SingleFlight()
+_currency_flights = SingleFlight()
+
+# Raised when a plan or lookup cannot be produced; `response` holds the raw model output if any
+class PlanningError(Exception):
+    def __init__(self, message, response=None):
+        super().__init__(message)
+        self.response = response
+
+# Get the shared Google GenAI LLM client for a purpose (see llm_clients.LLM_CONFIGS)
+def get_llm(purpose="planning"):
+    from llm_clients import get_llm_client
+
+    google_api_key = os.getenv("GOOGLE_API_KEY")
+    if not google_api_key:
+        raise PlanningError("Google API key not found. Please check your .env file.")
+    return get_llm_client(purpose, google_api_key)
+
+# Define the prompt template for travel planning
+def get_travel_prompt_template():
+    from langchain.prompts import PromptTemplate
+
+    return PromptTemplate(
+        input_variables=[
+            "source", "destination", "travel_date", "travelers", "preferences", "budget",
+            "transport_list", "transport_schema"
+        ],
+        template=TRAVEL_PROMPT
+    )
+
+# Build the LangChain chain used for single-prompt planning
+def build_travel_chain(llm=None):
+    from langchain.chains import LLMChain
+
+    return LLMChain(
+        llm=llm or get_llm(),
+        prompt=get_travel_prompt_template(),
+        verbose=False
+    )
+
+# Collect the form fields into the prompt inputs; known places are replaced by their canonical names
+def build_plan_inputs(source, destination, travel_date, travelers, preferences, budget):
+    return {
+        "source": canonicalize_location(source),
+        "destination": canonicalize_location(destination),
+        "travel_date": travel_date,
+        "travelers": travelers,
+        "preferences": preferences,
+        "budget": budget
+    }
+
+# Normalize request inputs for cache lookups (place aliases and preference order do not matter)
+def get_cache_inputs(inputs):
+    cache_inputs = dict(inputs)
+    cache_inputs["source"] = location_key(inputs["source"])
+    cache_inputs["destination"] = location_key(inputs["destination"])
+    cache_inputs["preferences"] = ", ".join(sorted(
+        p.strip().lower() for p in str(inputs["preferences"]).split(",") if p.strip()
+    ))
+    return cache_inputs
+
+# Transport modes relevant to the request's preferences. Unknown or no preferences ask for
+# every mode; TRAVEL_ADAPTIVE_MODES=false always asks for every mode.
+def select_transport_modes(inputs):
+    if os.getenv("TRAVEL_ADAPTIVE_MODES", "true").lower() != "true":
+        return list(TRANSPORT_LABELS)
+    preferences = [p.strip().lower() for p in str(inputs.get("preferences") or "").split(",") if p.strip()]
+    if not preferences or any(p not in PREFERENCE_MODES for p in preferences):
+        return list(TRANSPORT_LABELS)
+    wanted = {mode for p in preferences for mode in PREFERENCE_MODES[p]}
+    return [mode for mode in TRANSPORT_LABELS if mode in wanted]
+
+# Render the single-prompt plan request for the given transport modes
+def render_travel_prompt(chain, inputs, modes):
+    example = '{{ "name": "{}", "departure": "time", "arrival": "time", "duration": "hours", "cost": "price range", "notes": "any additional info" }}'
+    schema = []
+    for position, mode in enumerate(modes):
+        if position == 0:
+            schema.append(f'            "{mode}": [\n                {example.format(TRANSPORT_LABELS[mode][1])}\n            ]')
+        else:
+            schema.append(f'            "{mode}": [...]')
+    prompt = chain.prompt.format(
+        transport_list="\n".join(f"    {i}. {TRANSPORT_LABELS[mode][0]}" for i, mode in enumerate(modes, 1)),
+        transport_schema=",\n".join(schema),
+        **inputs
+    )
+    return prepare_prompt(prompt)
+
+# Resolve the planning mode: "single" (one prompt) or "parallel" (concurrent sub-queries)
+def get_planning_mode(mode=None):
+    mode = (mode or os.getenv("TRAVEL_PLANNING_MODE", "single")).lower()
+    return mode if mode in ("single", "parallel") else "single"
+
+# Cache key for a plan request; each mode has its own prompts and therefore its own version
+def get_plan_cache_key(inputs, mode):
+    if mode == "parallel":
+        from parallel_planning import PARALLEL_PROMPT_VERSION
+        version = f"parallel-{PARALLEL_PROMPT_VERSION}"
+    else:
+        version = PROMPT_TEMPLATE_VERSION
+    cache_inputs = get_cache_inputs(inputs)
+    cache_inputs["modes"] = ",".join(select_transport_modes(inputs))
+    return make_cache_key(cache_inputs, version)
+
+# Seconds since the plan for these inputs was cached, or None if it is not cached (not counted as a hit or miss)
+def get_plan_cache_age(inputs, mode=None):
+    return get_response_cache().age(get_plan_cache_key(inputs, get_planning_mode(mode)))
+
+# Log an interactive request so popular routes can be prefetched; background work is not logged
+def log_plan_request(inputs, mode, background, channel="app"):
+    request_log = get_request_log()
+    if request_log and not background:
+        request_log.record(inputs, mode, channel)
+
+# Key of a plan section: the normalized values of only the inputs it depends on
+def get_section_key(inputs, path):
+    cache_inputs = get_cache_inputs(inputs)
+    return tuple(cache_inputs[name] for name in SECTION_DEPENDENCIES[path])
+
+# Split a previous plan into the sections that still hold for new inputs and the ones
+# to request again. Returns (plan with the reusable sections, paths to request), or None
+# if no section can be reused. Modes the new inputs do not ask for are left empty, and
+# placeholders left by sections that failed are requested again.
+def find_reusable_sections(previous_inputs, previous_plan, inputs):
+    from parallel_planning import DEFAULT_DESTINATION_INFO, DEFAULT_RECOMMENDATION, DEFAULT_TOTAL_COST
+    from trip_records import as_plan
+    
+    placeholders = {("destination_info", name): value for name, value in DEFAULT_DESTINATION_INFO.items()}
+    placeholders[("recommendation",)] = DEFAULT_RECOMMENDATION
+    placeholders[("estimated_total_cost",)] = DEFAULT_TOTAL_COST
+    
+    previous_plan = as_plan(previous_plan)
+    if not isinstance(previous_plan, dict):
+        return None
+    previous_plan = strip_prices(previous_plan)
+    modes = select_transport_modes(inputs)
+    previous_modes = select_transport_modes(previous_inputs)
+    plan = {"travel_options": {}, "destination_info": {}}
+    reused = []
+    missing = []
+    for path, expected in PLAN_SCHEMA.items():
+        if path[0] == "travel_options" and path[1] not in modes:
+            plan["travel_options"][path[1]] = []
+            continue
+        value = get_path(previous_plan, path)
+        if (
+            isinstance(value, expected)
+            and get_section_key(previous_inputs, path) == get_section_key(inputs, path)
+            and (path[0] != "travel_options" or path[1] in previous_modes)
+            and value != placeholders.get(path)
+        ):
+            if len(path) == 2:
+                plan[path[0]][path[1]] = value
+            else:
+                plan[path[0]] = value
+            reused.append(path)
+        else:
+            missing.append(path)
+    if not reused:
+        return None
+    return plan, missing
+
+# Extract and repair the plan JSON from a model response
+def parse_plan_response(response):
+    try:
+        with span("parse.plan"):
+            plan, _ = extract_json(response)
+    except ValueError as e:
+        raise PlanningError(str(e), response) from e
+    if not isinstance(plan, dict):
+        raise PlanningError("The response is not a travel plan", response)
+    return plan
+
+# Re-request only the sections that are missing or malformed; returns (plan, section_errors).
+# Transport modes outside `modes` were not asked for and are left empty.
+def complete_missing_sections(inputs, plan, modes=None, meter=None):
+    modes = modes or list(TRANSPORT_LABELS)
+    if isinstance(plan.get("travel_options"), dict):
+        for mode in TRANSPORT_LABELS:
+            if mode not in modes:
+                plan["travel_options"].setdefault(mode, [])
+    missing = [
+        path for path in find_missing_sections(plan)
+        if path[0] != "travel_options" or path[1] in modes
+    ]
+    if not missing:
+        return plan, {}
+    from parallel_planning import complete_plan
+    llm = get_llm("section")
+    return complete_plan(meter.wrap(llm) if meter else llm, inputs, plan, missing)
+
+# Attach the token usage of a freshly generated plan and add it to the per-route ledger
+def record_token_usage(inputs, plan, meter, mode):
+    usage = meter.summary()
+    plan["token_usage"] = usage
+    get_token_ledger().record(f"{inputs['source']} -> {inputs['destination']}", usage, mode)
+
+# Plan a trip and return (plan, section_errors).
+# section_errors is only non-empty in parallel mode, when some sections fell back to placeholders.
+# Identical requests that arrive while one is already running wait for it instead of calling the model.
+# background=True marks work such as prefetching that does not come from a user, and
+# `channel` tags the request in the request log ("batch" for batch_plan.py).
+# previous=(inputs, plan) of the plan being revised: only the sections whose inputs changed
+# are requested again (see find_reusable_sections). If no input changed, the previous plan
+# is returned as is, without a model call.
+# A generated plan's "resilience" entry counts the retries, timeouts, hedges and circuit
+# rejections of the model calls made for it (see resilience.summarize_reports).
+def plan_trip(inputs, chain, mode=None, background=False, previous=None, channel="app"):
+    mode = get_planning_mode(mode)
+    log_plan_request(inputs, mode, background, channel)
+    
+    # Serve repeated routes from the shared cache
+    cache = get_response_cache()
+    cache_key = get_plan_cache_key(inputs, mode)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached, {}
+    
+    return _plan_flights.do(cache_key, lambda: _generate_plan(inputs, chain, mode, cache, cache_key, previous))
+
+def _generate_plan(inputs, chain, mode, cache, cache_key, previous=None):
+    # Another caller may have finished the same plan between our cache check and now;
+    # plan_trip already counted this lookup
+    cached = cache.get(cache_key, count=False)
+    if cached is not None:
+        return cached, {}
+    
+    with collect_reports() as reports:
+        plan, errors = _build_plan(inputs, chain, mode, cache, cache_key, previous)
+    plan["resilience"] = summarize_reports(reports)
+    return plan, errors
+
+def _build_plan(inputs, chain, mode, cache, cache_key, previous):
+    reusable = find_reusable_sections(*previous, inputs) if previous is not None else None
+    if reusable is not None:
+        return _replan(inputs, *reusable, cache)
+    
+    modes = select_transport_modes(inputs)
+    meter = UsageMeter()
+    if mode == "parallel":
+        from parallel_planning import plan_travel_parallel
+        plan, errors = plan_travel_parallel(meter.wrap(get_llm("section")), inputs, modes)
+        plan = annotate_prices(plan)
+        record_token_usage(inputs, plan, meter, mode)
+        # Degraded plans are returned but never cached
+        if not errors:
+            cache.set(cache_key, plan)
+        return plan, errors
+    
+    from llm_clients import with_output_budget
+    llm = meter.wrap(with_output_budget(chain.llm, plan_output_budget(modes)))
+    prompt = render_travel_prompt(chain, inputs, modes)
+    tokens = estimate_tokens(prompt) + plan_output_budget(modes)
+    with span("llm.plan", modes=len(modes)):
+        response = get_resilient_caller("planning").call(lambda: llm.invoke(prompt), tokens).content
+    plan, errors = complete_missing_sections(inputs, parse_plan_response(response), modes, meter)
+    plan = annotate_prices(plan)
+    record_token_usage(inputs, plan, meter, mode)
+    if not errors:
+        cache.set(cache_key, plan)
+    return plan, errors
+
+# Yield the (path, value) section events of a finished plan
+def iter_plan_sections(plan):
+    for section, value in plan.items():
+        if isinstance(value, dict):
+            for name, item in value.items():
+                yield (section, name), item
+        yield (section,), value
+
+# Stream a plan section by section.
+# Yields (path, value) pairs as each part of the plan completes, e.g. (("travel_options", "flights"), [...]),
+# then (("plan_source",), source), (("section_errors",), errors) and finally ((), plan) with the full plan.
+# source is "generated" for a plan made for this request, "cached" when it came from the response
+# cache, "shared" when it came from an identical in-flight request and "previous" when nothing
+# changed since the previous plan; only "generated" plans were paid for by this request.
+# Callers that join an identical in-flight request get its sections replayed once it finishes.
+# With previous=(inputs, plan), the reused sections of that plan come first (see plan_trip).
+def stream_plan(inputs, chain, mode=None, background=False, previous=None):
+    mode = get_planning_mode(mode)
+    log_plan_request(inputs, mode, background)
+    
+    cache = get_response_cache()
+    cache_key = get_plan_cache_key(inputs, mode)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        plan, errors, source = cached, {}, "cached"
+        yield from iter_plan_sections(plan)
+    else:
+        call, is_leader = _plan_flights.begin(cache_key)
+        if is_leader:
+            try:
+                with collect_reports() as reports:
+                    reusable = find_reusable_sections(*previous, inputs) if previous is not None else None
+                    source = "previous" if reusable is not None and not reusable[1] else "generated"
+                    if reusable is not None:
+                        plan, errors = yield from _stream_replan(inputs, *reusable, cache)
+                    else:
+                        plan, errors = yield from _stream_sections(inputs, chain, mode, cache, cache_key)
+                plan["resilience"] = summarize_reports(reports)
+            except BaseException as e:
+                # A closed generator (e.g. an interrupted rerun) must still release the waiters
+                error = PlanningError("The request was cancelled") if isinstance(e, GeneratorExit) else e
+                _plan_flights.finish(cache_key, call, error=error)
+                raise
+            _plan_flights.finish(cache_key, call, result=(plan, errors))
+        else:
+            plan, errors = call.wait()
+            source = "shared"
+            yield from iter_plan_sections(plan)
+    
+    yield ("plan_source",), source
+    yield ("section_errors",), errors
+    yield (), plan
+
+# Generate a plan, yielding its sections as they complete; returns (plan, section_errors)
+def _stream_sections(inputs, chain, mode, cache, cache_key):
+    modes = select_transport_modes(inputs)
+    meter = UsageMeter()
+    if mode == "parallel":
+        from parallel_planning import stream_travel_parallel
+        plan, errors = None, {}
+        for path, value in stream_travel_parallel(meter.wrap(get_llm("section")), inputs, modes):
+            if path == ("section_errors",):
+                errors = value
+            elif path == ():
+                plan = value
+            else:
+                yield path, value
+        plan = annotate_prices(plan)
+        record_token_usage(inputs, plan, meter, mode)
+        if not errors:
+            cache.set(cache_key, plan)
+        return plan, errors
+    
+    from llm_clients import with_output_budget
+    llm = meter.wrap(with_output_budget(chain.llm, plan_output_budget(modes)))
+    parser = IncrementalJSONParser()
+    emitted = set()
+    chunks = []
+    prompt = render_travel_prompt(chain, inputs, modes)
+    tokens = estimate_tokens(prompt) + plan_output_budget(modes)
+    # Deadline and retries apply to the stream; retries stop once the first chunk has arrived
+    stream = get_resilient_caller("planning").call_stream(lambda: llm.stream(prompt), tokens)
+    for chunk in timed_iter("llm.plan_stream", stream, modes=len(modes)):
+        chunks.append(chunk.content)
+        if parser is None:
+            continue
+        try:
+            for path, value in parser.feed(chunk.content):
+                emitted.add(path)
+                yield path, value
+        except ValueError:
+            # A malformed section; stop streaming sections and repair the full response at the end
+            parser = None
+    
+    # Repair truncation or malformed JSON, then re-request only what is still missing
+    plan, errors = complete_missing_sections(inputs, parse_plan_response("".join(chunks)), modes, meter)
+    plan = annotate_prices(plan)
+    record_token_usage(inputs, plan, meter, mode)
+    for path, value in iter_plan_sections(plan):
+        if path not in emitted:
+            yield path, value
+    
+    if not errors:
+        cache.set(cache_key, plan)
+    return plan, errors
+
+# Request the missing sections of a partly reused plan and merge them in; returns (plan, section_errors).
+# The new sections come from the section prompts, so the result is cached under the parallel
+# mode key, never as single-prompt output; a plan with nothing regenerated is not cached.
+def _replan(inputs, plan, missing, cache):
+    errors = {}
+    if missing:
+        from parallel_planning import complete_plan
+        meter = UsageMeter()
+        with span("plan.incremental", sections=len(missing)):
+            plan, errors = complete_plan(meter.wrap(get_llm("section")), inputs, plan, missing)
+        record_token_usage(inputs, plan, meter, "incremental")
+    plan = annotate_prices(plan)
+    if missing and not errors:
+        cache.set(get_plan_cache_key(inputs, "parallel"), plan)
+    return plan, errors
+
+# Yield the reused sections right away, then the requested ones; returns (plan, section_errors)
+def _stream_replan(inputs, plan, missing, cache):
+    emitted = set()
+    for path, value in iter_plan_sections(plan):
+        if path in PLAN_SCHEMA and path not in missing:
+            emitted.add(path)
+            yield path, value
+    plan, errors = _replan(inputs, plan, missing, cache)
+    for path, value in iter_plan_sections(plan):
+        if path not in emitted:
+            yield path, value
+    return plan, errors
+
+# Fetch currency info for a destination from the LLM
+def fetch_currency_info(destination):
+    # Simple currency conversion prompt
+    currency_prompt = f"""
+    Provide the current currency used in {destination} and the approximate exchange rate from USD.
+    Format as JSON: {{"local_currency": "Currency Name (CODE)", "exchange_rate": "1 USD = X Local Currency"}}
+    """
+    
+    from llm_clients import LLM_CONFIGS
+    meter = UsageMeter()
+    llm = meter.wrap(get_llm("currency"))
+    currency_prompt = prepare_prompt(currency_prompt)
+    with span("llm.currency"):
+        currency_info = get_resilient_caller("currency").call(
+            lambda: llm.invoke(currency_prompt),
+            estimate_tokens(currency_prompt) + LLM_CONFIGS["currency"]["max_output_tokens"]
+        ).content
+    get_token_ledger().record(f"currency: {destination}", meter.summary(), "currency")
+    
+    # Parse JSON response
+    try:
+        data, _ = extract_json(currency_info)
+    except ValueError as e:
+        raise PlanningError(str(e), currency_info) from e
+    if find_missing_sections(data, CURRENCY_SCHEMA):
+        raise PlanningError("Incomplete currency information", currency_info)
+    return data
+
+# Currency info for a destination. Known places are answered from the offline exchange-rate
+# table; others are asked of the model and served from the process-wide cache, with
+# concurrent cold lookups for the same destination sharing one model call.
+# Stale entries are refreshed in the background at background priority.
+def get_currency_info(destination):
+    from exchange_rates import get_exchange_rates
+    
+    with span("currency.lookup"):
+        info = get_exchange_rates().currency_info(destination)
+        if info is not None:
+            return info
+        key = get_currency_cache_key(destination)
+        load = lambda: _currency_flights.do(key, lambda: fetch_currency_info(destination))
+        return _currency_cache.get_or_load(key, load, lambda: _in_background(load))
+
+# Run a refresh nobody is waiting for at background priority, behind interactive calls
+def _in_background(load):
+    from scheduler import background_work
+    
+    with background_work():
+        return load()
+
+# Every known place in the same country shares one currency entry
+def get_currency_cache_key(destination):
+    place = resolve_place(destination)
+    return f"country:{place.country_code}" if place else normalize_value(destination)
+
+# Seconds since the currency info for a destination was cached, or None if it is not cached
+def get_currency_cache_age(destination):
+    return _currency_cache.age(get_currency_cache_key(destination))
+
+# Fetch the currency info for a destination now and store it, replacing any cached entry
+def refresh_currency_info(destination):
+    key = get_currency_cache_key(destination)
+    data = _currency_flights.do(key, lambda: fetch_currency_info(destination))
+    _currency_cache.set(key, data)
+    return data
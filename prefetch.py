@@ -0,0 +1,233 @@
+# prefetch.py - Module for warming the plan and currency caches for popular routes off-peak
+#
+# Usage: python prefetch.py [--once] [--dry-run]
+#
+# Popular requests are mined from the request log (every plan request, weighted by recency)
+# and from the trips saved by all users. During the off-peak hours the prefetcher generates
+# plans and currency info for the most popular ones that are not cached yet, within a token
+# budget per day and a request rate, so peak-time requests are served from the cache.
+import os
+import sys
+import time
+import threading
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+from concurrency import RateLimiter
+from request_log import get_request_log
+from scheduler import background_work
+from tracing import span
+
+# The form defaults, used for saved trips whose preferences were not recorded
+DEFAULT_PROFILE = ("1", "Fastest", "Moderate")
+
+def _env_float(name, default):
+    return float(os.getenv(name, default))
+
+# Parse PREFETCH_HOURS such as "1-6" (01:00 to 05:59) or "22-5" (wraps past midnight)
+def parse_hours(text):
+    start, end = (int(part) for part in text.split("-"))
+    if start <= end:
+        return set(range(start, end))
+    return set(range(start, 24)) | set(range(0, end))
+
+# Rank request signatures (source, destination, travel_date, travelers, preferences, budget)
+# by popularity. Requests logged by the app (not batch runs) count with a weight that halves every `half_life_days`;
+# each saved trip counts once, with the most common preferences for its route.
+# Only travel dates from `today` to `today + horizon_days` are kept.
+def rank_candidates(log_entries, saved_routes, today, horizon_days=60, half_life_days=3.0, now=None):
+    now = now or time.time()
+    first_date, last_date = today.isoformat(), (today + timedelta(days=horizon_days)).isoformat()
+    scores = Counter()
+    profiles = {}
+    for entry in log_entries:
+        # Batch runs replay whole route lists and say nothing about what users ask for
+        if entry.get("channel", "app") != "app":
+            continue
+        route = (entry["source"], entry["destination"])
+        profile = (entry["travelers"], entry["preferences"], entry["budget"])
+        profiles.setdefault(route, Counter())[profile] += 1
+        if first_date <= entry["travel_date"] <= last_date:
+            age_days = max(0.0, now - entry["time"]) / 86400
+            scores[route + (entry["travel_date"],) + profile] += 0.5 ** (age_days / half_life_days)
+    for source, destination, travel_date, trips in saved_routes:
+        if first_date <= travel_date <= last_date:
+            route_profiles = profiles.get((source, destination))
+            profile = route_profiles.most_common(1)[0][0] if route_profiles else DEFAULT_PROFILE
+            scores[(source, destination, travel_date) + profile] += trips
+    return [signature for signature, _ in scores.most_common()]
+
+# Warms the caches for popular requests within a daily token budget and a request rate
+class Prefetcher:
+    def __init__(self, hours=None, interval=None, max_routes=None, token_budget=None,
+                 requests_per_minute=None, lookback_days=None, horizon_days=None, refresh_fraction=None):
+        self.hours = parse_hours(hours or os.getenv("PREFETCH_HOURS", "1-6"))
+        self.interval = interval if interval is not None else _env_float("PREFETCH_INTERVAL", 900)
+        self.max_routes = max_routes if max_routes is not None else int(os.getenv("PREFETCH_ROUTES", 20))
+        self.token_budget = token_budget if token_budget is not None else int(os.getenv("PREFETCH_TOKEN_BUDGET", 200000))
+        rate = requests_per_minute if requests_per_minute is not None else _env_float("PREFETCH_REQUESTS_PER_MINUTE", 6)
+        self.limiter = RateLimiter(rate, per=60.0, burst=1)
+        self.lookback_days = lookback_days if lookback_days is not None else _env_float("PREFETCH_LOOKBACK_DAYS", 14)
+        self.horizon_days = horizon_days if horizon_days is not None else int(os.getenv("PREFETCH_HORIZON_DAYS", 60))
+        # Currency entries older than this fraction of their TTL are refreshed before they go stale
+        self.refresh_fraction = refresh_fraction if refresh_fraction is not None else _env_float("PREFETCH_REFRESH_FRACTION", 0.8)
+        self.chain = None
+        self.mode = None
+        self._budget_day = None
+        self._tokens_used = 0
+        self._stats = Counter()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def is_off_peak(self, now=None):
+        return (now or datetime.now()).hour in self.hours
+
+    # Tokens left in today's budget
+    def tokens_left(self):
+        with self._lock:
+            today = date.today()
+            if self._budget_day != today:
+                self._budget_day, self._tokens_used = today, 0
+            return self.token_budget - self._tokens_used
+
+    def _spend(self, usage):
+        with self._lock:
+            self._tokens_used += (usage or {}).get("prompt_tokens", 0) + (usage or {}).get("completion_tokens", 0)
+
+    # The most popular upcoming requests, as plan inputs
+    def candidates(self):
+        import planner
+        from trip_store import get_trip_store
+
+        today = date.today()
+        request_log = get_request_log()
+        since = time.time() - self.lookback_days * 86400
+        log_entries = list(request_log.read(since)) if request_log else []
+        saved_routes = get_trip_store().list_popular_routes(today.isoformat(), self.max_routes * 5)
+        signatures = rank_candidates(log_entries, saved_routes, today, self.horizon_days)
+        return [planner.build_plan_inputs(*signature) for signature in signatures[:self.max_routes]]
+
+    def _is_fresh(self, age, ttl):
+        return age is not None and age < ttl * self.refresh_fraction
+
+    # Warm the caches for the current candidates; returns the run's counts
+    def run_once(self, dry_run=False):
+        import planner
+        from exchange_rates import get_exchange_rates
+
+        stats = Counter()
+        # Prefetch calls queue behind interactive plan requests
+        with span("prefetch.run"), background_work():
+            for inputs in self.candidates():
+                stats["candidates"] += 1
+                if self._stop.is_set():
+                    break
+                if self.tokens_left() <= 0:
+                    stats["over_budget"] += 1
+                    break
+                # A cached plan is served until it expires, so only uncached plans are generated
+                if planner.get_plan_cache_age(inputs, self.mode) is not None:
+                    stats["already_cached"] += 1
+                elif dry_run:
+                    stats["would_plan"] += 1
+                else:
+                    self.limiter.acquire()
+                    try:
+                        with span("prefetch.plan"):
+                            if self.chain is None:
+                                self.chain = planner.build_travel_chain()
+                            plan, _ = planner.plan_trip(inputs, self.chain, self.mode, background=True)
+                        self._spend(plan.get("token_usage"))
+                        stats["planned"] += 1
+                    except Exception:
+                        stats["failed"] += 1
+                # Destinations covered by the offline exchange-rate table never ask the model
+                if get_exchange_rates().currency_info(inputs["destination"]) is not None:
+                    continue
+                if not self._is_fresh(planner.get_currency_cache_age(inputs["destination"]), planner.CURRENCY_CACHE_TTL):
+                    if dry_run:
+                        stats["would_fetch_currency"] += 1
+                        continue
+                    self.limiter.acquire()
+                    try:
+                        with span("prefetch.currency"):
+                            planner.refresh_currency_info(inputs["destination"])
+                        stats["currency"] += 1
+                    except Exception:
+                        stats["failed"] += 1
+        with self._lock:
+            self._stats.update(stats)
+        return dict(stats)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, tokens_used=self._tokens_used, token_budget=self.token_budget)
+
+    # Run in a daemon thread, warming the caches every `interval` seconds during off-peak hours
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._loop, name="prefetch", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            if self.is_off_peak():
+                try:
+                    self.run_once()
+                except Exception:
+                    # A failed run (e.g. a missing API key) is retried at the next interval
+                    pass
+            self._stop.wait(self.interval)
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+# Get the process-wide prefetcher
+def get_prefetcher():
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = Prefetcher()
+        return _prefetcher
+
+# Start background prefetching once per process
+def start_prefetcher():
+    prefetcher = get_prefetcher()
+    prefetcher.start()
+    return prefetcher
+
+def main(argv=None):
+    import argparse
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Warm the plan and currency caches for popular routes.")
+    parser.add_argument("--once", action="store_true", help="run one pass now, ignoring the off-peak hours")
+    parser.add_argument("--dry-run", action="store_true", help="list the candidates without calling the model")
+    args = parser.parse_args(argv)
+
+    prefetcher = get_prefetcher()
+    if args.dry_run:
+        for inputs in prefetcher.candidates():
+            print(f"{inputs['source']} -> {inputs['destination']} on {inputs['travel_date']} "
+                  f"({inputs['travelers']}, {inputs['preferences']}, {inputs['budget']})")
+        print(prefetcher.run_once(dry_run=True))
+    elif args.once:
+        print(prefetcher.run_once())
+    else:
+        prefetcher.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            prefetcher.stop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
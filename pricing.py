@@ -0,0 +1,146 @@
+# pricing.py - Module for parsing free-text costs into structured prices
+import re
+
+# Currency symbols and words the model uses, mapped to ISO codes
+CURRENCY_SYMBOLS = {
+    "$": "USD", "us$": "USD", "€": "EUR", "£": "GBP", "¥": "JPY", "₹": "INR", "rs": "INR",
+    "inr": "INR", "rupees": "INR", "₩": "KRW", "฿": "THB", "a$": "AUD", "c$": "CAD",
+    "s$": "SGD", "hk$": "HKD", "r$": "BRL", "aed": "AED", "dirhams": "AED", "euros": "EUR",
+    "dollars": "USD", "pounds": "GBP", "yen": "JPY"
+}
+CURRENCY_CODES = {
+    "USD", "EUR", "GBP", "JPY", "INR", "AUD", "CAD", "CHF", "CNY", "SGD", "HKD", "AED", "THB",
+    "KRW", "MXN", "BRL", "ZAR", "NZD", "SEK", "NOK", "DKK", "TRY", "IDR", "MYR", "PHP", "VND", "EGP",
+    "ARS", "BDT", "COP", "CZK", "HUF", "KES", "LKR", "NPR", "PKR", "PLN", "QAR", "RUB", "TWD"
+}
+MULTIPLIERS = {"k": 1_000, "m": 1_000_000, "lakh": 100_000, "lakhs": 100_000}
+
+# A number with optional thousands separators and an optional k/m/lakh suffix
+_AMOUNT = re.compile(r"(\d[\d,]*(?:\.\d+)?)\s*(k|m|lakhs?)?(?![a-z])", re.IGNORECASE)
+_CURRENCY_WORD = re.compile(r"(?:[a-z]{1,2}\$|[a-z]{2,7})", re.IGNORECASE)
+_NEXT_WORD = re.compile(r"\s*([^\s\d]+)")
+RANGE_SEPARATORS = {"-", "–", "—", "to"}
+# Numbers followed by these words are not prices ("4 km", "2 nights for $300")
+UNIT_WORDS = {
+    "km", "kms", "mi", "miles", "hour", "hours", "hr", "hrs", "h", "min", "mins", "minutes",
+    "day", "days", "night", "nights", "people", "persons", "travelers", "stop", "stops", "%"
+}
+_SYMBOLS = str.maketrans("", "", "$€£¥₹₩฿.")
+
+def _is_currency_word(word):
+    return word.upper() in CURRENCY_CODES or word.lower() in CURRENCY_SYMBOLS
+
+# Whether the text between two amounts joins them into a range ("-", " to ", "-$", " - Rs. ")
+def _is_range_separator(between):
+    without_currency = _CURRENCY_WORD.sub(lambda m: "" if _is_currency_word(m.group()) else m.group(), between)
+    return without_currency.translate(_SYMBOLS).strip().lower() in RANGE_SEPARATORS
+
+def _currency_of(text):
+    for symbol in ("€", "£", "¥", "₹", "₩", "฿"):
+        if symbol in text:
+            return CURRENCY_SYMBOLS[symbol]
+    for word in _CURRENCY_WORD.findall(text):
+        if word.upper() in CURRENCY_CODES:
+            return word.upper()
+        if word.lower() in CURRENCY_SYMBOLS:
+            return CURRENCY_SYMBOLS[word.lower()]
+    return "USD" if "$" in text else None
+
+# Parse a cost such as "$1,200-$1,500", "INR 4k", "€50 to €80 per night" or "Free" into
+# {"min": float, "max": float, "currency": "USD" | None}. Returns None if there is no price.
+# Only the first amount or range is used, so "$120 (about 10,000 INR)" is 120 USD.
+def parse_price(text):
+    if text is None:
+        return None
+    if isinstance(text, (int, float)):
+        return {"min": float(text), "max": float(text), "currency": None}
+    text = str(text).strip()
+    if text.lower() in ("free", "included", "no cost"):
+        return {"min": 0.0, "max": 0.0, "currency": None}
+
+    matches = [match for match in _AMOUNT.finditer(text) if _next_word(text, match.end()) not in UNIT_WORDS]
+    if not matches:
+        return None
+    first = matches[0]
+    amounts = [_to_number(first)]
+    # A second amount counts as the upper bound only when joined to the first by a range separator
+    if len(matches) > 1 and _is_range_separator(text[first.end():matches[1].start()]):
+        amounts.append(_to_number(matches[1]))
+    # "4-5k" means 4,000-5,000
+    if len(amounts) == 2 and matches[1].group(2) and not first.group(2):
+        amounts[0] *= MULTIPLIERS[matches[1].group(2).lower()]
+    # The currency is read around the amounts used, including a trailing code ("1.2k-1.5k USD")
+    end = matches[len(amounts) - 1].end()
+    following = _NEXT_WORD.match(text, end)
+    region = text[:following.end() if following else end]
+    return {"min": min(amounts), "max": max(amounts), "currency": _currency_of(region)}
+
+def _next_word(text, position):
+    match = _NEXT_WORD.match(text, position)
+    return match.group(1).lower().strip(".,;:()") if match else None
+
+def _to_number(match):
+    value = float(match.group(1).replace(",", ""))
+    suffix = (match.group(2) or "").lower()
+    return value * MULTIPLIERS.get(suffix, 1)
+
+# Midpoint of a parsed price
+def price_midpoint(price):
+    return (price["min"] + price["max"]) / 2
+
+# Return a copy of the plan with a parsed "price" next to every cost string, so views and
+# history never re-parse. Plans that already carry prices are returned unchanged.
+def annotate_prices(plan):
+    if not isinstance(plan, dict) or has_prices(plan):
+        return plan
+    plan = dict(plan)
+    travel_options = plan.get("travel_options")
+    if isinstance(travel_options, dict):
+        plan["travel_options"] = {
+            mode: [_with_price(option, "cost") for option in options] if isinstance(options, list) else options
+            for mode, options in travel_options.items()
+        }
+    destination_info = plan.get("destination_info")
+    if isinstance(destination_info, dict) and isinstance(destination_info.get("accommodations"), list):
+        plan["destination_info"] = dict(
+            destination_info,
+            accommodations=[_with_price(item, "cost_per_night") for item in destination_info["accommodations"]]
+        )
+    plan["estimated_total_price"] = parse_price(plan.get("estimated_total_cost"))
+    return plan
+
+# Return a copy of the plan without the parsed prices, e.g. to reuse some of its sections
+# in a new plan that annotate_prices will price again
+def strip_prices(plan):
+    plan = {key: value for key, value in plan.items() if key != "estimated_total_price"}
+    travel_options = plan.get("travel_options")
+    if isinstance(travel_options, dict):
+        plan["travel_options"] = {
+            mode: [_without_price(option) for option in options] if isinstance(options, list) else options
+            for mode, options in travel_options.items()
+        }
+    destination_info = plan.get("destination_info")
+    if isinstance(destination_info, dict) and isinstance(destination_info.get("accommodations"), list):
+        plan["destination_info"] = dict(
+            destination_info, accommodations=[_without_price(item) for item in destination_info["accommodations"]]
+        )
+    return plan
+
+def _without_price(item):
+    if not isinstance(item, dict):
+        return item
+    return {key: value for key, value in item.items() if key != "price"}
+
+def _with_price(item, field):
+    if not isinstance(item, dict):
+        return item
+    return dict(item, price=parse_price(item.get(field)))
+
+def has_prices(plan):
+    return isinstance(plan, dict) and "estimated_total_price" in plan
+
+# The parsed price of an option, parsing on the fly for plans saved before prices were stored
+def option_price(option, field="cost"):
+    if "price" in option:
+        return option["price"]
+    return parse_price(option.get(field))
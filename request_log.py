@@ -0,0 +1,58 @@
+# request_log.py - Module for the log of plan requests used to find popular routes
+import os
+import json
+import time
+import threading
+
+DEFAULT_REQUEST_LOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "request_log.jsonl")
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+
+REQUEST_FIELDS = ("source", "destination", "travel_date", "travelers", "preferences", "budget")
+
+# Append-only JSONL log of plan requests (cache hits included). When the file grows past
+# max_bytes it is rotated to "<path>.1", so at most two files are kept. Each entry's channel
+# says where the request came from: "app" for the web app, "batch" for batch_plan.py.
+class RequestLog:
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def record(self, inputs, mode="single", channel="app"):
+        entry = {"time": time.time(), "mode": mode, "channel": channel}
+        entry.update({field: str(inputs.get(field, "")) for field in REQUEST_FIELDS})
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            try:
+                if os.path.exists(self.path) and os.path.getsize(self.path) + len(line) > self.max_bytes:
+                    os.replace(self.path, self.path + ".1")
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+            except OSError:
+                pass
+
+    # Entries logged since the given timestamp, oldest first
+    def read(self, since=0.0):
+        for path in (self.path + ".1", self.path):
+            if not os.path.exists(path):
+                continue
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if entry.get("time", 0) >= since:
+                        yield entry
+
+_request_log = None
+_request_log_lock = threading.Lock()
+
+# Get the process-wide request log, or None if TRAVEL_REQUEST_LOG_PATH is set to ""
+def get_request_log():
+    global _request_log
+    with _request_log_lock:
+        if _request_log is None:
+            path = os.getenv("TRAVEL_REQUEST_LOG_PATH", DEFAULT_REQUEST_LOG_PATH)
+            _request_log = RequestLog(path, int(os.getenv("TRAVEL_REQUEST_LOG_MAX_BYTES", DEFAULT_MAX_BYTES))) if path else False
+        return _request_log or None
@@ -0,0 +1,498 @@
+# resilience.py - Module for deadlines, retries, circuit breaking and hedging around LLM calls
+import os
+import time
+import queue
+import random
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+# Error class names (from google.api_core, grpc, httpx, ...) that are worth retrying
+RETRYABLE_ERROR_NAMES = {
+    "ResourceExhausted", "ServiceUnavailable", "DeadlineExceeded", "InternalServerError",
+    "TooManyRequests", "GatewayTimeout", "BadGateway", "Aborted", "Unavailable",
+    "ConnectError", "ConnectTimeout", "ReadTimeout", "RemoteProtocolError"
+}
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+# Default policy per purpose (see llm_clients.LLM_CONFIGS); overridable through environment variables
+DEFAULT_POLICIES = {
+    "planning": {"deadline": 90.0, "max_retries": 2},
+    "section": {"deadline": 45.0, "max_retries": 2},
+    "currency": {"deadline": 20.0, "max_retries": 1}
+}
+
+# Calls abandoned at their deadline keep a worker thread until the upstream request returns.
+# Once this many are still running, no hedges are sent and timeouts are not retried, so a
+# stalled upstream cannot fill the shared pool (LLM_CALL_THREADS) with duplicates.
+MAX_ABANDONED_CALLS = int(os.getenv("LLM_MAX_ABANDONED_CALLS", 8))
+
+# Reports of the calls made inside a collect_reports() block
+_reports = contextvars.ContextVar("resilience_reports", default=None)
+
+class LLMTimeoutError(TimeoutError):
+    pass
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+# Whether an exception is a transient upstream failure
+def is_retryable(error):
+    if isinstance(error, (LLMTimeoutError, ConnectionError, TimeoutError)):
+        return True
+    for cls in type(error).__mro__:
+        if cls.__name__ in RETRYABLE_ERROR_NAMES:
+            return True
+    status = getattr(error, "code", None) or getattr(error, "status_code", None)
+    return isinstance(status, int) and status in RETRYABLE_STATUS_CODES
+
+# Rolling window of successful call latencies
+class LatencyTracker:
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    # Latency percentile (0-100), or None until enough samples have been seen
+    def percentile(self, pct, min_samples=20):
+        with self._lock:
+            if len(self._samples) < min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+# Opens after `failure_threshold` consecutive failures and rejects calls for `reset_timeout`
+# seconds; then lets a single trial call through (half-open) to decide whether to close again.
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+# Wraps calls for one purpose with a deadline, jittered exponential backoff on retryable
+# errors, a circuit breaker and optional hedging (a duplicate request fired once the first
+# has been running longer than the recent p95 latency; the first response wins).
+# With a scheduler (see scheduler.LLMScheduler) every call first waits for an admission
+# slot; time spent in the queue does not count against the deadline. A hedge takes a slot
+# and rate budget of its own, and is only sent if it can get one without waiting.
+class ResilientCaller:
+    def __init__(self, name, deadline=60.0, max_retries=2, base_delay=0.5, max_delay=8.0,
+                 hedge=False, hedge_percentile=95, hedge_min_delay=1.0, breaker=None, scheduler=None):
+        self.name = name
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.breaker = breaker or CircuitBreaker()
+        self.scheduler = scheduler
+        self.latency = LatencyTracker()
+        self.counters = {
+            "calls": 0, "successes": 0, "failures": 0, "retries": 0, "timeouts": 0,
+            "hedges": 0, "hedge_wins": 0, "circuit_rejections": 0, "abandoned": 0
+        }
+        self._lock = threading.Lock()
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    # The report of which policies triggered on a call goes to the enclosing collect_reports()
+    def _new_report(self):
+        report = {"attempts": 0, "retries": 0, "timed_out": False, "hedged": False,
+                  "hedge_won": False, "circuit_open": False, "latency": None}
+        reports = _reports.get()
+        if reports is not None:
+            reports.append(report)
+        self._count("calls")
+        return report
+
+    def _hedge_delay(self):
+        if not self.hedge or _abandoned_calls() >= MAX_ABANDONED_CALLS:
+            return None
+        p95 = self.latency.percentile(self.hedge_percentile)
+        return max(self.hedge_min_delay, p95) if p95 is not None else None
+
+    def _backoff(self, attempt):
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        # "Equal jitter": half fixed, half random, so concurrent retries spread out
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _check_circuit(self, report):
+        if not self.breaker.allow():
+            report["circuit_open"] = True
+            self._count("circuit_rejections")
+            raise CircuitOpenError(f"{self.name} requests are paused after repeated failures; try again shortly")
+
+    # Decide whether to retry after a failed attempt; returns the backoff delay, or None to give up
+    def _should_retry(self, error, attempt, deadline_at, report):
+        self.breaker.record_failure()
+        if attempt > self.max_retries or not is_retryable(error):
+            return None
+        if isinstance(error, LLMTimeoutError) and _abandoned_calls() >= MAX_ABANDONED_CALLS:
+            return None
+        delay = self._backoff(attempt)
+        if time.monotonic() + delay >= deadline_at:
+            return None
+        report["retries"] += 1
+        self._count("retries")
+        return delay
+
+    def _succeeded(self, report, started_at):
+        report["latency"] = time.monotonic() - started_at
+        self.latency.record(report["latency"])
+        self.breaker.record_success()
+        self._count("successes")
+
+    def _failed(self, report, error):
+        self._count("failures")
+        if isinstance(error, LLMTimeoutError):
+            report["timed_out"] = True
+            self._count("timeouts")
+
+    # Run fn() under the policy and return its result. `tokens` is the estimated prompt
+    # plus output size, charged against the scheduler's tokens-per-minute budget.
+    def call(self, fn, tokens=0):
+        if self.scheduler is None:
+            return self._call(fn, tokens)
+        with self.scheduler.slot(self.name, tokens):
+            return self._call(fn, tokens)
+
+    def _call(self, fn, tokens=0):
+        report = self._new_report()
+        deadline_at = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            self._check_circuit(report)
+            attempt += 1
+            report["attempts"] = attempt
+            started_at = time.monotonic()
+            try:
+                result = self._attempt(fn, deadline_at, report, tokens)
+            except Exception as e:
+                delay = self._should_retry(e, attempt, deadline_at, report)
+                if delay is None:
+                    self._failed(report, e)
+                    raise
+                time.sleep(delay)
+                continue
+            self._succeeded(report, started_at)
+            return result
+
+    def _attempt(self, fn, deadline_at, report, tokens=0):
+        from concurrent.futures import FIRST_COMPLETED, wait
+
+        executor = _get_executor()
+        futures = [executor.submit(fn)]
+        failed = set()
+        hedge_delay = self._hedge_delay()
+        last_error = None
+        try:
+            while True:
+                remaining = deadline_at - time.monotonic()
+                if remaining <= 0:
+                    raise LLMTimeoutError(f"{self.name} request exceeded its {self.deadline:g}s deadline")
+                timeout = remaining
+                if hedge_delay is not None and len(futures) == 1:
+                    timeout = min(remaining, hedge_delay)
+                done, _ = wait([f for f in futures if f not in failed], timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        if future is not futures[0]:
+                            report["hedge_won"] = True
+                            self._count("hedge_wins")
+                        return future.result()
+                    failed.add(future)
+                    last_error = future.exception()
+                if len(failed) == len(futures):
+                    raise last_error
+                if not done and hedge_delay is not None and len(futures) == 1:
+                    hedge = self._submit_hedge(executor, fn, tokens)
+                    if hedge is None:
+                        hedge_delay = None
+                        continue
+                    report["hedged"] = True
+                    self._count("hedges")
+                    futures.append(hedge)
+        finally:
+            # Losing or timed-out calls still queued are cancelled; running ones cannot be
+            # stopped and are counted until they return (see MAX_ABANDONED_CALLS)
+            for future in futures:
+                if not future.done() and not future.cancel():
+                    self._count("abandoned")
+                    _track_abandoned(future)
+
+    # Send a duplicate of fn() under its own scheduler slot, or return None if the scheduler
+    # has no slot or rate budget free right now or too many calls are already abandoned
+    def _submit_hedge(self, executor, fn, tokens):
+        if _abandoned_calls() >= MAX_ABANDONED_CALLS:
+            return None
+        if self.scheduler is None:
+            return executor.submit(fn)
+        if not self.scheduler.try_admit(self.name, tokens):
+            return None
+
+        def hedge():
+            started = time.monotonic()
+            try:
+                return fn()
+            finally:
+                self.scheduler.release(time.monotonic() - started)
+
+        return executor.submit(hedge)
+
+    # Iterate make_stream() under the policy. The deadline covers the whole stream; retries
+    # and the circuit breaker only apply until the first chunk arrives. Hedging is not used.
+    # The scheduler slot is held until the stream ends or is closed.
+    def call_stream(self, make_stream, tokens=0):
+        if self.scheduler is None:
+            yield from self._call_stream(make_stream)
+            return
+        with self.scheduler.slot(self.name, tokens):
+            yield from self._call_stream(make_stream)
+
+    def _call_stream(self, make_stream):
+        report = self._new_report()
+        deadline_at = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            self._check_circuit(report)
+            attempt += 1
+            report["attempts"] = attempt
+            started_at = time.monotonic()
+            chunks = self._stream_in_thread(make_stream)
+            received = False
+            try:
+                while True:
+                    remaining = deadline_at - time.monotonic()
+                    try:
+                        kind, value = chunks.get(timeout=max(0.0, remaining))
+                    except queue.Empty:
+                        raise LLMTimeoutError(f"{self.name} stream exceeded its {self.deadline:g}s deadline")
+                    if kind == "error":
+                        raise value
+                    if kind == "done":
+                        break
+                    received = True
+                    yield value
+            except Exception as e:
+                delay = None if received else self._should_retry(e, attempt, deadline_at, report)
+                if delay is None:
+                    if received:
+                        self.breaker.record_failure()
+                    self._failed(report, e)
+                    raise
+                time.sleep(delay)
+                continue
+            self._succeeded(report, started_at)
+            return
+
+    def _stream_in_thread(self, make_stream):
+        chunks = queue.Queue()
+
+        def pump():
+            try:
+                for chunk in make_stream():
+                    chunks.put(("chunk", chunk))
+                chunks.put(("done", None))
+            except Exception as e:
+                chunks.put(("error", e))
+
+        threading.Thread(target=pump, daemon=True).start()
+        return chunks
+
+    # Await make_coro() under the policy (for asyncio callers)
+    async def call_async(self, make_coro, tokens=0):
+        if self.scheduler is None:
+            return await self._call_async(make_coro, tokens)
+        async with self.scheduler.aslot(self.name, tokens):
+            return await self._call_async(make_coro, tokens)
+
+    async def _call_async(self, make_coro, tokens=0):
+        import asyncio
+
+        report = self._new_report()
+        deadline_at = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            self._check_circuit(report)
+            attempt += 1
+            report["attempts"] = attempt
+            started_at = time.monotonic()
+            try:
+                result = await self._attempt_async(make_coro, deadline_at, report, tokens)
+            except Exception as e:
+                delay = self._should_retry(e, attempt, deadline_at, report)
+                if delay is None:
+                    self._failed(report, e)
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            self._succeeded(report, started_at)
+            return result
+
+    async def _attempt_async(self, make_coro, deadline_at, report, tokens=0):
+        import asyncio
+
+        tasks = [asyncio.ensure_future(make_coro())]
+        failed = set()
+        hedge_delay = self._hedge_delay()
+        last_error = None
+        try:
+            while True:
+                remaining = deadline_at - time.monotonic()
+                if remaining <= 0:
+                    raise LLMTimeoutError(f"{self.name} request exceeded its {self.deadline:g}s deadline")
+                timeout = remaining
+                if hedge_delay is not None and len(tasks) == 1:
+                    timeout = min(remaining, hedge_delay)
+                done, _ = await asyncio.wait([t for t in tasks if t not in failed], timeout=timeout,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            report["hedge_won"] = True
+                            self._count("hedge_wins")
+                        return task.result()
+                    failed.add(task)
+                    last_error = task.exception()
+                if len(failed) == len(tasks):
+                    raise last_error
+                if not done and hedge_delay is not None and len(tasks) == 1:
+                    if self.scheduler is not None and not self.scheduler.try_admit(self.name, tokens):
+                        hedge_delay = None
+                        continue
+                    report["hedged"] = True
+                    self._count("hedges")
+                    tasks.append(asyncio.ensure_future(self._hedge_async(make_coro)))
+        finally:
+            # Unlike threads, losing or timed-out coroutines can be cancelled
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    # Await a hedge admitted with scheduler.try_admit, releasing its slot when it ends
+    async def _hedge_async(self, make_coro):
+        if self.scheduler is None:
+            return await make_coro()
+        started = time.monotonic()
+        try:
+            return await make_coro()
+        finally:
+            self.scheduler.release(time.monotonic() - started)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        stats["circuit"] = self.breaker.state
+        stats["p95_latency"] = self.latency.percentile(95, min_samples=1)
+        return stats
+
+# Collect the report of every call made in this block, including calls made from threads
+# and tasks started with a copy of the current context
+@contextmanager
+def collect_reports():
+    reports = []
+    token = _reports.set(reports)
+    try:
+        yield reports
+    finally:
+        _reports.reset(token)
+
+# Count how often each policy triggered across the collected reports
+def summarize_reports(reports):
+    return {
+        "calls": len(reports),
+        "retries": sum(report["retries"] for report in reports),
+        "timeouts": sum(report["timed_out"] for report in reports),
+        "hedges": sum(report["hedged"] for report in reports),
+        "hedge_wins": sum(report["hedge_won"] for report in reports),
+        "circuit_open": sum(report["circuit_open"] for report in reports)
+    }
+
+# Read the policy for a purpose, e.g. LLM_PLANNING_DEADLINE=60 or LLM_HEDGING=true
+def _policy_from_env(purpose):
+    policy = dict(DEFAULT_POLICIES.get(purpose, DEFAULT_POLICIES["planning"]))
+    prefix = f"LLM_{purpose.upper()}_"
+    policy["deadline"] = float(os.getenv(prefix + "DEADLINE", policy["deadline"]))
+    policy["max_retries"] = int(os.getenv(prefix + "MAX_RETRIES", policy["max_retries"]))
+    policy["hedge"] = os.getenv(prefix + "HEDGING", os.getenv("LLM_HEDGING", "false")).lower() == "true"
+    return policy
+
+_callers = {}
+_callers_lock = threading.Lock()
+_executor = None
+_abandoned = 0
+_abandoned_lock = threading.Lock()
+
+# Number of calls abandoned at their deadline or after losing a hedge that are still running
+def _abandoned_calls():
+    with _abandoned_lock:
+        return _abandoned
+
+def _track_abandoned(future):
+    global _abandoned
+    with _abandoned_lock:
+        _abandoned += 1
+    future.add_done_callback(_abandoned_done)
+
+def _abandoned_done(future):
+    global _abandoned
+    with _abandoned_lock:
+        _abandoned -= 1
+
+# Worker threads for blocking calls, so a stalled request can be abandoned at its deadline.
+# concurrent.futures is imported on first use; it pulls in logging and slows down startup.
+def _get_executor():
+    global _executor
+    with _callers_lock:
+        if _executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _executor = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_CALL_THREADS", 16)), thread_name_prefix="llm-call")
+        return _executor
+
+# Get the process-wide resilient caller for a purpose
+def get_resilient_caller(purpose):
+    from scheduler import get_scheduler
+
+    scheduler = get_scheduler()
+    with _callers_lock:
+        if purpose not in _callers:
+            _callers[purpose] = ResilientCaller(purpose, scheduler=scheduler, **_policy_from_env(purpose))
+        return _callers[purpose]
+
+# Counters for every purpose, showing which policies have triggered
+def get_resilience_stats():
+    with _callers_lock:
+        callers = dict(_callers)
+    return {purpose: caller.stats() for purpose, caller in callers.items()}
@@ -0,0 +1,316 @@
+# scheduler.py - Module for process-wide admission control of LLM requests
+#
+# Every model call takes a slot from the scheduler before it is sent (see
+# resilience.ResilientCaller). Slots are limited by a global concurrency cap and, when
+# configured, by request-per-minute and token-per-minute buckets. Waiting requests are
+# served interactive before background, and round-robin across sessions within a
+# priority, so one busy session cannot starve the others.
+import os
+import math
+import time
+import threading
+import contextvars
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+
+from concurrency import RateLimiter
+
+PRIORITIES = ("interactive", "background")
+
+# Priority of calls made outside a background_work() block. Currency lookups are shown on
+# the results page, so they wait with the plans; prefetched ones run under background_work().
+PURPOSE_PRIORITIES = {"planning": "interactive", "section": "interactive", "currency": "interactive"}
+
+# Seconds a request is assumed to hold its slot until real durations have been seen
+DEFAULT_SERVICE_TIME = 10.0
+
+# Calls without a session (batch jobs, the prefetcher) share one lane
+DEFAULT_SESSION = "shared"
+
+# Seconds between admission checks while nothing changes; rate-limit buckets refill
+# without a notification
+POLL_INTERVAL = 0.5
+
+_session = contextvars.ContextVar("llm_session", default=None)
+_priority = contextvars.ContextVar("llm_priority", default=None)
+_reporter = contextvars.ContextVar("llm_queue_reporter", default=None)
+
+# Raised when a request waited longer than the queue allows
+class SchedulerBusyError(RuntimeError):
+    pass
+
+# Attribute the calls made in this block to a session for fair queuing
+@contextmanager
+def session_scope(session_id):
+    token = _session.set(session_id)
+    try:
+        yield
+    finally:
+        _session.reset(token)
+
+# Run the calls made in this block at background priority
+@contextmanager
+def background_work():
+    token = _priority.set("background")
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+# Call report(ticket, position, estimated_wait_seconds) while a call made in this block is
+# queued, and report(ticket, 0, 0) once it is admitted or gives up
+@contextmanager
+def queue_reporter(report):
+    token = _reporter.set(report)
+    try:
+        yield
+    finally:
+        _reporter.reset(token)
+
+class Ticket:
+    __slots__ = ("session", "priority", "tokens", "enqueued_at", "admitted")
+
+    def __init__(self, session, priority, tokens):
+        self.session = session
+        self.priority = priority
+        self.tokens = tokens
+        self.enqueued_at = time.monotonic()
+        self.admitted = False
+
+class LLMScheduler:
+    def __init__(self, max_concurrent=None, requests_per_minute=None, tokens_per_minute=None, max_wait=None):
+        self.max_concurrent = max_concurrent or int(os.getenv("LLM_MAX_CONCURRENT", 8))
+        requests_per_minute = requests_per_minute if requests_per_minute is not None else float(os.getenv("LLM_REQUESTS_PER_MINUTE", 0))
+        tokens_per_minute = tokens_per_minute if tokens_per_minute is not None else float(os.getenv("LLM_TOKENS_PER_MINUTE", 0))
+        # A rate of 0 means unlimited
+        self.request_limiter = RateLimiter(requests_per_minute, per=60.0, burst=self.max_concurrent) if requests_per_minute else None
+        self.token_limiter = RateLimiter(tokens_per_minute, per=60.0) if tokens_per_minute else None
+        self.max_wait = max_wait if max_wait is not None else float(os.getenv("LLM_QUEUE_MAX_WAIT", 120))
+        # priority -> session -> tickets; sessions are served in OrderedDict order and
+        # rotated to the back after each admission
+        self._queues = {priority: OrderedDict() for priority in PRIORITIES}
+        self._active = 0
+        self._service_times = deque(maxlen=50)
+        self._counters = {"admitted": 0, "queued": 0, "rejected": 0, "max_depth": 0}
+        self._cond = threading.Condition()
+        # (event loop, asyncio.Event) of each queued asyncio call
+        self._async_waiters = set()
+
+    def _enqueue(self, purpose, tokens, session, priority):
+        session = session or _session.get() or DEFAULT_SESSION
+        priority = priority or _priority.get() or PURPOSE_PRIORITIES.get(purpose, "interactive")
+        ticket = Ticket(session, priority, tokens)
+        with self._cond:
+            self._queues[priority].setdefault(session, deque()).append(ticket)
+            self._counters["max_depth"] = max(self._counters["max_depth"], self._depth())
+        return ticket
+
+    def _head(self):
+        for priority in PRIORITIES:
+            sessions = self._queues[priority]
+            if sessions:
+                return next(iter(sessions.values()))[0]
+        return None
+
+    # Take a ticket off its queue; an admitted session moves to the back of the round-robin
+    def _remove(self, ticket, admitted):
+        sessions = self._queues[ticket.priority]
+        tickets = sessions[ticket.session]
+        tickets.remove(ticket)
+        if not tickets:
+            del sessions[ticket.session]
+        elif admitted:
+            sessions.move_to_end(ticket.session)
+
+    def _depth(self):
+        return sum(len(tickets) for sessions in self._queues.values() for tickets in sessions.values())
+
+    # Take the rate-limit tokens for a ticket, or none of them
+    def _take_rate(self, ticket):
+        if self.token_limiter and ticket.tokens:
+            if not self.token_limiter.try_acquire(min(ticket.tokens, self.token_limiter.capacity)):
+                return False
+        if self.request_limiter and not self.request_limiter.try_acquire():
+            if self.token_limiter and ticket.tokens:
+                self.token_limiter.refund(min(ticket.tokens, self.token_limiter.capacity))
+            return False
+        return True
+
+    # Requests that will be admitted before this ticket: every ticket of a higher priority,
+    # then, within its priority, the earlier round-robin rounds and the sessions served
+    # before its own in its round
+    def _ahead(self, ticket):
+        ahead = 0
+        for priority in PRIORITIES[:PRIORITIES.index(ticket.priority)]:
+            ahead += sum(len(tickets) for tickets in self._queues[priority].values())
+        sessions = self._queues[ticket.priority]
+        rank = sessions[ticket.session].index(ticket)
+        before_own = True
+        for session, tickets in sessions.items():
+            if session == ticket.session:
+                before_own = False
+            ahead += min(len(tickets), rank) + (before_own and len(tickets) > rank)
+        return ahead
+
+    def _mean_service_time(self):
+        return sum(self._service_times) / len(self._service_times) if self._service_times else DEFAULT_SERVICE_TIME
+
+    # (1-based queue position, estimated seconds until admission) of a waiting ticket
+    def _status(self, ticket):
+        ahead = self._ahead(ticket)
+        free = self.max_concurrent - self._active
+        rounds = max(0, math.ceil((ahead + 1 - free) / self.max_concurrent))
+        wait = rounds * self._mean_service_time()
+        if self.request_limiter:
+            wait = max(wait, (ahead + 1) * self.request_limiter.per / self.request_limiter.rate)
+        return ahead + 1, wait
+
+    # Admit the ticket if it is next and a slot and rate budget are free. Raises
+    # SchedulerBusyError once it has waited longer than max_wait. Call with the lock held.
+    def _poll(self, ticket):
+        if self._head() is ticket and self._active < self.max_concurrent and self._take_rate(ticket):
+            self._remove(ticket, admitted=True)
+            self._active += 1
+            self._counters["admitted"] += 1
+            ticket.admitted = True
+            # The next ticket may be admissible too
+            self._notify()
+            return True
+        waited = time.monotonic() - ticket.enqueued_at
+        if waited > self.max_wait:
+            self._abandon(ticket)
+            raise SchedulerBusyError(
+                f"The planner is busy; the request waited {waited:.0f}s in the queue. Please try again shortly."
+            )
+        return False
+
+    # Drop a ticket that will not be admitted (timed out, cancelled or its caller failed)
+    def _abandon(self, ticket):
+        with self._cond:
+            tickets = self._queues[ticket.priority].get(ticket.session)
+            if not ticket.admitted and tickets and ticket in tickets:
+                self._remove(ticket, admitted=False)
+                self._counters["rejected"] += 1
+                self._notify()
+
+    # Report the queue status when it changes; returns it. Call with the lock held.
+    def _report(self, ticket, report, last):
+        if last is None:
+            self._counters["queued"] += 1
+        status = self._status(ticket)
+        if report and status != last:
+            report(ticket, *status)
+        return status
+
+    # Block until the call may be sent; returns the admitted ticket
+    def admit(self, purpose="planning", tokens=0, session=None, priority=None, report=None):
+        report = report or _reporter.get()
+        ticket = self._enqueue(purpose, tokens, session, priority)
+        status = None
+        try:
+            with self._cond:
+                while not self._poll(ticket):
+                    status = self._report(ticket, report, status)
+                    self._cond.wait(timeout=POLL_INTERVAL)
+        finally:
+            self._abandon(ticket)
+            if status is not None and report:
+                report(ticket, 0, 0)
+        return ticket
+
+    # Wake every waiting call, threaded or asyncio. Call with the lock held.
+    def _notify(self):
+        self._cond.notify_all()
+        for loop, event in self._async_waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    # Async variant of admit(); waits on an asyncio.Event so the event loop keeps running
+    async def admit_async(self, purpose="planning", tokens=0, session=None, priority=None, report=None):
+        import asyncio
+
+        report = report or _reporter.get()
+        ticket = self._enqueue(purpose, tokens, session, priority)
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        status = None
+        try:
+            while True:
+                with self._cond:
+                    if self._poll(ticket):
+                        break
+                    status = self._report(ticket, report, status)
+                    waiter[1].clear()
+                    self._async_waiters.add(waiter)
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._cond:
+                self._async_waiters.discard(waiter)
+            self._abandon(ticket)
+            if status is not None and report:
+                report(ticket, 0, 0)
+        return ticket
+
+    # Admit a call only if it would not have to wait: nothing is queued and a slot and the
+    # rate budget are free. For optional calls such as hedges; release() it when done.
+    def try_admit(self, purpose="planning", tokens=0):
+        with self._cond:
+            if self._depth() or self._active >= self.max_concurrent or not self._take_rate(Ticket(None, None, tokens)):
+                return False
+            self._active += 1
+            self._counters["admitted"] += 1
+            return True
+
+    def release(self, held_for):
+        with self._cond:
+            self._active -= 1
+            self._service_times.append(held_for)
+            self._notify()
+
+    @contextmanager
+    def slot(self, purpose="planning", tokens=0):
+        self.admit(purpose, tokens)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    @asynccontextmanager
+    async def aslot(self, purpose="planning", tokens=0):
+        await self.admit_async(purpose, tokens)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    # Queue position and estimated wait a new interactive request would get right now
+    def preview(self):
+        with self._cond:
+            ahead = self._depth()
+            free = self.max_concurrent - self._active
+            rounds = max(0, math.ceil((ahead + 1 - free) / self.max_concurrent))
+            return ahead + 1 if rounds else 0, rounds * self._mean_service_time()
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._counters)
+            stats.update(
+                active=self._active, max_concurrent=self.max_concurrent,
+                waiting={priority: sum(len(t) for t in sessions.values()) for priority, sessions in self._queues.items()},
+                mean_service_time=self._mean_service_time()
+            )
+        return stats
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+# Get the process-wide scheduler, or None when LLM_SCHEDULER=false
+def get_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler() if os.getenv("LLM_SCHEDULER", "true").lower() == "true" else False
+        return _scheduler or None
@@ -1,68 +1,196 @@
 # storage.py - Module for data storage and history management
+import re
+import uuid
+import hashlib
 import streamlit as st
-import pandas as pd
 
-# Initialize session state for trip history if it doesn't exist
+from trip_store import get_trip_store
+from trip_records import as_plan, compress_plan
+from pricing import annotate_prices, has_prices
+
+# Trips are persisted in the trip store (see trip_store.py) under a per-user history key.
+# The key is a secret: it is kept in the session, never in the page URL, and shown on the
+# Trip History page so the user can restore the history in a later session.
+
+# Number of summary frames kept per session
+TRIP_FRAME_CACHE_SIZE = 8
+
+# Initialize the user id for trip history if it doesn't exist
 def init_trip_history():
-    if "trip_history" not in st.session_state:
-        st.session_state.trip_history = []
+    if "trip_user_id" not in st.session_state:
+        # Links bookmarked while the key was kept in the URL still open their history;
+        # the key is then taken out of the address bar
+        user_id = st.query_params.get("user")
+        if user_id and is_history_key(user_id):
+            del st.query_params["user"]
+        else:
+            user_id = uuid.uuid4().hex
+        st.session_state.trip_user_id = user_id
+        # Bumped on every save/delete so derived views know when to rebuild
+        st.session_state.trip_history_version = 0
+    return st.session_state.trip_user_id
 
-# Function to save trip to history
-def save_trip_to_history(trip_data, source, destination, travel_date):
-    # Initialize trip history if it doesn't exist
+def is_history_key(key):
+    return re.fullmatch(r"[0-9a-f]{32}", key or "") is not None
+
+# Function to switch the session to the history of a key from an earlier session
+def restore_trip_history(key):
+    key = key.strip().lower()
+    if not is_history_key(key):
+        st.error("That is not a valid history key.")
+        return False
     init_trip_history()
-    
-    # Generate a unique ID (use length + 1 or timestamp)
-    if st.session_state.trip_history:
-        new_id = max(trip["id"] for trip in st.session_state.trip_history) + 1
-    else:
-        new_id = 1
+    st.session_state.trip_user_id = key
+    for name in ("trip_labels", "trip_frames", "viewing_trip"):
+        st.session_state.pop(name, None)
+    _bump_history_version()
+    st.success("Your trip history has been restored.")
+    return True
+
+# Format the label shown for a trip in selection widgets
+def format_trip_label(trip):
+    return f"Trip {trip['id']}: {trip['source']} → {trip['destination']}"
+
+# Mark the history as changed
+def _bump_history_version():
+    st.session_state.trip_history_version += 1
+
+# Function to save trip to history (trip_data may be a plan dict or a compressed plan)
+def save_trip_to_history(trip_data, source, destination, travel_date):
+    user_id = init_trip_history()
+    plan = as_plan(trip_data)
+    # Store parsed prices with the trip so history views never re-parse cost strings
+    if not has_prices(plan):
+        plan = trip_data = annotate_prices(plan)
     
     # Create a trip summary
     trip_summary = {
-        "id": new_id,
         "source": source,
         "destination": destination,
         "date": travel_date,
-        "recommendation": trip_data.get("recommendation", "N/A"),
-        "estimated_cost": trip_data.get("estimated_total_cost", "N/A"),
-        "full_data": trip_data
+        "recommendation": plan.get("recommendation", "N/A"),
+        "estimated_cost": plan.get("estimated_total_cost", "N/A"),
+        "full_data": compress_plan(trip_data)
     }
     
-    # Append the new trip to session state
-    st.session_state.trip_history.append(trip_summary)
+    trip_id = get_trip_store().add_trip(user_id, trip_summary)
+    
+    # Keep the label index in step without rebuilding it
+    if "trip_labels" in st.session_state:
+        st.session_state.trip_labels[trip_id] = format_trip_label(dict(trip_summary, id=trip_id))
+    _bump_history_version()
+    
     st.success("Trip saved to history!")
-    return trip_summary["id"]
+    return trip_id
 
 # Function to get all saved trips
 def get_all_trips():
-    init_trip_history()
-    return st.session_state.trip_history
+    return get_trip_store().list_trips(init_trip_history())
+
+# Function to get one page of saved trips (summaries only unless include_full_data is set)
+def get_trips_page(offset=0, limit=20, destination=None, date_from=None, date_to=None, include_full_data=False):
+    return get_trip_store().list_trips(
+        init_trip_history(), offset, limit, destination, date_from, date_to, include_full_data
+    )
+
+# Function to count saved trips matching the given filters
+def count_trips(destination=None, date_from=None, date_to=None):
+    return get_trip_store().count_trips(init_trip_history(), destination, date_from, date_to)
+
+# Function to list the destinations present in the history
+def get_trip_destinations():
+    return get_trip_store().list_destinations(init_trip_history())
+
+# Function to get the id -> label index, built once per session and updated on save/delete
+def get_trip_labels():
+    user_id = init_trip_history()
+    if "trip_labels" not in st.session_state:
+        trips = get_trip_store().list_trips(user_id, include_full_data=False)
+        st.session_state.trip_labels = {t["id"]: format_trip_label(t) for t in trips}
+    return st.session_state.trip_labels
 
 # Function to get a specific trip by ID
 def get_trip_by_id(trip_id):
-    init_trip_history()
-    return next((t for t in st.session_state.trip_history if t["id"] == trip_id), None)
+    return get_trip_store().get_trip(init_trip_history(), trip_id)
 
 # Function to delete a trip by ID
 def delete_trip(trip_id):
-    init_trip_history()
-    st.session_state.trip_history = [t for t in st.session_state.trip_history if t["id"] != trip_id]
+    get_trip_store().delete_trip(init_trip_history(), trip_id)
+    if "trip_labels" in st.session_state:
+        st.session_state.trip_labels.pop(trip_id, None)
+    _bump_history_version()
     st.success(f"Trip {trip_id} deleted successfully!")
 
-# Function to get trips as DataFrame for display
-def get_trips_dataframe():
-    trips = get_all_trips()
+# Function to export the whole trip history as file bytes for download ("jsonl", "parquet" or "arrow").
+# The bytes are built chunk by chunk straight from the trip store and handed to the download
+# button; nothing is written to disk or kept in the session.
+def export_trip_history(file_format="jsonl"):
+    import io
+    from history_io import export_arrow, iter_jsonl_chunks
+    
+    user_id = init_trip_history()
+    out = io.BytesIO()
+    if file_format == "jsonl":
+        for lines in iter_jsonl_chunks(get_trip_store(), user_id):
+            out.write("".join(lines).encode("utf-8"))
+    else:
+        export_arrow(get_trip_store(), user_id, out, file_format=file_format)
+    return out.getvalue()
+
+# Function to import trips from an uploaded history file; returns the number of trips added
+def import_trip_history(uploaded_file):
+    from history_io import get_format, import_arrow, import_jsonl
+    
+    user_id = init_trip_history()
+    # Clicking "Import" again for the same upload would add every trip a second time
+    upload_hash = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+    if st.session_state.get("last_import_hash") == (user_id, upload_hash):
+        st.info("This file has already been imported.")
+        return 0
+    file_format = get_format(uploaded_file.name)
+    if file_format == "jsonl":
+        count = import_jsonl(get_trip_store(), user_id, uploaded_file)
+    else:
+        count = import_arrow(get_trip_store(), user_id, uploaded_file, file_format=file_format)
+    
+    st.session_state.last_import_hash = (user_id, upload_hash)
+    
+    # Imported trips get new ids, so the label index is rebuilt on next use
+    st.session_state.pop("trip_labels", None)
+    _bump_history_version()
+    st.success(f"Imported {count} trips into your history!")
+    return count
+
+# Function to get one page of trips as DataFrame for display.
+# Frames are cached per session and only rebuilt when the history or the requested page changes.
+def get_trips_dataframe(offset=0, limit=None, destination=None, date_from=None, date_to=None):
+    init_trip_history()
+    cache = st.session_state.setdefault("trip_frames", {})
+    key = (st.session_state.trip_history_version, offset, limit, destination, date_from, date_to)
+    if key in cache:
+        return cache[key]
+    
+    trips = get_trips_page(offset, limit, destination, date_from, date_to)
     
     if not trips:
-        return None
+        frame = None
+    else:
+        import pandas as pd
         
-    return pd.DataFrame([
-        {"ID": t["id"], 
-         "From": t["source"], 
-         "To": t["destination"], 
-         "Date": t["date"],
-         "Recommended": t["recommendation"].split(".")[0] if "." in t["recommendation"] else t["recommendation"][:50],
-         "Est. Cost": t["estimated_cost"]
-        } for t in trips
-    ])
+        frame = pd.DataFrame([
+            {"ID": t["id"], 
+             "From": t["source"], 
+             "To": t["destination"], 
+             "Date": t["date"],
+             "Recommended": t["recommendation"].split(".")[0] if "." in t["recommendation"] else t["recommendation"][:50],
+             "Est. Cost": t["estimated_cost"]
+            } for t in trips
+        ])
+    
+    # Frames for older versions can never be hit again
+    for stale_key in [k for k in cache if k[0] != key[0]]:
+        del cache[stale_key]
+    if len(cache) >= TRIP_FRAME_CACHE_SIZE:
+        del cache[next(iter(cache))]
+    cache[key] = frame
+    return frame
@@ -0,0 +1,15 @@
+# conftest.py - Shared setup for the tests: no API calls, and every cache, ledger and
+# store of a test run is kept out of the working tree
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_work_dir = tempfile.mkdtemp(prefix="travel-planner-tests-")
+os.environ["TRAVEL_CACHE_PATH"] = os.path.join(_work_dir, "cache.db")
+os.environ["TRIP_STORE_PATH"] = os.path.join(_work_dir, "trips.db")
+os.environ["TOKEN_LEDGER_PATH"] = ""
+os.environ["TRAVEL_REQUEST_LOG_PATH"] = ""
+os.environ["TRACE_EXPORT_PATH"] = ""
+os.environ.setdefault("GOOGLE_API_KEY", "test")
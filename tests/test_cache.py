@@ -0,0 +1,114 @@
+# test_cache.py - Tests for the response cache, the TTL cache and request coalescing
+import time
+import threading
+
+import pytest
+
+from cache import ResponseCache, TTLCache, make_cache_key
+from concurrency import SingleFlight
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+def test_cache_key_ignores_case_and_spacing():
+    assert make_cache_key({"city": " New  York"}, 1) == make_cache_key({"city": "new york"}, 1)
+    assert make_cache_key({"city": "new york"}, 1) != make_cache_key({"city": "new york"}, 2)
+
+def test_response_cache_counts_hits_and_misses(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.db"), ttl=60, max_entries=10)
+    assert cache.get("plan") is None
+    cache.set("plan", {"recommendation": "Fly"})
+    assert cache.get("plan") == {"recommendation": "Fly"}
+    # Re-checks and age lookups are not counted
+    assert cache.get("plan", count=False) == {"recommendation": "Fly"}
+    assert cache.age("plan") is not None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+def test_response_cache_drops_expired_entries(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.db"), ttl=60, max_entries=10)
+    cache.set("plan", {"recommendation": "Fly"})
+    cache.ttl = -1
+    assert cache.age("plan") is None
+    assert cache.get("plan") is None
+    assert cache.stats()["entries"] == 0
+
+def test_response_cache_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.db"), ttl=60, max_entries=2)
+    cache.set("a", 1)
+    time.sleep(0.01)
+    cache.set("b", 2)
+    time.sleep(0.01)
+    cache.get("a")
+    time.sleep(0.01)
+    cache.set("c", 3)
+    assert cache.get("b", count=False) is None
+    assert cache.get("a", count=False) == 1
+    assert cache.get("c", count=False) == 3
+
+def test_ttl_cache_serves_stale_values_while_refreshing():
+    cache = TTLCache(ttl=60)
+    cache._entries["rate"] = ("old", 0.0)
+    refreshed = threading.Event()
+
+    def refresh():
+        refreshed.set()
+        return "new"
+
+    assert cache.get_or_load("rate", lambda: "cold", refresh) == "old"
+    assert refreshed.wait(5)
+    wait_for(lambda: cache.get_or_load("rate", lambda: "cold") == "new")
+
+def test_single_flight_runs_concurrent_calls_once():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def work():
+        calls.append(1)
+        release.wait(5)
+        return {"plan": "shared"}
+
+    threads = [threading.Thread(target=lambda: results.append(flight.do("route", work))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    wait_for(lambda: flight.coalesced == 3)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(calls) == 1
+    assert flight.executed == 1
+    assert results == [{"plan": "shared"}] * 4
+    # The finished call is forgotten, so the next request runs again
+    flight.do("route", lambda: calls.append(1))
+    assert len(calls) == 2
+
+def test_single_flight_shares_the_leaders_error():
+    flight = SingleFlight()
+    release = threading.Event()
+    errors = []
+
+    def work():
+        release.wait(5)
+        raise ValueError("model failed")
+
+    def call():
+        try:
+            flight.do("route", work)
+        except ValueError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    wait_for(lambda: flight.coalesced == 2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert errors == ["model failed"] * 3
+    with pytest.raises(KeyError):
+        flight.do("route", lambda: {}["missing"])
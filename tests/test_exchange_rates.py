@@ -0,0 +1,22 @@
+# test_exchange_rates.py - Tests for converting plan prices between currencies
+from exchange_rates import convert_plan
+
+RATES = {"USD": 1.0, "EUR": 0.5, "INR": 80.0}
+
+def rate(source, target):
+    return RATES[target] / RATES[source]
+
+def test_unmarked_prices_use_the_plans_own_currency():
+    plan = {
+        "travel_options": {"flights": [{"name": "A", "cost": "INR 8,000"}, {"name": "B", "cost": "16000"}]},
+        "estimated_total_cost": "INR 40,000"
+    }
+    converted = convert_plan(plan, "USD", rate)
+    assert [option["cost"] for option in converted["travel_options"]["flights"]] == ["100 USD", "200 USD"]
+    assert "unconverted_prices" not in converted
+
+def test_unmarked_prices_without_a_plan_currency_are_left_as_quoted():
+    plan = {"travel_options": {"flights": [{"name": "A", "cost": "150"}, {"name": "B", "cost": "Free"}]}}
+    converted = convert_plan(plan, "EUR", rate)
+    assert [option["cost"] for option in converted["travel_options"]["flights"]] == ["150", "Free"]
+    assert converted["unconverted_prices"] == 1
@@ -0,0 +1,38 @@
+# test_fare_scan.py - Tests for batched fare scans
+import json
+import re
+
+from fare_scan import scan_fares
+
+class Message:
+    def __init__(self, content):
+        self.content = content
+        self.usage_metadata = None
+
+# Copy-only client like the pinned langchain-google-genai one; answers fare prompts
+class FareClient:
+    def __init__(self, max_output_tokens=2048):
+        self.max_output_tokens = max_output_tokens
+        self.budgets = []
+
+    def copy(self, update=None):
+        copied = FareClient(**(update or {}))
+        copied.budgets = self.budgets
+        return copied
+
+    async def ainvoke(self, prompt, **kwargs):
+        self.budgets.append(self.max_output_tokens)
+        dates = re.findall(r"^\d{4}-\d{2}-\d{2}$", str(prompt), re.MULTILINE)
+        return Message(json.dumps({day: {"trains": "$80-$120", "buses": "$30-$45"} for day in dates}))
+
+def test_scan_fares_budgets_and_meters_a_copy_only_client():
+    client = FareClient()
+    inputs = {"source": "Lyon", "destination": "Nice", "travel_date": "2031-03-02", "travelers": "1",
+              "preferences": "Cheapest", "budget": "Budget"}
+    dates = ["2031-03-01", "2031-03-02", "2031-03-03"]
+    scan = scan_fares(client, inputs, dates, ["trains", "buses"])
+    assert scan["errors"] == {}
+    assert sorted(scan["fares"]) == dates
+    assert scan["fares"]["2031-03-02"]["trains"]["price"]["min"] == 80
+    assert client.budgets and all(budget < 2048 for budget in client.budgets)
+    assert scan["token_usage"]["calls"] == len(client.budgets)
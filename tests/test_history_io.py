@@ -0,0 +1,50 @@
+# test_history_io.py - Tests for exporting and importing trip history
+import io
+import zlib
+
+import pytest
+
+from history_io import export_jsonl, import_arrow, import_jsonl
+from trip_records import compress_plan
+from trip_store import MemoryTripStore
+
+PLAN = {"recommendation": "Take the train", "travel_options": {"trains": [{"name": "Rail Test", "cost": "$40"}]}}
+
+def saved_store():
+    store = MemoryTripStore()
+    store.add_trips("alice", [{
+        "source": "Testville", "destination": "Replan City", "date": "2030-01-15",
+        "recommendation": "Take the train", "estimated_cost": "$200", "full_data": compress_plan(PLAN)
+    }])
+    return store
+
+def test_jsonl_round_trip():
+    out = io.StringIO()
+    assert export_jsonl(saved_store(), "alice", out) == 1
+    store = MemoryTripStore()
+    assert import_jsonl(store, "bob", io.StringIO(out.getvalue())) == 1
+    (summary, payload), = next(store.iter_trip_chunks("bob"))
+    assert summary["destination"] == "Replan City"
+    assert payload.load() == PLAN
+
+def test_jsonl_import_rejects_a_trip_without_a_route():
+    with pytest.raises(ValueError, match="line 1 has no destination"):
+        import_jsonl(MemoryTripStore(), "bob", ['{"source": "Testville", "date": "2030-01-15"}\n'])
+
+def test_arrow_import_checks_types_before_writing():
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.ipc as ipc
+
+    good = ["Testville", "Replan City", "2030-01-15", "ok", "$1", zlib.compress(b'{"a": 1}')]
+    table = pa.table({
+        "source": [good[0], good[0]], "destination": [good[1], good[1]], "date": [good[2], good[2]],
+        "recommendation": [good[3], good[3]], "estimated_cost": [good[4], good[4]],
+        "full_data": [good[5], b"not a plan"]
+    })
+    sink = io.BytesIO()
+    with ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    store = MemoryTripStore()
+    with pytest.raises(ValueError, match="row 2"):
+        import_arrow(store, "bob", io.BytesIO(sink.getvalue()), file_format="arrow")
+    assert store.count_trips("bob") == 0
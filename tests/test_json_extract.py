@@ -0,0 +1,39 @@
+# test_json_extract.py - Tests for extracting and repairing JSON from model output
+import pytest
+
+from json_extract import PLAN_SCHEMA, extract_json, find_missing_sections
+
+def test_clean_json_is_not_marked_repaired():
+    assert extract_json('{"a": [1, 2], "b": "x"}') == ({"a": [1, 2], "b": "x"}, False)
+
+def test_prose_and_markdown_fences_are_skipped():
+    text = 'Here is your plan:\n```json\n{"recommendation": "Fly"}\n```\nEnjoy!'
+    assert extract_json(text) == ({"recommendation": "Fly"}, False)
+
+def test_trailing_commas_and_smart_quotes_are_repaired():
+    value, repaired = extract_json('{“weather”: “Sunny”, "attractions": ["Pier",],}')
+    assert value == {"weather": "Sunny", "attractions": ["Pier"]}
+    assert repaired
+
+def test_raw_newlines_in_strings_are_escaped():
+    assert extract_json('{"weather": "Sunny\nthen rain"}') == ({"weather": "Sunny\nthen rain"}, True)
+
+def test_truncated_output_keeps_the_complete_members():
+    value, repaired = extract_json('{"travel_options": {"flights": [{"name": "Air"}], "trains": [{"name": "Ra')
+    assert value == {"travel_options": {"flights": [{"name": "Air"}], "trains": [{"name": "Ra"}]}}
+    assert repaired
+    # A key with no value is cut back to the last complete member
+    assert extract_json('{"recommendation": "Fly", "estimated_total_cost":') == ({"recommendation": "Fly"}, True)
+
+def test_text_without_json_raises():
+    with pytest.raises(ValueError):
+        extract_json("Sorry, I cannot help with that.")
+
+def test_find_missing_sections_checks_presence_and_type():
+    plan = {
+        "travel_options": {"flights": [], "trains": [], "buses": [], "cabs": "none"},
+        "destination_info": {"weather": "Mild", "attractions": [], "accommodations": [], "local_transport": []},
+        "recommendation": "Take the train"
+    }
+    assert find_missing_sections(plan) == [("travel_options", "cabs"), ("estimated_total_cost",)]
+    assert find_missing_sections(["not", "a", "plan"]) == list(PLAN_SCHEMA)
@@ -0,0 +1,19 @@
+# test_prefetch.py - Tests for ranking the routes to prefetch
+import time
+from datetime import date
+
+from prefetch import rank_candidates
+
+def entry(destination, channel=None):
+    logged = {
+        "time": time.time(), "mode": "single", "source": "Testville", "destination": destination,
+        "travel_date": "2030-01-20", "travelers": "2", "preferences": "fastest", "budget": "Budget"
+    }
+    if channel:
+        logged["channel"] = channel
+    return logged
+
+def test_batch_requests_do_not_count_towards_popularity():
+    log_entries = [entry("Batch City", "batch")] * 5 + [entry("App City", "app"), entry("Old Entry City")]
+    ranked = rank_candidates(log_entries, [], date(2030, 1, 1))
+    assert sorted(signature[1] for signature in ranked) == ["App City", "Old Entry City"]
@@ -0,0 +1,42 @@
+# test_pricing.py - Tests for parsing free-text costs into structured prices
+import pytest
+
+from pricing import annotate_prices, parse_price, strip_prices
+
+def price(low, high, currency):
+    return {"min": float(low), "max": float(high), "currency": currency}
+
+@pytest.mark.parametrize("text, expected", [
+    ("$120", price(120, 120, "USD")),
+    ("$1,200-$1,500", price(1200, 1500, "USD")),
+    ("€50 to €80 per night", price(50, 80, "EUR")),
+    ("INR 4k", price(4000, 4000, "INR")),
+    ("4-5k", price(4000, 5000, None)),
+    ("Rs. 2 lakh", price(200000, 200000, "INR")),
+    ("1.2k-1.5k USD", price(1200, 1500, "USD")),
+    ("£45 – £60", price(45, 60, "GBP")),
+    ("$120 (about 10,000 INR)", price(120, 120, "USD")),
+    ("Free", price(0, 0, None)),
+    (75, price(75, 75, None)),
+])
+def test_parse_price(text, expected):
+    assert parse_price(text) == expected
+
+def test_distances_and_durations_are_not_prices():
+    assert parse_price("2 nights for $300") == price(300, 300, "USD")
+    assert parse_price("About 4 km from the centre") is None
+    assert parse_price("Varies") is None
+    assert parse_price(None) is None
+
+def test_annotate_prices_round_trips_through_strip_prices():
+    plan = {
+        "travel_options": {"flights": [{"name": "Air", "cost": "$100-$150"}]},
+        "destination_info": {"accommodations": [{"name": "Inn", "cost_per_night": "€80"}]},
+        "estimated_total_cost": "$400"
+    }
+    annotated = annotate_prices(plan)
+    assert annotated["travel_options"]["flights"][0]["price"] == price(100, 150, "USD")
+    assert annotated["destination_info"]["accommodations"][0]["price"] == price(80, 80, "EUR")
+    assert annotated["estimated_total_price"] == price(400, 400, "USD")
+    assert annotate_prices(annotated) is annotated
+    assert strip_prices(annotated) == plan
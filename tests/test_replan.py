@@ -0,0 +1,75 @@
+# test_replan.py - Tests for revising a plan after a form change
+import planner
+from planner import find_reusable_sections
+from pricing import annotate_prices
+
+INPUTS = {
+    "source": "Testville", "destination": "Replan City", "travel_date": "2030-01-15",
+    "travelers": "2", "preferences": "fastest", "budget": "Budget"
+}
+
+PLAN = {
+    "travel_options": {
+        "flights": [{"name": "Air Test", "cost": "$120"}],
+        "trains": [{"name": "Rail Test", "cost": "$40"}],
+        "buses": [],
+        "cabs": []
+    },
+    "destination_info": {
+        "weather": "Mild",
+        "attractions": ["Old Town"],
+        "accommodations": [{"name": "Hostel", "type": "hostel", "cost_per_night": "$30", "location": "Centre"}],
+        "local_transport": ["Metro"]
+    },
+    "recommendation": "Take the train",
+    "estimated_total_cost": "$200"
+}
+
+def test_unchanged_inputs_return_the_previous_plan_without_a_model_call(monkeypatch):
+    def no_model(purpose="planning"):
+        raise AssertionError("the model was called")
+    monkeypatch.setattr(planner, "get_llm", no_model)
+    plan, errors = planner.plan_trip(dict(INPUTS), None, mode="parallel", previous=(dict(INPUTS), PLAN))
+    assert errors == {}
+    assert plan.pop("resilience")["calls"] == 0
+    assert plan == annotate_prices(PLAN)
+
+def test_budget_change_requests_transport_and_accommodations_again():
+    _, missing = find_reusable_sections(INPUTS, PLAN, dict(INPUTS, budget="Luxury"))
+    assert ("travel_options", "flights") in missing
+    assert ("travel_options", "trains") in missing
+    assert ("destination_info", "accommodations") in missing
+    assert ("destination_info", "weather") not in missing
+
+def test_single_mode_replan_is_not_cached_as_single_prompt_output(monkeypatch):
+    import parallel_planning
+    from cache import get_response_cache
+
+    def complete_plan(llm, inputs, plan, missing):
+        plan = dict(plan, recommendation="Fly instead", estimated_total_cost="$300")
+        return plan, {}
+
+    monkeypatch.setattr(planner, "get_llm", lambda purpose="planning": object())
+    monkeypatch.setattr(parallel_planning, "complete_plan", complete_plan)
+    inputs = dict(INPUTS, destination="Single Mode City", travelers="3")
+    previous = (dict(INPUTS, destination="Single Mode City"), PLAN)
+    plan, errors = planner.plan_trip(inputs, None, mode="single", previous=previous)
+    assert plan["recommendation"] == "Fly instead"
+    cache = get_response_cache()
+    assert cache.age(planner.get_plan_cache_key(inputs, "single")) is None
+    assert cache.age(planner.get_plan_cache_key(inputs, "parallel")) is not None
+
+def test_stream_reports_where_the_plan_came_from(monkeypatch):
+    import parallel_planning
+
+    def complete_plan(llm, inputs, plan, missing):
+        return dict(plan, recommendation="Take the bus"), {}
+
+    monkeypatch.setattr(planner, "get_llm", lambda purpose="planning": object())
+    monkeypatch.setattr(parallel_planning, "complete_plan", complete_plan)
+    inputs = dict(INPUTS, destination="Source City")
+    sources = lambda previous: [value for path, value in planner.stream_plan(
+        dict(inputs), None, mode="parallel", previous=previous) if path == ("plan_source",)]
+    assert sources((dict(inputs), PLAN)) == ["previous"]
+    assert sources((dict(inputs, travelers="1"), PLAN)) == ["generated"]
+    assert sources(None) == ["cached"]
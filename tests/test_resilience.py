@@ -0,0 +1,76 @@
+# test_resilience.py - Tests for hedging and deadlines around LLM calls
+import time
+import threading
+
+import pytest
+
+import resilience
+from resilience import LLMTimeoutError, ResilientCaller
+from scheduler import LLMScheduler
+
+# A call that is slow the first time and fast for every duplicate
+def slow_then_fast():
+    calls = []
+    lock = threading.Lock()
+
+    def fn():
+        with lock:
+            calls.append(time.monotonic())
+            first = len(calls) == 1
+        time.sleep(0.5 if first else 0.01)
+        return "first" if first else "hedge"
+
+    return fn, calls
+
+def hedging_caller(scheduler):
+    caller = ResilientCaller("section", deadline=5, hedge=True, hedge_min_delay=0.05, scheduler=scheduler)
+    for _ in range(20):
+        caller.latency.record(0.01)
+    return caller
+
+def test_hedge_takes_its_own_scheduler_slot():
+    scheduler = LLMScheduler(max_concurrent=2, requests_per_minute=0, tokens_per_minute=0)
+    caller = hedging_caller(scheduler)
+    fn, calls = slow_then_fast()
+    assert caller.call(fn, tokens=100) == "hedge"
+    assert len(calls) == 2
+    assert scheduler.stats()["admitted"] == 2
+
+def test_no_hedge_without_a_free_scheduler_slot():
+    scheduler = LLMScheduler(max_concurrent=1, requests_per_minute=0, tokens_per_minute=0)
+    caller = hedging_caller(scheduler)
+    fn, calls = slow_then_fast()
+    assert caller.call(fn, tokens=100) == "first"
+    assert len(calls) == 1
+    assert caller.stats()["hedges"] == 0
+
+def test_timed_out_call_is_tracked_until_it_returns():
+    caller = ResilientCaller("currency", deadline=0.1, max_retries=0)
+    release = threading.Event()
+    with pytest.raises(LLMTimeoutError):
+        caller.call(release.wait)
+    assert caller.stats()["abandoned"] == 1
+    assert resilience._abandoned_calls() == 1
+    release.set()
+    time.sleep(0.1)
+    assert resilience._abandoned_calls() == 0
+
+def test_reports_of_calls_are_collected():
+    from resilience import collect_reports, summarize_reports
+
+    caller = ResilientCaller("section", deadline=5, max_retries=2, base_delay=0.01)
+    failures = [ConnectionError("reset")]
+
+    def flaky():
+        if failures:
+            raise failures.pop()
+        return "ok"
+
+    with collect_reports() as reports:
+        assert caller.call(flaky) == "ok"
+        assert caller.call(lambda: "ok") == "ok"
+    caller.call(lambda: "ok")
+    summary = summarize_reports(reports)
+    assert summary["calls"] == 2
+    assert summary["retries"] == 1
+    assert summary["timeouts"] == 0
@@ -0,0 +1,67 @@
+# test_scheduler.py - Tests for admission order in the LLM scheduler
+import time
+import threading
+
+import planner
+from scheduler import LLMScheduler
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+def test_stale_currency_refresh_waits_behind_interactive_calls(monkeypatch):
+    scheduler = LLMScheduler(max_concurrent=1, requests_per_minute=0, tokens_per_minute=0)
+    order = []
+
+    def fetch(destination):
+        with scheduler.slot("currency"):
+            order.append("refresh")
+        return {"local_currency": "Test (TST)", "exchange_rate": "1 USD = 2 TST"}
+
+    def interactive():
+        with scheduler.slot("currency"):
+            order.append("interactive")
+
+    monkeypatch.setattr(planner, "fetch_currency_info", fetch)
+    key = planner.get_currency_cache_key("Nowhere Testland")
+    planner._currency_cache._entries[key] = ({"local_currency": "stale"}, 0.0)
+
+    # Every slot is taken, so both calls have to queue
+    scheduler.admit("planning")
+    assert planner.get_currency_info("Nowhere Testland") == {"local_currency": "stale"}
+    wait_for(lambda: scheduler.stats()["waiting"]["background"] == 1)
+    thread = threading.Thread(target=interactive)
+    thread.start()
+    wait_for(lambda: scheduler.stats()["waiting"]["interactive"] == 1)
+
+    scheduler.release(0.0)
+    thread.join(5)
+    wait_for(lambda: len(order) == 2)
+    assert order == ["interactive", "refresh"]
+
+def test_sessions_take_turns_and_interactive_calls_go_first():
+    scheduler = LLMScheduler(max_concurrent=1, requests_per_minute=0, tokens_per_minute=0)
+    order = []
+
+    def call(label, session, priority):
+        scheduler.admit("planning", session=session, priority=priority)
+        order.append(label)
+        scheduler.release(0.0)
+
+    scheduler.admit("planning")
+    threads = []
+    for label, session, priority in [("bg", "c", "background"), ("a1", "a", "interactive"),
+                                     ("a2", "a", "interactive"), ("a3", "a", "interactive"),
+                                     ("b1", "b", "interactive")]:
+        thread = threading.Thread(target=call, args=(label, session, priority))
+        thread.start()
+        threads.append(thread)
+        wait_for(lambda: sum(scheduler.stats()["waiting"].values()) == len(threads))
+
+    scheduler.release(0.0)
+    for thread in threads:
+        thread.join(5)
+    # Session a had queued three calls before b arrived, but b is served after a's first
+    assert order == ["a1", "b1", "a2", "a3", "bg"]
@@ -0,0 +1,42 @@
+# test_tokens.py - Tests for token metering of LLM clients
+from llm_clients import with_output_budget
+from tokens import MeteredLLM, UsageMeter
+
+class Message:
+    def __init__(self, content):
+        self.content = content
+        self.usage_metadata = None
+
+# Like the pinned langchain-google-genai client: a pydantic v1 model with .copy() only
+class CopyOnlyClient:
+    def __init__(self, max_output_tokens=2048):
+        self.max_output_tokens = max_output_tokens
+
+    def copy(self, update=None):
+        return CopyOnlyClient(**(update or {}))
+
+    def invoke(self, prompt, **kwargs):
+        return Message("ok")
+
+def test_output_budget_on_metered_copy_only_client():
+    meter = UsageMeter()
+    llm = with_output_budget(meter.wrap(CopyOnlyClient()), 256)
+    assert isinstance(llm, MeteredLLM)
+    assert llm.max_output_tokens == 256
+    llm.invoke("hello")
+    assert meter.summary()["calls"] == 1
+
+def test_ledger_compacts_to_route_totals(tmp_path):
+    from tokens import TokenLedger
+
+    path = tmp_path / "ledger.jsonl"
+    usage = {"prompt_tokens": 100, "completion_tokens": 50, "cost_usd": 0.01}
+    ledger = TokenLedger(str(path), max_bytes=1000)
+    for _ in range(20):
+        ledger.record("A -> B", usage)
+    ledger.record("C -> D", usage)
+    assert path.stat().st_size <= 1000
+    reloaded = {row["route"]: row for row in TokenLedger(str(path)).report()}
+    assert reloaded["A -> B"]["requests"] == 20
+    assert reloaded["A -> B"]["prompt_tokens"] == 2000
+    assert reloaded["C -> D"]["requests"] == 1
@@ -0,0 +1,42 @@
+# test_trip_store.py - Tests for the trip history backends
+import pytest
+
+from trip_store import MemoryTripStore, SQLiteTripStore
+
+def make_trip(destination, date):
+    return {
+        "source": "Testville", "destination": destination, "date": date,
+        "recommendation": "Go", "estimated_cost": "$100", "full_data": {"recommendation": "Go"}
+    }
+
+@pytest.fixture(params=["sqlite", "memory"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteTripStore(str(tmp_path / "trips.db"))
+    return MemoryTripStore()
+
+def test_pages_and_filters(store):
+    store.add_trips("alice", [make_trip("Paris" if i % 2 else "Rome", f"2030-01-{i + 1:02d}") for i in range(10)])
+    store.add_trip("bob", make_trip("Paris", "2030-01-01"))
+    assert [trip["id"] for trip in store.list_trips("alice", offset=2, limit=3)] == [3, 4, 5]
+    assert store.count_trips("alice") == 10
+    assert store.count_trips("alice", destination="Paris") == 5
+    assert store.count_trips("alice", date_from="2030-01-03", date_to="2030-01-05") == 3
+    paris = store.list_trips("alice", destination="Paris", date_from="2030-01-04", include_full_data=False)
+    assert [trip["date"] for trip in paris] == ["2030-01-04", "2030-01-06", "2030-01-08", "2030-01-10"]
+    assert store.list_destinations("alice") == ["Paris", "Rome"]
+
+def test_deleted_ids_are_not_reused(store):
+    first = store.add_trip("alice", make_trip("Paris", "2030-01-01"))
+    newest = store.add_trip("alice", make_trip("Rome", "2030-01-02"))
+    assert store.delete_trip("alice", newest)
+    assert store.add_trip("alice", make_trip("Oslo", "2030-01-03")) == newest + 1
+    store.add_trips("alice", [make_trip("Lima", "2030-01-04")])
+    assert [trip["id"] for trip in store.list_trips("alice")] == [first, newest + 1, newest + 2]
+
+def test_sqlite_ids_persist_across_reopening(tmp_path):
+    path = str(tmp_path / "trips.db")
+    store = SQLiteTripStore(path)
+    newest = store.add_trip("alice", make_trip("Paris", "2030-01-01"))
+    store.delete_trip("alice", newest)
+    assert SQLiteTripStore(path).add_trip("alice", make_trip("Rome", "2030-01-02")) == newest + 1
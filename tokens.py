@@ -0,0 +1,240 @@
+# tokens.py - Module for token accounting, prompt compaction and output budgets
+import os
+import sys
+import json
+import time
+import threading
+
+# USD per million tokens (gemini-1.5-pro list prices for prompts up to 128k tokens)
+TOKEN_PRICES = {
+    "input": float(os.getenv("TOKEN_PRICE_INPUT", 1.25)),
+    "output": float(os.getenv("TOKEN_PRICE_OUTPUT", 5.0))
+}
+
+# Output tokens reserved for each part of a plan; a JSON list of 2-4 options for one
+# transport mode is typically 150-300 tokens
+OUTPUT_BUDGETS = {
+    "transport": 384,
+    "destination_info": 640,
+    "accommodations": 256,
+    "recommendation": 256
+}
+MAX_OUTPUT_TOKENS = 2048
+
+DEFAULT_LEDGER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "token_usage.jsonl")
+DEFAULT_LEDGER_MAX_BYTES = 10 * 1024 * 1024
+
+# Rough local token count (about 4 characters per token for English text and JSON),
+# used when the response carries no usage metadata
+def estimate_tokens(text):
+    return (len(text) + 3) // 4 if text else 0
+
+# Drop indentation and blank lines; the model does not need them and they are billed as input
+def compact_prompt(text):
+    lines = (line.strip() for line in text.strip().splitlines())
+    return "\n".join(line for line in lines if line)
+
+# Prompts are compacted unless TRAVEL_PROMPT_VARIANT=full
+def prepare_prompt(text):
+    return text if os.getenv("TRAVEL_PROMPT_VARIANT", "compact").lower() == "full" else compact_prompt(text)
+
+# max_output_tokens for a single-prompt plan covering the given transport modes
+def plan_output_budget(modes):
+    budget = OUTPUT_BUDGETS["transport"] * len(modes) + OUTPUT_BUDGETS["destination_info"] + OUTPUT_BUDGETS["recommendation"]
+    return min(MAX_OUTPUT_TOKENS, budget)
+
+def estimate_cost(prompt_tokens, completion_tokens):
+    return (prompt_tokens * TOKEN_PRICES["input"] + completion_tokens * TOKEN_PRICES["output"]) / 1_000_000
+
+# (prompt_tokens, completion_tokens) reported by the model, or None if the message has no usage
+def usage_from_message(message):
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    metadata = (getattr(message, "response_metadata", None) or {}).get("usage_metadata") or {}
+    if metadata:
+        return metadata.get("prompt_token_count", 0), metadata.get("candidates_token_count", 0)
+    return None
+
+# Accumulates the token usage of every model call made for one plan
+class UsageMeter:
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.estimated = False
+        self._lock = threading.Lock()
+
+    def add(self, prompt_tokens, completion_tokens, estimated=False):
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.estimated = self.estimated or estimated
+
+    def record(self, prompt, message):
+        usage = usage_from_message(message)
+        if usage is None:
+            self.add(estimate_tokens(str(prompt)), estimate_tokens(message.content), estimated=True)
+        else:
+            self.add(*usage)
+
+    # Wrap an LLM client so every call made through it is metered
+    def wrap(self, llm):
+        return MeteredLLM(llm, self)
+
+    def summary(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "estimated": self.estimated,
+                "cost_usd": round(estimate_cost(self.prompt_tokens, self.completion_tokens), 6)
+            }
+
+# LLM client proxy that reports usage to a meter; everything else is passed through
+class MeteredLLM:
+    def __init__(self, llm, meter):
+        self._llm = llm
+        self._meter = meter
+
+    def invoke(self, prompt, **kwargs):
+        message = self._llm.invoke(prompt, **kwargs)
+        self._meter.record(prompt, message)
+        return message
+
+    async def ainvoke(self, prompt, **kwargs):
+        message = await self._llm.ainvoke(prompt, **kwargs)
+        self._meter.record(prompt, message)
+        return message
+
+    def stream(self, prompt, **kwargs):
+        prompt_tokens, completion_tokens, reported = 0, 0, False
+        text = []
+        for chunk in self._llm.stream(prompt, **kwargs):
+            text.append(chunk.content)
+            # Chunks carry per-chunk deltas, the same way LangChain adds message chunks together
+            usage = usage_from_message(chunk)
+            if usage is not None:
+                reported = True
+                prompt_tokens += usage[0]
+                completion_tokens += usage[1]
+            yield chunk
+        if reported:
+            self._meter.add(prompt_tokens, completion_tokens)
+        else:
+            self._meter.add(estimate_tokens(str(prompt)), estimate_tokens("".join(text)), estimated=True)
+
+    # Copies (e.g. with a different output limit) keep reporting to the same meter. The
+    # pinned langchain-google-genai client is a pydantic v1 model with only .copy(), so
+    # both names use whichever copy method the wrapped client has.
+    def model_copy(self, update=None):
+        return MeteredLLM(self._copy_llm(update), self._meter)
+
+    def copy(self, update=None):
+        return MeteredLLM(self._copy_llm(update), self._meter)
+
+    def _copy_llm(self, update):
+        copy = getattr(self._llm, "model_copy", None) or self._llm.copy
+        return copy(update=update)
+
+    def __getattr__(self, name):
+        return getattr(self._llm, name)
+
+# Aggregate token usage and cost per route. Every generated plan is appended to a JSONL
+# file, so reports cover previous runs as well. Past max_bytes the file is compacted to one
+# totals line per route.
+class TokenLedger:
+    def __init__(self, path=None, max_bytes=DEFAULT_LEDGER_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._routes = None
+        self._lock = threading.Lock()
+
+    # Totals lines written by _compact stand for `requests` plans each
+    def _add(self, routes, entry):
+        totals = routes.setdefault(entry["route"], {
+            "route": entry["route"], "requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0
+        })
+        totals["requests"] += entry.get("requests", 1)
+        totals["prompt_tokens"] += entry["prompt_tokens"]
+        totals["completion_tokens"] += entry["completion_tokens"]
+        totals["cost_usd"] += entry["cost_usd"]
+
+    def _load(self):
+        if self._routes is not None:
+            return self._routes
+        self._routes = {}
+        if self.path and os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self._add(self._routes, json.loads(line))
+                    except (ValueError, KeyError):
+                        continue
+        return self._routes
+
+    def record(self, route, usage, mode="single"):
+        entry = {"time": time.time(), "route": route, "mode": mode, **usage}
+        with self._lock:
+            self._add(self._load(), entry)
+            if self.path:
+                try:
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(entry) + "\n")
+                    if os.path.getsize(self.path) > self.max_bytes:
+                        self._compact()
+                except OSError:
+                    pass
+
+    # Replace the per-plan lines with one totals line per route, so the file (and the memory
+    # used to load it) grows with the number of routes rather than the number of plans
+    def _compact(self):
+        tmp_path = self.path + ".tmp"
+        now = time.time()
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for totals in self._routes.values():
+                f.write(json.dumps(dict(totals, time=now, mode="totals")) + "\n")
+        os.replace(tmp_path, self.path)
+
+    # One row per route, most expensive first
+    def report(self):
+        with self._lock:
+            rows = [dict(totals) for totals in self._load().values()]
+        for row in rows:
+            row["avg_tokens"] = round((row["prompt_tokens"] + row["completion_tokens"]) / row["requests"])
+            row["cost_usd"] = round(row["cost_usd"], 6)
+        return sorted(rows, key=lambda row: row["cost_usd"], reverse=True)
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+# Get the process-wide token ledger (TOKEN_LEDGER_PATH="" keeps it in memory only)
+def get_token_ledger():
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = TokenLedger(
+                os.getenv("TOKEN_LEDGER_PATH", DEFAULT_LEDGER_PATH) or None,
+                int(os.getenv("TOKEN_LEDGER_MAX_BYTES", DEFAULT_LEDGER_MAX_BYTES))
+            )
+        return _ledger
+
+# Print the per-route report: python tokens.py [token_usage.jsonl]
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    ledger = TokenLedger(argv[0]) if argv else get_token_ledger()
+    rows = ledger.report()
+    if not rows:
+        print("No token usage recorded yet.")
+        return
+    print(f"{'route':<50} {'plans':>6} {'prompt':>10} {'output':>10} {'avg':>7} {'cost $':>10}")
+    for row in rows:
+        print(f"{row['route'][:50]:<50} {row['requests']:>6} {row['prompt_tokens']:>10} "
+              f"{row['completion_tokens']:>10} {row['avg_tokens']:>7} {row['cost_usd']:>10.4f}")
+    print(f"{'total':<50} {sum(r['requests'] for r in rows):>6} {sum(r['prompt_tokens'] for r in rows):>10} "
+          f"{sum(r['completion_tokens'] for r in rows):>10} {'':>7} {sum(r['cost_usd'] for r in rows):>10.4f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+# tracing.py - Module for timing spans, latency summaries and trace export
+import os
+import io
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# Number of recent durations kept per span for the percentile summary
+DEFAULT_WINDOW = 1000
+PERCENTILES = (50, 95, 99)
+
+def _percentile(ordered, pct):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+# Records named spans with a rolling window of durations per name. Spans can also be
+# appended to a JSONL file (TRACE_EXPORT_PATH) for offline analysis.
+class Tracer:
+    def __init__(self, window=DEFAULT_WINDOW, export_path=None):
+        self.window = window
+        self.export_path = export_path
+        self._durations = {}
+        self._totals = {}
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    # Time a block: `with tracer.span("llm.plan", mode="single"): ...`
+    @contextmanager
+    def span(self, name, **attributes):
+        started = time.time()
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self.record(name, time.perf_counter() - start, started, error, attributes)
+
+    def record(self, name, duration, started=None, error=None, attributes=None):
+        entry = {"name": name, "start": started or time.time(), "duration": duration, "error": error}
+        if attributes:
+            entry["attributes"] = attributes
+        with self._lock:
+            durations = self._durations.get(name)
+            if durations is None:
+                durations = self._durations[name] = deque(maxlen=self.window)
+                self._totals[name] = {"count": 0, "sum": 0.0, "errors": 0}
+            durations.append(duration)
+            totals = self._totals[name]
+            totals["count"] += 1
+            totals["sum"] += duration
+            totals["errors"] += error is not None
+            self._recent.append(entry)
+            if self.export_path:
+                with open(self.export_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, default=str) + "\n")
+
+    # Rolling p50/p95/p99 (seconds) per span name, plus lifetime counts
+    def summary(self):
+        with self._lock:
+            snapshot = {name: (sorted(durations), dict(self._totals[name])) for name, durations in self._durations.items()}
+        summary = {}
+        for name, (ordered, totals) in sorted(snapshot.items()):
+            row = {"count": totals["count"], "errors": totals["errors"], "mean": totals["sum"] / totals["count"]}
+            for pct in PERCENTILES:
+                row[f"p{pct}"] = _percentile(ordered, pct)
+            row["max"] = ordered[-1]
+            summary[name] = row
+        return summary
+
+    # Most recent spans, newest last
+    def recent(self, limit=100):
+        with self._lock:
+            return list(self._recent)[-limit:]
+
+    # Recent spans as JSONL text
+    def export_jsonl(self, limit=None):
+        spans = self.recent(limit or self.window)
+        return "".join(json.dumps(entry, default=str) + "\n" for entry in spans)
+
+    # Prometheus text exposition format (a summary metric per span name)
+    def prometheus_text(self):
+        lines = [
+            "# HELP travel_span_seconds Duration of instrumented travel planner spans",
+            "# TYPE travel_span_seconds summary"
+        ]
+        with self._lock:
+            totals = {name: dict(values) for name, values in self._totals.items()}
+        for name, row in self.summary().items():
+            label = name.replace("\\", "\\\\").replace('"', '\\"')
+            for pct in PERCENTILES:
+                lines.append(f'travel_span_seconds{{span="{label}",quantile="{pct / 100}"}} {row[f"p{pct}"]:.6f}')
+            lines.append(f'travel_span_seconds_sum{{span="{label}"}} {totals[name]["sum"]:.6f}')
+            lines.append(f'travel_span_seconds_count{{span="{label}"}} {totals[name]["count"]}')
+            lines.append(f'travel_span_errors_total{{span="{label}"}} {totals[name]["errors"]}')
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        with self._lock:
+            self._durations.clear()
+            self._totals.clear()
+            self._recent.clear()
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+# Get the process-wide tracer
+def get_tracer():
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer(
+                window=int(os.getenv("TRACE_WINDOW", DEFAULT_WINDOW)),
+                export_path=os.getenv("TRACE_EXPORT_PATH") or None
+            )
+        return _tracer
+
+def span(name, **attributes):
+    return get_tracer().span(name, **attributes)
+
+# Yield from an iterable, recording only the time spent waiting on it (not the time the
+# consumer spends between items) as `name`, and the wait for the first item as `name.first`
+def timed_iter(name, iterable, **attributes):
+    tracer = get_tracer()
+    started = time.time()
+    waited = 0.0
+    first = True
+    error = None
+    iterator = iter(iterable)
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                waited += time.perf_counter() - start
+                return
+            waited += time.perf_counter() - start
+            if first:
+                tracer.record(name + ".first", waited, started, None, attributes)
+                first = False
+            yield item
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        tracer.record(name, waited, started, error, attributes)
+
+# Decorator form of span()
+def traced(name):
+    def decorator(fn):
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        wrapper.__name__ = fn.__name__
+        wrapper.__doc__ = fn.__doc__
+        return wrapper
+    return decorator
+
+_metrics_server = None
+
+# Serve prometheus_text() at http://<host>:<port>/metrics from a daemon thread
+def start_metrics_server(port, host="127.0.0.1"):
+    global _metrics_server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = get_tracer().prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    with _tracer_lock:
+        if _metrics_server is None:
+            _metrics_server = ThreadingHTTPServer((host, port), MetricsHandler)
+            threading.Thread(target=_metrics_server.serve_forever, daemon=True).start()
+        return _metrics_server
+
+# Run fn() under a profiler and return (result, report text). Uses pyinstrument when it is
+# installed and requested, otherwise cProfile (top functions by cumulative time).
+def profile_call(fn, backend="cprofile", limit=30):
+    if backend == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            backend = "cprofile"
+        else:
+            profiler = Profiler()
+            profiler.start()
+            try:
+                result = fn()
+            finally:
+                profiler.stop()
+            return result, profiler.output_text(unicode=True, color=False)
+
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        result = fn()
+    finally:
+        profiler.disable()
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(limit)
+    return result, output.getvalue()
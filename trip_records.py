@@ -0,0 +1,140 @@
+# trip_records.py - Module for compact trip records and compressed plan payloads
+import sys
+import json
+import zlib
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+
+# Number of decompressed plans kept for reuse across reruns and sessions
+DECOMPRESSED_CACHE_SIZE = 32
+
+SUMMARY_FIELDS = ("id", "source", "destination", "date", "recommendation", "estimated_cost")
+
+# A plan stored as a zlib-compressed JSON blob. Identical plans are interned, so every
+# session and trip record that holds the same plan shares one object.
+class CompressedPlan:
+    __slots__ = ("digest", "blob", "__weakref__")
+
+    def __init__(self, digest, blob):
+        self.digest = digest
+        self.blob = blob
+
+    # Decompress the plan; the returned dict is shared and must not be modified
+    def load(self):
+        return load_plan(self)
+
+_interned = weakref.WeakValueDictionary()
+_decompressed = OrderedDict()
+_lock = threading.Lock()
+
+# Wrap a compressed blob, reusing the interned object if one exists
+def plan_from_blob(blob):
+    digest = hashlib.sha1(blob).hexdigest()
+    with _lock:
+        plan = _interned.get(digest)
+        if plan is None:
+            plan = CompressedPlan(digest, blob)
+            _interned[digest] = plan
+        return plan
+
+# Compress a plan dict (already compressed plans are returned unchanged)
+def compress_plan(plan):
+    if isinstance(plan, CompressedPlan):
+        return plan
+    raw = json.dumps(plan, separators=(",", ":"), sort_keys=True).encode("utf-8")
+    return compress_plan_json(raw)
+
+# Compress a plan that is already serialized in compress_plan's canonical form
+def compress_plan_json(raw):
+    return plan_from_blob(zlib.compress(raw, 6))
+
+def load_plan(compressed):
+    with _lock:
+        plan = _decompressed.get(compressed.digest)
+        if plan is not None:
+            _decompressed.move_to_end(compressed.digest)
+            return plan
+    plan = json.loads(zlib.decompress(compressed.blob))
+    with _lock:
+        _decompressed[compressed.digest] = plan
+        while len(_decompressed) > DECOMPRESSED_CACHE_SIZE:
+            _decompressed.popitem(last=False)
+    return plan
+
+# Return the plan as a dict whether it is compressed or not
+def as_plan(plan):
+    return plan.load() if isinstance(plan, CompressedPlan) else plan
+
+# Compact saved trip: summary fields in slots and the full plan as a compressed payload.
+# Supports trip["field"] access so existing callers keep working.
+class TripRecord:
+    __slots__ = SUMMARY_FIELDS + ("payload",)
+
+    def __init__(self, id, source, destination, date, recommendation, estimated_cost, payload):
+        self.id = id
+        self.source = source
+        self.destination = destination
+        self.date = date
+        self.recommendation = recommendation
+        self.estimated_cost = estimated_cost
+        self.payload = compress_plan(payload)
+
+    # The full plan, decompressed on demand
+    @property
+    def full_data(self):
+        return self.payload.load()
+
+    def __getitem__(self, name):
+        if name not in SUMMARY_FIELDS and name != "full_data":
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def summary(self):
+        return {name: getattr(self, name) for name in SUMMARY_FIELDS}
+
+    def __repr__(self):
+        return f"TripRecord(id={self.id!r}, source={self.source!r}, destination={self.destination!r}, date={self.date!r})"
+
+# Approximate deep size of an object in bytes (shared objects are counted once)
+def deep_sizeof(obj, seen=None):
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, "__slots__"):
+        size += sum(deep_sizeof(getattr(obj, name), seen) for name in obj.__slots__
+                    if name != "__weakref__" and hasattr(obj, name))
+    return size
+
+# Compare the memory used by plain trip dicts with their compact records
+def memory_report(trips):
+    records = [
+        trip if isinstance(trip, TripRecord) else TripRecord(
+            trip["id"], trip["source"], trip["destination"], trip["date"],
+            trip["recommendation"], trip["estimated_cost"], trip["full_data"]
+        )
+        for trip in trips
+    ]
+    as_dicts = [dict(record.summary(), full_data=record.full_data) for record in records]
+    dict_bytes = deep_sizeof(as_dicts)
+    record_bytes = deep_sizeof(records)
+    return {
+        "trips": len(records),
+        "dict_bytes": dict_bytes,
+        "record_bytes": record_bytes,
+        "saved_bytes": dict_bytes - record_bytes,
+        "ratio": dict_bytes / record_bytes if record_bytes else 0.0
+    }
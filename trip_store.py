@@ -0,0 +1,272 @@
+# trip_store.py - Module for pluggable trip history storage backends
+import os
+import json
+import time
+import sqlite3
+import threading
+
+from trip_records import SUMMARY_FIELDS, TripRecord, compress_plan, plan_from_blob
+
+DEFAULT_TRIP_STORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "trip_history.db")
+
+SUMMARY_COLUMNS = list(SUMMARY_FIELDS)
+
+# SQLite trip store. Trips are keyed by (user_id, id) with secondary indexes on
+# destination and date, so lookups, deletes and filtered pages are index scans.
+# Plans are stored as compressed blobs and returned as TripRecords.
+class SQLiteTripStore:
+    def __init__(self, path=None):
+        self.path = path or os.getenv("TRIP_STORE_PATH", DEFAULT_TRIP_STORE_PATH)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS trips ("
+                " user_id TEXT NOT NULL, id INTEGER NOT NULL,"
+                " source TEXT, destination TEXT, date TEXT,"
+                " recommendation TEXT, estimated_cost TEXT,"
+                " full_data TEXT, created_at REAL NOT NULL,"
+                " PRIMARY KEY (user_id, id))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_trips_destination ON trips (user_id, destination)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_trips_date ON trips (user_id, date)")
+            # Highest id ever given to each user's trips, so ids of deleted trips are never reused
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS trip_ids (user_id TEXT PRIMARY KEY, last_id INTEGER NOT NULL)"
+            )
+
+    def _to_trip(self, row, include_full_data=True):
+        if not include_full_data:
+            return {name: row[name] for name in SUMMARY_COLUMNS}
+        full_data = row["full_data"]
+        # Rows written before plans were compressed hold plain JSON text
+        if isinstance(full_data, bytes):
+            payload = plan_from_blob(full_data)
+        else:
+            payload = compress_plan(json.loads(full_data))
+        return TripRecord(*(row[name] for name in SUMMARY_COLUMNS), payload)
+
+    # Build the WHERE clause shared by list_trips and count_trips
+    def _filters(self, user_id, destination=None, date_from=None, date_to=None):
+        clauses = ["user_id = ?"]
+        params = [user_id]
+        if destination:
+            clauses.append("destination = ?")
+            params.append(destination)
+        if date_from:
+            clauses.append("date >= ?")
+            params.append(date_from)
+        if date_to:
+            clauses.append("date <= ?")
+            params.append(date_to)
+        return " AND ".join(clauses), params
+
+    # Reserve `count` new trip ids for the user and return the first. Call in a transaction.
+    # Stores created before trip_ids existed start after the user's highest id.
+    def _reserve_ids(self, user_id, count):
+        row = self._conn.execute("SELECT last_id FROM trip_ids WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None:
+            # MAX over the primary key is a single index seek
+            row = self._conn.execute("SELECT MAX(id) FROM trips WHERE user_id = ?", (user_id,)).fetchone()
+        first_id = (row[0] or 0) + 1
+        self._conn.execute(
+            "INSERT INTO trip_ids (user_id, last_id) VALUES (?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET last_id = excluded.last_id",
+            (user_id, first_id + count - 1)
+        )
+        return first_id
+
+    # Save a trip summary and return its new id
+    def add_trip(self, user_id, trip):
+        with self._lock, self._conn:
+            new_id = self._reserve_ids(user_id, 1)
+            self._conn.execute(
+                "INSERT INTO trips (user_id, id, source, destination, date, recommendation, estimated_cost,"
+                " full_data, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (user_id, new_id, trip["source"], trip["destination"], trip["date"],
+                 trip["recommendation"], trip["estimated_cost"], compress_plan(trip["full_data"]).blob, time.time())
+            )
+        return new_id
+
+    # Save many trips in one transaction and return how many were added; ids continue
+    # after the highest id the user ever had. full_data may be a plan dict or a compressed plan.
+    def add_trips(self, user_id, trips):
+        trips = list(trips)
+        with self._lock, self._conn:
+            first_id = self._reserve_ids(user_id, len(trips))
+            now = time.time()
+            rows = [
+                (user_id, first_id + index, trip["source"], trip["destination"], trip["date"],
+                 trip["recommendation"], trip["estimated_cost"], compress_plan(trip["full_data"]).blob, now)
+                for index, trip in enumerate(trips)
+            ]
+            self._conn.executemany(
+                "INSERT INTO trips (user_id, id, source, destination, date, recommendation, estimated_cost,"
+                " full_data, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        return len(rows)
+
+    # Yield the user's trips in id order as lists of (summary, compressed plan), reading
+    # `chunk_size` rows at a time by id so memory stays flat however large the history is
+    def iter_trip_chunks(self, user_id, chunk_size=1000):
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT * FROM trips WHERE user_id = ? AND id > ? ORDER BY id LIMIT ?",
+                    (user_id, last_id, chunk_size)
+                ).fetchall()
+            if not rows:
+                return
+            chunk = []
+            for row in rows:
+                trip = self._to_trip(row)
+                chunk.append((trip.summary(), trip.payload))
+            yield chunk
+            last_id = rows[-1]["id"]
+
+    def get_trip(self, user_id, trip_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM trips WHERE user_id = ? AND id = ?", (user_id, trip_id)
+            ).fetchone()
+        return self._to_trip(row) if row else None
+
+    # Delete a trip; returns True if it existed
+    def delete_trip(self, user_id, trip_id):
+        with self._lock, self._conn:
+            cursor = self._conn.execute("DELETE FROM trips WHERE user_id = ? AND id = ?", (user_id, trip_id))
+        return cursor.rowcount > 0
+
+    # Return one page of trips in id order, optionally filtered by destination and date range
+    def list_trips(self, user_id, offset=0, limit=None, destination=None, date_from=None, date_to=None,
+                   include_full_data=True):
+        where, params = self._filters(user_id, destination, date_from, date_to)
+        columns = "*" if include_full_data else ", ".join(SUMMARY_COLUMNS)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {columns} FROM trips WHERE {where} ORDER BY id LIMIT ? OFFSET ?",
+                params + [-1 if limit is None else limit, offset]
+            ).fetchall()
+        return [self._to_trip(row, include_full_data) for row in rows]
+
+    def count_trips(self, user_id, destination=None, date_from=None, date_to=None):
+        where, params = self._filters(user_id, destination, date_from, date_to)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM trips WHERE {where}", params).fetchone()[0]
+
+    # Distinct destinations for a user, read straight from the destination index
+    def list_destinations(self, user_id):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT destination FROM trips WHERE user_id = ? ORDER BY destination", (user_id,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    # Most saved (source, destination, date) across all users, as (source, destination, date, trips)
+    def list_popular_routes(self, date_from=None, limit=50):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT source, destination, date, COUNT(*) AS trips FROM trips WHERE date >= ?"
+                " GROUP BY source, destination, date ORDER BY trips DESC LIMIT ?",
+                (date_from or "", limit)
+            ).fetchall()
+        return [tuple(row) for row in rows]
+
+# In-memory trip store (not persisted); useful for development and tests.
+# TripRecords are kept in per-user dicts, which preserve insertion (and therefore id) order,
+# and are handed out by reference.
+class MemoryTripStore:
+    def __init__(self):
+        self._trips = {}
+        self._next_ids = {}
+        self._lock = threading.Lock()
+
+    def add_trip(self, user_id, trip):
+        with self._lock:
+            new_id = self._next_ids.get(user_id, 0) + 1
+            self._next_ids[user_id] = new_id
+            self._trips.setdefault(user_id, {})[new_id] = TripRecord(
+                new_id, trip["source"], trip["destination"], trip["date"],
+                trip["recommendation"], trip["estimated_cost"], trip["full_data"]
+            )
+        return new_id
+
+    def add_trips(self, user_id, trips):
+        count = 0
+        for trip in trips:
+            self.add_trip(user_id, trip)
+            count += 1
+        return count
+
+    def iter_trip_chunks(self, user_id, chunk_size=1000):
+        trips = list(self._trips.get(user_id, {}).values())
+        for start in range(0, len(trips), chunk_size):
+            yield [(trip.summary(), trip.payload) for trip in trips[start:start + chunk_size]]
+
+    def get_trip(self, user_id, trip_id):
+        return self._trips.get(user_id, {}).get(trip_id)
+
+    def delete_trip(self, user_id, trip_id):
+        with self._lock:
+            return self._trips.get(user_id, {}).pop(trip_id, None) is not None
+
+    def _matching(self, user_id, destination=None, date_from=None, date_to=None):
+        for trip in list(self._trips.get(user_id, {}).values()):
+            if destination and trip["destination"] != destination:
+                continue
+            if date_from and trip["date"] < date_from:
+                continue
+            if date_to and trip["date"] > date_to:
+                continue
+            yield trip
+
+    def list_trips(self, user_id, offset=0, limit=None, destination=None, date_from=None, date_to=None,
+                   include_full_data=True):
+        trips = list(self._matching(user_id, destination, date_from, date_to))
+        trips = trips[offset:] if limit is None else trips[offset:offset + limit]
+        if include_full_data:
+            return trips
+        return [trip.summary() for trip in trips]
+
+    def count_trips(self, user_id, destination=None, date_from=None, date_to=None):
+        if not (destination or date_from or date_to):
+            return len(self._trips.get(user_id, {}))
+        return sum(1 for _ in self._matching(user_id, destination, date_from, date_to))
+
+    def list_destinations(self, user_id):
+        return sorted({trip["destination"] for trip in self._trips.get(user_id, {}).values()})
+
+    def list_popular_routes(self, date_from=None, limit=50):
+        counts = {}
+        with self._lock:
+            for trips in self._trips.values():
+                for trip in trips.values():
+                    if date_from and trip["date"] < date_from:
+                        continue
+                    route = (trip["source"], trip["destination"], trip["date"])
+                    counts[route] = counts.get(route, 0) + 1
+        ranked = sorted(counts.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [route + (count,) for route, count in ranked]
+
+TRIP_STORE_BACKENDS = {
+    "sqlite": SQLiteTripStore,
+    "memory": MemoryTripStore
+}
+
+_trip_store = None
+_trip_store_lock = threading.Lock()
+
+# Get the process-wide trip store, selected by the TRIP_STORE_BACKEND environment variable
+def get_trip_store():
+    global _trip_store
+    with _trip_store_lock:
+        if _trip_store is None:
+            backend = os.getenv("TRIP_STORE_BACKEND", "sqlite").lower()
+            if backend not in TRIP_STORE_BACKENDS:
+                raise ValueError(f"Unknown trip store backend: {backend}")
+            _trip_store = TRIP_STORE_BACKENDS[backend]()
+        return _trip_store
@@ -1,7 +1,57 @@
 # ui.py - Module for UI components and display functions
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
 import streamlit as st
-import pandas as pd
-import plotly.express as px
+
+from tracing import span, get_tracer
+from trip_records import CompressedPlan
+from exchange_rates import get_exchange_rates, plan_currency
+
+# pandas and plotly are imported inside the functions that use them so the
+# first page render does not wait for them
+
+# Number of plans whose DataFrames and figures are kept for reuse across reruns
+RENDER_CACHE_SIZE = 32
+
+# Streamed sections that carry costs to convert into the display currency
+PRICED_SECTIONS = {
+    ("travel_options", "flights"), ("travel_options", "trains"), ("travel_options", "buses"),
+    ("travel_options", "cabs"), ("travel_options",), ("destination_info", "accommodations"),
+    ("estimated_total_cost",)
+}
+
+_render_cache = OrderedDict()
+_render_cache_lock = threading.Lock()
+
+# Content hash of a plan; compressed plans already carry one
+def plan_content_hash(plan):
+    if isinstance(plan, CompressedPlan):
+        return plan.digest
+    raw = json.dumps(plan, separators=(",", ":"), sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha1(raw).hexdigest()
+
+# Return the artifact `name` derived from the plan with the given hash, building it once.
+# Artifacts are shared by all sessions and must not be modified; the least recently
+# shown plan is evicted first.
+def get_render_artifact(plan_hash, name, build):
+    if plan_hash is None:
+        return build()
+    with _render_cache_lock:
+        artifacts = _render_cache.get(plan_hash)
+        if artifacts is not None:
+            _render_cache.move_to_end(plan_hash)
+            if name in artifacts:
+                return artifacts[name]
+    artifact = build()
+    with _render_cache_lock:
+        _render_cache.setdefault(plan_hash, {})[name] = artifact
+        _render_cache.move_to_end(plan_hash)
+        while len(_render_cache) > RENDER_CACHE_SIZE:
+            _render_cache.popitem(last=False)
+    return artifact
 
 # Display app header
 def display_header():
@@ -14,44 +64,184 @@ def create_sidebar_navigation():
         st.header("Navigation")
         return st.radio("Choose a page:", ["Plan a Trip", "Trip History", "About"])
 
+# Sidebar admin panel with span latencies, trace export and the rerun profiler (TRACE_ADMIN=true)
+def display_trace_panel():
+    tracer = get_tracer()
+    with st.sidebar.expander("Performance"):
+        summary = tracer.summary()
+        if summary:
+            import pandas as pd
+            
+            df = pd.DataFrame.from_dict(summary, orient="index")
+            for column in ["mean", "p50", "p95", "p99", "max"]:
+                df[column] = (df[column] * 1000).round(1)
+            st.caption("Span latency (ms)")
+            st.dataframe(df, use_container_width=True)
+        else:
+            st.caption("No spans recorded yet.")
+        
+        # Admission control across sessions (see scheduler.py)
+        from scheduler import get_scheduler
+        scheduler = get_scheduler()
+        if scheduler is not None:
+            st.caption("LLM request queue")
+            st.json(scheduler.stats(), expanded=False)
+        
+        st.download_button("Download spans (JSONL)", tracer.export_jsonl(), file_name="spans.jsonl")
+        st.download_button("Download metrics (Prometheus)", tracer.prometheus_text(), file_name="metrics.prom")
+        
+        # Read by main.py at the start of each rerun
+        st.checkbox("Profile reruns", key="profile_rerun")
+        if "profile_report" in st.session_state:
+            st.caption("Profile of the last profiled rerun")
+            st.code(st.session_state.profile_report)
+
+def build_options_frame(options, option_type):
+    import pandas as pd
+    
+    with span("ui.options_frame", mode=option_type):
+        # The parsed price is for comparisons; the table shows the original cost text
+        return pd.DataFrame(options).drop(columns=["price"], errors="ignore")
+
 # Function to display travel options as a table
-def display_travel_options(options, option_type):
+def display_travel_options(options, option_type, plan_hash=None):
     if not options:
         st.write("No options available.")
         return
     
-    df = pd.DataFrame(options)
+    df = get_render_artifact(plan_hash, f"options:{option_type}", lambda: build_options_frame(options, option_type))
     st.dataframe(df, use_container_width=True)
 
+# One row per priced option: mode, name, min, max and currency (prices are parsed when the
+# plan is generated or saved; older plans are parsed here once)
+def build_price_frame(travel_options):
+    import pandas as pd
+    from pricing import option_price
+    
+    rows = []
+    for mode in ["flights", "trains", "buses", "cabs"]:
+        for option in travel_options.get(mode) or []:
+            price = option_price(option) if isinstance(option, dict) else None
+            if price:
+                rows.append((mode.capitalize(), option.get("name", "Option"), price["min"], price["max"], price["currency"]))
+    return pd.DataFrame(rows, columns=["Transportation", "Option", "min", "max", "currency"])
+
+# Build the comparison figure, the cheapest option per mode and the currencies seen,
+# or None when no option has a price
+def build_price_comparison(travel_options):
+    with span("ui.price_frame"):
+        df = build_price_frame(travel_options)
+    if df.empty:
+        return None
+    
+    import plotly.express as px
+    
+    with span("ui.price_figure"):
+        # Min/median/max per mode over every option, in one vectorized pass
+        df["mid"] = (df["min"] + df["max"]) / 2
+        by_mode = df.groupby("Transportation", sort=False)
+        summary = by_mode.agg(Lowest=("min", "min"), Median=("mid", "median"), Highest=("max", "max"), Options=("mid", "size"))
+        cheapest = df.loc[by_mode["min"].idxmin(), ["Transportation", "Option", "min", "max"]]
+        
+        summary["above"] = summary["Highest"] - summary["Median"]
+        summary["below"] = summary["Median"] - summary["Lowest"]
+        fig = px.bar(
+            summary.reset_index(), x="Transportation", y="Median", error_y="above", error_y_minus="below",
+            hover_data=["Lowest", "Highest", "Options"],
+            title="Price Range by Transportation Method (median, lowest to highest)"
+        )
+    cheapest = cheapest.rename(columns={"min": "From", "max": "Up to"}).set_index("Transportation")
+    return fig, cheapest, list(df["currency"].dropna().unique())
+
 # Function to create a price comparison chart
-def create_price_comparison(data):
-    # Extract lowest price from each category
-    price_data = []
-    
-    for category in ["flights", "trains", "buses", "cabs"]:
-        if category in data["travel_options"] and data["travel_options"][category]:
-            # Extract numeric price from the first option
-            first_option = data["travel_options"][category][0]
-            price_text = first_option.get("cost", "0")
-            
-            # Try to extract a numeric value from the price text
-            try:
-                # Handle price ranges by taking the lower value
-                if "-" in price_text:
-                    price_text = price_text.split("-")[0]
-                
-                # Remove currency symbols and commas
-                price_text = ''.join(c for c in price_text if c.isdigit() or c == '.')
-                price = float(price_text) if price_text else 0
-            except:
-                price = 0
-                
-            price_data.append({"Transportation": category.capitalize(), "Estimated Cost": price})
-    
-    if price_data:
-        df = pd.DataFrame(price_data)
-        fig = px.bar(df, x="Transportation", y="Estimated Cost", title="Price Comparison by Transportation Method")
-        st.plotly_chart(fig, use_container_width=True)
+def create_price_comparison(data, plan_hash=None):
+    comparison = get_render_artifact(plan_hash, "price_comparison", lambda: build_price_comparison(data["travel_options"]))
+    if comparison is None:
+        return
+    
+    fig, cheapest, currencies = comparison
+    st.plotly_chart(fig, use_container_width=True)
+    
+    if len(currencies) > 1:
+        st.caption("Options are priced in different currencies: " + ", ".join(currencies))
+    st.write("Cheapest option per mode:")
+    st.dataframe(cheapest, use_container_width=True)
+
+# Date x mode matrices of fare midpoints (for the colours) and cost texts (for the labels)
+def build_fare_matrix(scan):
+    import pandas as pd
+    from pricing import price_midpoint
+    
+    dates = [travel_date for travel_date in scan["dates"] if travel_date in scan["fares"]]
+    columns = [mode.capitalize() for mode in scan["modes"]]
+    cells = [[scan["fares"][travel_date][mode] for mode in scan["modes"]] for travel_date in dates]
+    values = pd.DataFrame(
+        [[price_midpoint(cell["price"]) if cell["price"] else None for cell in row] for row in cells],
+        index=dates, columns=columns, dtype=float
+    )
+    text = pd.DataFrame([[cell["cost"] or "n/a" for cell in row] for row in cells], index=dates, columns=columns)
+    return values, text
+
+# Build the fare heatmap, the cheapest date per mode and the currencies seen, or None
+# when no date has a price
+def build_fare_heatmap(scan):
+    with span("ui.fare_matrix"):
+        values, text = build_fare_matrix(scan)
+        priced = values.dropna(axis=1, how="all")
+    if priced.empty:
+        return None
+    
+    import plotly.express as px
+    
+    with span("ui.fare_figure"):
+        fig = px.imshow(
+            values, aspect="auto", color_continuous_scale="RdYlGn_r",
+            labels={"x": "Transportation", "y": "Travel date", "color": "Fare"},
+            title="Fares by Travel Date (midpoint of the price range)"
+        )
+        fig.update_traces(text=text.values, texttemplate="%{text}", hovertemplate="%{y} by %{x}: %{text}<extra></extra>")
+    cheapest = priced.agg(["idxmin", "min"]).T.rename(columns={"idxmin": "Cheapest date", "min": "Fare"})
+    currencies = sorted({
+        cell["price"]["currency"] for row in scan["fares"].values() for cell in row.values()
+        if cell["price"] and cell["price"]["currency"]
+    })
+    return fig, cheapest, currencies
+
+# Function to display the fare scan of a flexible-date search
+def display_fare_scan(scan):
+    if not scan:
+        st.write("Fares for other dates are not available.")
+        return
+    
+    heatmap = get_render_artifact(plan_content_hash(scan), "fare_heatmap", lambda: build_fare_heatmap(scan))
+    if heatmap is None:
+        st.write("No fares were found for these dates.")
+        return
+    
+    fig, cheapest, currencies = heatmap
+    st.plotly_chart(fig, use_container_width=True)
+    if len(currencies) > 1:
+        st.caption("Fares are priced in different currencies: " + ", ".join(currencies))
+    st.write("Cheapest date per mode:")
+    st.dataframe(cheapest, use_container_width=True)
+    if scan["errors"]:
+        st.caption("No fares for: " + ", ".join(sorted(scan["errors"])))
+
+# Currency picker for the results view; returns None to show prices as quoted
+def select_display_currency():
+    choice = st.selectbox(
+        "Show prices in", ["As quoted"] + get_exchange_rates().currencies(), key="display_currency"
+    )
+    return None if choice == "As quoted" else choice
+
+# Note for prices that name no currency and so could not be converted
+def display_unconverted_notice(count, currency):
+    if count:
+        st.caption(f"{count} price(s) did not name a currency and are shown as quoted, not in {currency}.")
+
+# Tab names of the results view; the fare scan tab is only shown for flexible-date searches
+def get_result_tab_names(with_fare_scan):
+    return ["Travel Options", "Destination Info", "Comparison"] + (["Fares by Date"] if with_fare_scan else []) + ["Packing List"]
 
 # Function to display packing suggestions based on destination and weather
 def display_packing_suggestions(destination, weather):
@@ -119,69 +309,227 @@ def display_currency_converter(currency_data):
         with col2:
             amount = st.number_input("Amount to convert (USD)", min_value=0.0, value=100.0, step=10.0)
             
-            # Extract conversion rate
-            rate_text = currency_data['exchange_rate'].split('=')[1].strip()
-            rate_value = float(''.join(c for c in rate_text if c.isdigit() or c == '.'))
+            # Rates from the offline table come parsed; model answers carry them as text
+            rate_value = currency_data.get("rate")
+            if rate_value is None:
+                rate_text = currency_data['exchange_rate'].split('=')[1].strip()
+                rate_value = float(''.join(c for c in rate_text if c.isdigit() or c == '.'))
+            code = currency_data.get("currency") or currency_data['local_currency'].split('(')[1].split(')')[0]
             
             converted = amount * rate_value
-            st.success(f"${amount:.2f} USD = {converted:.2f} {currency_data['local_currency'].split('(')[1].split(')')[0]}")
+            st.success(f"${amount:.2f} USD = {converted:,.2f} {code}")
+            if currency_data.get("updated"):
+                st.caption(f"Reference rate as of {currency_data['updated']}")
     else:
         st.warning("Currency information unavailable")
 
+# Section renderers shared by the full and the streaming result views
+def display_recommendation(recommendation):
+    st.info(recommendation)
+
+def display_weather(weather):
+    st.info(weather)
+
+def display_attractions(attractions):
+    for idx, attraction in enumerate(attractions, 1):
+        st.write(f"{idx}. {attraction}")
+
+def build_accommodations_frame(accommodations):
+    import pandas as pd
+    
+    return pd.DataFrame(accommodations).drop(columns=["price"], errors="ignore")
+
+def display_accommodations(accommodations, plan_hash=None):
+    if accommodations:
+        df = get_render_artifact(plan_hash, "accommodations", lambda: build_accommodations_frame(accommodations))
+        st.dataframe(df, use_container_width=True)
+
+def display_local_transport(local_transport):
+    for transport in local_transport:
+        st.write(f"• {transport}")
+
+def display_total_cost(estimated_total_cost):
+    st.info(f"**{estimated_total_cost}**")
+
 # Main function to display the travel results
-def display_travel_results(data, source, destination):
+# `data` may be a plan dict or a compressed plan. Frames and figures are cached by plan
+# content, so reruns triggered by other widgets skip the pandas and Plotly work.
+# `fare_scan` is the fare scan of a flexible-date search, shown next to the comparison.
+def display_travel_results(data, source, destination, fare_scan=None):
     if not data:
         return
     
+    plan_hash = plan_content_hash(data)
+    if isinstance(data, CompressedPlan):
+        data = data.load()
+    
+    # Every cost in the chosen currency; conversions are memoized per plan and currency
+    currency = select_display_currency()
+    if currency:
+        rates = get_exchange_rates()
+        with span("ui.convert_plan", currency=currency):
+            data = rates.convert_plan(data, currency, plan_hash)
+        plan_hash = f"{plan_hash}:{currency}:{rates.version}"
+        display_unconverted_notice(data.get("unconverted_prices", 0), currency)
+    
     # Create tabs for different sections
-    tabs = st.tabs(["Travel Options", "Destination Info", "Comparison", "Packing List"])
+    tab_names = get_result_tab_names(fare_scan is not None)
+    tabs = dict(zip(tab_names, st.tabs(tab_names)))
     
-    with tabs[0]:
+    with tabs["Travel Options"]:
         st.subheader("Recommended Option")
-        st.info(data["recommendation"])
+        display_recommendation(data["recommendation"])
         
         # Display each travel option in expandable sections
         for option_type in ["flights", "trains", "buses", "cabs"]:
             with st.expander(f"{option_type.capitalize()} Options", expanded=(option_type == "flights")):
                 if option_type in data["travel_options"] and data["travel_options"][option_type]:
-                    display_travel_options(data["travel_options"][option_type], option_type)
+                    display_travel_options(data["travel_options"][option_type], option_type, plan_hash)
                 else:
                     st.write("No options available.")
     
-    with tabs[1]:
+    with tabs["Destination Info"]:
         # Display destination information
         dest_info = data["destination_info"]
         
         # Weather information
         st.subheader("Weather Forecast")
-        st.info(dest_info["weather"])
+        display_weather(dest_info["weather"])
         
         # Attractions
         st.subheader("Top Attractions")
-        for idx, attraction in enumerate(dest_info["attractions"], 1):
-            st.write(f"{idx}. {attraction}")
+        display_attractions(dest_info["attractions"])
         
         # Accommodations
         st.subheader("Accommodation Options")
-        if dest_info["accommodations"]:
-            st.dataframe(pd.DataFrame(dest_info["accommodations"]), use_container_width=True)
+        display_accommodations(dest_info["accommodations"], plan_hash)
         
         # Local transport
         st.subheader("Local Transportation")
-        for transport in dest_info["local_transport"]:
-            st.write(f"• {transport}")
+        display_local_transport(dest_info["local_transport"])
         
         # The currency converter will be added in the page module
     
-    with tabs[2]:
+    with tabs["Comparison"]:
         # Price comparison chart
         st.subheader("Price Comparison")
-        create_price_comparison(data)
+        create_price_comparison(data, plan_hash)
         
         # Total cost estimate
         st.subheader("Estimated Total Trip Cost")
-        st.info(f"**{data['estimated_total_cost']}**")
+        display_total_cost(data["estimated_total_cost"])
     
-    with tabs[3]:
+    if fare_scan is not None:
+        with tabs["Fares by Date"]:
+            st.subheader("Fares by Travel Date")
+            display_fare_scan(fare_scan)
+    
+    with tabs["Packing List"]:
         # Packing suggestions
         display_packing_suggestions(destination, data["destination_info"]["weather"])
+
+# Display travel results as they stream in.
+# `sections` yields (path, value) pairs from llm_service.stream_travel_recommendations;
+# each tab is filled in as soon as its section completes. Returns the full plan, or None if it failed.
+# `load_fare_scan` returns the fare scan of a flexible-date search; it is called once the plan is done.
+def display_travel_results_streaming(sections, source, destination, load_fare_scan=None):
+    # Costs are converted section by section into the chosen currency, as in display_travel_results
+    currency = select_display_currency()
+    rates = get_exchange_rates() if currency else None
+    notice = st.empty()
+    
+    tab_names = get_result_tab_names(load_fare_scan is not None)
+    tabs = dict(zip(tab_names, st.tabs(tab_names)))
+    placeholders = {}
+    
+    with tabs["Travel Options"]:
+        st.subheader("Recommended Option")
+        placeholders[("recommendation",)] = st.empty()
+        for option_type in ["flights", "trains", "buses", "cabs"]:
+            with st.expander(f"{option_type.capitalize()} Options", expanded=(option_type == "flights")):
+                placeholders[("travel_options", option_type)] = st.empty()
+    
+    with tabs["Destination Info"]:
+        st.subheader("Weather Forecast")
+        placeholders[("destination_info", "weather")] = st.empty()
+        st.subheader("Top Attractions")
+        placeholders[("destination_info", "attractions")] = st.empty()
+        st.subheader("Accommodation Options")
+        placeholders[("destination_info", "accommodations")] = st.empty()
+        st.subheader("Local Transportation")
+        placeholders[("destination_info", "local_transport")] = st.empty()
+    
+    with tabs["Comparison"]:
+        st.subheader("Price Comparison")
+        placeholders[("travel_options",)] = st.empty()
+        st.subheader("Estimated Total Trip Cost")
+        placeholders[("estimated_total_cost",)] = st.empty()
+    
+    if load_fare_scan is not None:
+        with tabs["Fares by Date"]:
+            st.subheader("Fares by Travel Date")
+            placeholders[("fare_scan",)] = st.empty()
+    
+    with tabs["Packing List"]:
+        placeholders[("packing",)] = st.empty()
+    
+    for placeholder in placeholders.values():
+        placeholder.caption("Loading...")
+    
+    renderers = {
+        ("recommendation",): display_recommendation,
+        ("travel_options", "flights"): lambda options: display_travel_options(options, "flights"),
+        ("travel_options", "trains"): lambda options: display_travel_options(options, "trains"),
+        ("travel_options", "buses"): lambda options: display_travel_options(options, "buses"),
+        ("travel_options", "cabs"): lambda options: display_travel_options(options, "cabs"),
+        ("travel_options",): lambda travel_options: create_price_comparison({"travel_options": travel_options}),
+        ("destination_info", "weather"): display_weather,
+        ("destination_info", "attractions"): display_attractions,
+        ("destination_info", "accommodations"): display_accommodations,
+        ("destination_info", "local_transport"): display_local_transport,
+        ("estimated_total_cost",): display_total_cost
+    }
+    
+    data = None
+    rendered = set()
+    # Sections seen so far, so unmarked prices can be read in the currency the plan uses
+    quoted = {}
+    unconverted = {}
+    for path, value in sections:
+        if path == ():
+            data = value
+            continue
+        if rates is not None and path in PRICED_SECTIONS:
+            if len(path) > 1:
+                quoted.setdefault(path[0], {})[path[1]] = value
+            else:
+                quoted[path[0]] = value
+            with span("ui.convert_section", currency=currency):
+                value, unconverted[path] = rates.convert_section(path, value, currency, plan_currency(quoted))
+        if path in renderers:
+            with placeholders[path].container():
+                renderers[path](value)
+            rendered.add(path)
+        # Packing suggestions only depend on the weather
+        if path == ("destination_info", "weather"):
+            with placeholders[("packing",)].container():
+                display_packing_suggestions(destination, value)
+            rendered.add(("packing",))
+    
+    # The fare scan runs alongside the plan, so it is usually ready by now
+    if load_fare_scan is not None:
+        fare_scan = load_fare_scan()
+        with placeholders[("fare_scan",)].container():
+            display_fare_scan(fare_scan)
+        rendered.add(("fare_scan",))
+    
+    # The whole travel_options section repeats the per-mode sections, so it is not counted twice
+    with notice.container():
+        display_unconverted_notice(sum(n for path, n in unconverted.items() if path != ("travel_options",)), currency)
+    
+    # Clear the loading markers of any sections that never arrived
+    for path, placeholder in placeholders.items():
+        if path not in rendered:
+            placeholder.empty()
+    
+    return data